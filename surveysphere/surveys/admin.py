@@ -1,7 +1,24 @@
 # admin.py
 from django.contrib import admin
+from django.contrib.admin.views.main import IGNORED_PARAMS, PAGE_VAR
+from django.db.models import Count, Max, Min, QuerySet
 from django.utils.html import format_html
-from .models import Survey, Question, Option, Response, Answer
+from .deletion import batch_size, delete_responses, delete_survey
+from .jobs import enqueue
+from .models import Survey, Question, Option, Response, Answer, DisplayRule, Job
+from .versions import publish
+
+
+def perms_needed(model_admin, request, models):
+    """
+    Verbose names of those ``models`` registered in the admin that the user
+    may not delete, as the default confirmation page would list them
+    """
+    site = model_admin.admin_site
+    return {
+        model._meta.verbose_name for model in models
+        if site.is_registered(model) and not site.get_model_admin(model).has_delete_permission(request)
+    }
 
 
 class OptionInline(admin.TabularInline):
@@ -10,6 +27,14 @@ class OptionInline(admin.TabularInline):
     fields = ['text', 'order']
 
 
+class DisplayRuleInline(admin.TabularInline):
+    model = DisplayRule
+    fk_name = 'question'
+    extra = 0
+    fields = ['source', 'operator', 'option', 'value']
+    autocomplete_fields = ['source', 'option']
+
+
 class QuestionInline(admin.StackedInline):
     model = Question
     extra = 1
@@ -19,28 +44,64 @@ class QuestionInline(admin.StackedInline):
 
 @admin.register(Survey)
 class SurveyAdmin(admin.ModelAdmin):
-    list_display = ['title', 'created_by', 'is_active', 'question_count', 'response_count', 'created_at']
+    list_display = ['title', 'created_by', 'is_active', 'question_count', 'response_total', 'created_at']
     list_filter = ['is_active', 'created_at', 'created_by']
+    list_select_related = ['created_by']
     search_fields = ['title', 'description']
-    readonly_fields = ['created_at', 'updated_at', 'response_count']
+    readonly_fields = ['created_at', 'updated_at', 'published_version', 'response_count']
     inlines = [QuestionInline]
+    actions = ['publish_surveys']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counts()
     
     def question_count(self, obj):
-        return obj.questions.count()
+        return obj.question_total
     question_count.short_description = 'Questions'
+    question_count.admin_order_field = 'question_total'
+
+    def response_total(self, obj):
+        return obj.response_total
+    response_total.short_description = 'Responses'
+    response_total.admin_order_field = 'response_total'
     
     def save_model(self, request, obj, form, change):
         if not change:  # If creating new survey
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
+    @admin.action(description="Publish the current questions")
+    def publish_surveys(self, request, queryset):
+        for survey in queryset:
+            publish(survey, request.user)
+        self.message_user(request, "Respondents now get the current questions.")
+
+    def get_deleted_objects(self, objs, request):
+        # The default confirmation page loads every dependent row; summarise instead.
+        surveys = Survey.all_objects.filter(pk__in=[survey.pk for survey in objs]).with_counts()
+        deleted = [f"{survey} and its {survey.response_total} responses" for survey in surveys]
+        responses = sum(survey.response_total for survey in surveys)
+        # Purging removes the surveys' questions and options too.
+        related = [Question, Option, Response, Answer] if responses else [Question, Option]
+        return deleted, {'surveys': len(deleted), 'responses': responses}, perms_needed(self, request, related), []
+
+    def delete_model(self, request, obj):
+        delete_survey(obj, request.user)
+        self.message_user(request, "Its responses are being removed in the background.")
+
+    def delete_queryset(self, request, queryset):
+        for survey in queryset:
+            delete_survey(survey, request.user)
+        self.message_user(request, "Their responses are being removed in the background.")
+
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
     list_display = ['text_preview', 'survey', 'question_type', 'is_required', 'order']
     list_filter = ['question_type', 'is_required', 'survey']
+    list_select_related = ['survey']
     search_fields = ['text', 'survey__title']
-    inlines = [OptionInline]
+    inlines = [OptionInline, DisplayRuleInline]
     
     def text_preview(self, obj):
         return obj.text[:50] + "..." if len(obj.text) > 50 else obj.text
@@ -51,6 +112,7 @@ class QuestionAdmin(admin.ModelAdmin):
 class OptionAdmin(admin.ModelAdmin):
     list_display = ['text', 'question_preview', 'order']
     list_filter = ['question__survey', 'question__question_type']
+    list_select_related = ['question']
     search_fields = ['text', 'question__text']
     
     def question_preview(self, obj):
@@ -72,18 +134,61 @@ class AnswerInline(admin.TabularInline):
 class ResponseAdmin(admin.ModelAdmin):
     list_display = ['survey', 'submitted_at', 'is_complete', 'answer_count']
     list_filter = ['is_complete', 'submitted_at', 'survey']
-    readonly_fields = ['submitted_at', 'ip_address', 'user_agent']
+    list_select_related = ['survey']
+    readonly_fields = ['submitted_at', 'started_at', 'version', 'ip_address', 'user_agent']
     inlines = [AnswerInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(answer_total=Count('answers'))
     
     def answer_count(self, obj):
-        return obj.answers.count()
+        return obj.answer_total
     answer_count.short_description = 'Answers'
+    answer_count.admin_order_field = 'answer_total'
+
+    def get_deleted_objects(self, objs, request):
+        count = objs.count() if isinstance(objs, QuerySet) else len(objs)
+        return [f"{count} responses and their answers"], {'responses': count}, perms_needed(self, request, [Answer]), []
+
+    def delete_model(self, request, obj):
+        delete_responses(Response.objects.filter(pk=obj.pk))
+
+    def _changelist_filters(self, request):
+        """The changelist's filter lookups, or None if one is not a plain allowed lookup"""
+        filters = {}
+        for key, values in request.GET.lists():
+            if key in IGNORED_PARAMS or key == PAGE_VAR:
+                continue
+            if not self.lookup_allowed(key, values[-1], request):
+                return None
+            filters[key] = values[-1]
+        return filters
+
+    def delete_queryset(self, request, queryset):
+        bounds = queryset.order_by().aggregate(first=Min('id'), last=Max('id'), total=Count('id', distinct=True))
+        if bounds['total'] > batch_size():
+            # Many rows means "select all" on a filtered changelist: queue
+            # the filter and id range, not the ids, and let the job page
+            # through them.
+            filters = self._changelist_filters(request)
+            if filters is not None:
+                id_range = [bounds['first'], bounds['last']]
+                matching = Response.objects.filter(id__range=id_range, **filters)
+                if matching.count() == bounds['total']:
+                    enqueue('delete_responses', created_by=request.user, filters=filters, id_range=id_range)
+                    self.message_user(request, "The responses are being removed in the background.")
+                    return
+        delete_responses(queryset.order_by())
 
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['question_preview', 'response', 'answer_preview']
     list_filter = ['question__question_type', 'response__survey']
+    list_select_related = ['question', 'response__survey']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('selected_options')
     
     def question_preview(self, obj):
         return obj.question.text[:40] + "..." if len(obj.question.text) > 40 else obj.question.text
@@ -92,4 +197,19 @@ class AnswerAdmin(admin.ModelAdmin):
     def answer_preview(self, obj):
         answer = obj.get_display_answer()
         return answer[:50] + "..." if len(answer) > 50 else answer
-    answer_preview.short_description = 'Answer'
\ No newline at end of file
+    answer_preview.short_description = 'Answer'
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'progress_display', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    list_select_related = ['created_by']
+    readonly_fields = ['kind', 'params', 'status', 'progress', 'total', 'result', 'error', 'attempts',
+                       'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at']
+
+    def progress_display(self, obj):
+        return f"{obj.progress} / {obj.total}" if obj.total is not None else obj.progress
+    progress_display.short_description = 'Progress'
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,226 @@
+"""
+Version 1 of the JSON API: surveys, their question schema, response
+submission and listing, aggregated results, and background jobs.
+
+Every endpoint uses a fixed number of queries regardless of page size;
+nested data is prefetched and counts are annotated.
+"""
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response as APIResponse
+from rest_framework.views import APIView
+
+from .forms import SegmentForm
+from .ingest import client_ip, get_schema, ingest, write_responses
+from .jobs import enqueue
+from .models import Survey, Answer, Job, Question
+from .results import compute_results
+from .versions import get_version
+from .serializers import (
+    SurveySerializer,
+    SurveyDetailSerializer,
+    ResponseSerializer,
+    ResponseSubmissionSerializer,
+)
+
+MAX_BATCH_SIZE = 500
+MAX_INGEST_SIZE = 5000
+
+
+class SurveyCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ResponseCursorPagination(CursorPagination):
+    # Keyset pagination on the primary key: each page is an index range scan
+    # no matter how deep the client pages.
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+def published_surveys():
+    """Active surveys respondents can answer; questions come from the published version"""
+    return Survey.objects.filter(is_active=True, published_version__isnull=False).with_counts()
+
+
+class SurveyListView(generics.ListAPIView):
+    serializer_class = SurveySerializer
+    pagination_class = SurveyCursorPagination
+
+    def get_queryset(self):
+        return published_surveys()
+
+
+class SurveyDetailView(generics.RetrieveAPIView):
+    serializer_class = SurveyDetailSerializer
+    lookup_url_kwarg = 'survey_id'
+
+    def get_queryset(self):
+        return published_surveys().select_related('published_version')
+
+
+class SurveyResultsView(APIView):
+    """
+    Aggregated results of a survey the caller owns: of the published
+    version, or of ``version``, optionally for a segment: ``since`` /
+    ``until`` (dates), ``client`` (device class) and ``option`` (an option id).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, survey_id):
+        survey = get_object_or_404(Survey.objects.select_related('published_version'), id=survey_id)
+        if survey.created_by_id != request.user.pk:
+            raise PermissionDenied("Only the survey owner can read its results.")
+        number = request.query_params.get('version', '')
+        version = get_version(survey, int(number) if number.isdecimal() else None)
+        if version is None and number:
+            return APIResponse({'detail': "No such version."}, status=status.HTTP_404_NOT_FOUND)
+        segment_form = SegmentForm(survey, request.query_params or None, version=version)
+        if segment_form.is_bound and not segment_form.is_valid():
+            return APIResponse(segment_form.errors, status=status.HTTP_400_BAD_REQUEST)
+        segment = segment_form.segment()
+        responses = segment.responses(survey) if segment else survey.responses.all()
+        if version is not None:
+            responses = responses.filter(version=version)
+        return APIResponse({
+            'survey': survey.id,
+            'version': version.number if version else None,
+            'responses': responses.count(),
+            'questions': compute_results(survey, include_answers=False, version=version,
+                                         responses=responses if segment else None),
+        })
+
+
+class SurveyResponsesView(generics.ListAPIView):
+    """
+    GET lists responses to a survey the caller owns.
+    POST submits one response object, or a list of them in a single request.
+    """
+    serializer_class = ResponseSerializer
+    pagination_class = ResponseCursorPagination
+
+    def get_permissions(self):
+        if self.request.method == 'GET':
+            return [permissions.IsAuthenticated()]
+        return [permissions.AllowAny()]
+
+    def get_queryset(self):
+        survey = get_object_or_404(Survey, id=self.kwargs['survey_id'])
+        if survey.created_by_id != self.request.user.pk:
+            raise PermissionDenied("Only the survey owner can list its responses.")
+        answers = Answer.objects.prefetch_related('selected_options').only(
+            'id', 'response_id', 'question_id', 'text_answer', 'numeric_answer'
+        )
+        return survey.responses.prefetch_related(
+            Prefetch('answers', queryset=answers),
+            Prefetch('skipped', queryset=Question.objects.only('id')),
+        )
+
+    def post(self, request, survey_id):
+        survey = get_object_or_404(Survey, id=survey_id, is_active=True, published_version__isnull=False)
+        schema = get_schema(survey)
+
+        many = isinstance(request.data, list)
+        items = request.data if many else [request.data]
+        if len(items) > MAX_BATCH_SIZE:
+            return APIResponse(
+                {'detail': f"At most {MAX_BATCH_SIZE} responses per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        submissions = ResponseSubmissionSerializer(data=items, many=True)
+        submissions.is_valid(raise_exception=True)
+
+        # All or nothing: any invalid item rejects the whole request.
+        cleaned_items, errors = [], []
+        for index, item in enumerate(submissions.validated_data):
+            cleaned, item_errors = schema.clean(item['answers'])
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+            cleaned_items.append(cleaned)
+        if errors:
+            return APIResponse({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        created = write_responses(
+            schema,
+            cleaned_items,
+            ip_address=client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        ids = [response.id for response in created]
+        return APIResponse(
+            {'ids': ids} if many else {'id': ids[0]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class SurveyBatchIngestView(APIView):
+    """
+    Bulk upload for offline collectors: accepts ``{"responses": [...]}`` (or a
+    bare list) of up to ``MAX_INGEST_SIZE`` items, stores every valid one and
+    reports a result per item, so one bad tablet entry does not block the rest.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, survey_id):
+        survey = get_object_or_404(Survey, id=survey_id, is_active=True, published_version__isnull=False)
+
+        items = request.data.get('responses') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return APIResponse(
+                {'detail': "Expected a list of responses."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > MAX_INGEST_SIZE:
+            return APIResponse(
+                {'detail': f"At most {MAX_INGEST_SIZE} responses per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = ingest(
+            get_schema(survey),
+            items,
+            ip_address=client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        created = sum(1 for result in results if result['status'] == 'created')
+        return APIResponse(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_200_OK,
+        )
+
+
+class SurveyExportView(APIView):
+    """
+    POST queues an export of a survey the caller owns, of its draft or of
+    published ``version``; poll the job for the document.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, survey_id):
+        survey = get_object_or_404(Survey, id=survey_id, created_by=request.user)
+        version = request.data.get('version') if isinstance(request.data, dict) else None
+        if version is not None and (isinstance(version, bool) or not isinstance(version, int)
+                                    or not survey.versions.filter(number=version).exists()):
+            return APIResponse({'detail': "No such version."}, status=status.HTTP_400_BAD_REQUEST)
+        job = enqueue('export_survey', created_by=request.user, survey_id=survey.id, version=version)
+        location = reverse('api-v1:job_detail', args=[job.pk])
+        return APIResponse(job.as_dict(), status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
+class JobDetailView(APIView):
+    """Status, progress and (once done) result of a job the caller started."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(created_by=request.user)
+        return APIResponse(get_object_or_404(jobs, id=job_id).as_dict())
@@ -0,0 +1,40 @@
+from importlib import import_module
+
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+app_name = 'api-v1'
+
+
+def lazy_view(name):
+    """
+    Resolve ``surveys.api.<name>`` on first use.
+
+    The API pulls in Django REST framework, the heaviest import in the
+    project; deferring it keeps it off the startup path of workers that
+    only serve HTML pages.
+    """
+    view = None
+
+    @csrf_exempt  # DRF views enforce CSRF themselves for session auth
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = getattr(import_module('surveys.api'), name).as_view()
+        return view(request, *args, **kwargs)
+
+    # Named after the view it stands for, as resolve() and the debug page show it.
+    wrapper.__name__ = wrapper.__qualname__ = name
+    wrapper.__module__ = 'surveys.api'
+    return wrapper
+
+
+urlpatterns = [
+    path("surveys/", lazy_view('SurveyListView'), name="survey_list"),
+    path("surveys/<int:survey_id>/", lazy_view('SurveyDetailView'), name="survey_detail"),
+    path("surveys/<int:survey_id>/results/", lazy_view('SurveyResultsView'), name="survey_results"),
+    path("surveys/<int:survey_id>/responses/", lazy_view('SurveyResponsesView'), name="survey_responses"),
+    path("surveys/<int:survey_id>/responses/batch/", lazy_view('SurveyBatchIngestView'), name="survey_batch_ingest"),
+    path("surveys/<int:survey_id>/export/", lazy_view('SurveyExportView'), name="survey_export"),
+    path("jobs/<int:job_id>/", lazy_view('JobDetailView'), name="job_detail"),
+]
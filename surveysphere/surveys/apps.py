@@ -1,6 +1,38 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEMPLATES = [
+    'surveys/survey_list.html',
+    'surveys/survey_details.html',
+    'surveys/survey_results.html',
+    'surveys/survey_success.html',
+    'surveys/dashboard.html',
+]
 
 
 class SurveysConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'surveys'
+
+    def ready(self):
+        logger.debug("ALLOWED_HOSTS = %s", settings.ALLOWED_HOSTS)
+        if getattr(settings, 'SURVEYS_WARMUP', False):
+            self.warm_up()
+
+    def warm_up(self):
+        """
+        Do the work the first request would otherwise pay for: import every
+        view through the URLconf and compile the busiest templates into the
+        cached template loader. With ``gunicorn --preload`` this runs once in
+        the master and is shared by every forked worker.
+        """
+        from django.template.loader import get_template
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+        for name in WARMUP_TEMPLATES:
+            get_template(name)
@@ -0,0 +1,76 @@
+"""
+Skip/branching logic compiled from a survey's DisplayRules.
+
+Publishing a survey stores its rules as plain tuples in the version
+document; ``versions.version_rules`` turns them into a ``RuleSet`` once per
+version (it is stored on the cached SurveySchema), which decides which
+questions a respondent actually sees. Rules may only depend on
+earlier questions, so a single pass in question order is enough. The same
+compiled rules are handed to the browser as JSON so the form hides
+unreachable questions client-side.
+"""
+from decimal import Decimal, InvalidOperation
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == []
+
+
+def _matches(value, expected):
+    if isinstance(value, (list, tuple)):
+        return expected in [str(v) for v in value]
+    if isinstance(value, Decimal):
+        try:
+            return value == Decimal(expected)
+        except InvalidOperation:
+            return False
+    return str(value).strip().casefold() == expected.strip().casefold()
+
+
+class RuleSet:
+    def __init__(self, order, rules):
+        self.order = order  # question ids in display order
+        self.rules = rules  # question id -> [(source id, operator, expected)]
+
+    @property
+    def conditional(self):
+        """Ids of questions that are not always shown"""
+        return self.rules.keys()
+
+    def is_shown(self, question_id, answers):
+        """
+        Whether ``question_id`` is shown given ``answers`` (question id to
+        cleaned value) for the questions before it. Questions that were not
+        shown must be absent from ``answers``.
+        """
+        for source_id, operator, expected in self.rules.get(question_id, ()):
+            value = answers.get(source_id)
+            if operator == 'answered':
+                passed = not _is_empty(value)
+            elif _is_empty(value):
+                passed = operator == 'not_equals'
+            else:
+                passed = _matches(value, expected) == (operator == 'equals')
+            if not passed:
+                return False
+        return True
+
+    def reachable(self, answers):
+        """The set of question ids shown for a complete set of ``answers``"""
+        shown, seen = set(), {}
+        for question_id in self.order:
+            if self.is_shown(question_id, seen):
+                shown.add(question_id)
+                if question_id in answers:
+                    seen[question_id] = answers[question_id]
+        return shown
+
+    def as_json(self):
+        return {
+            'order': self.order,
+            'rules': {
+                str(question_id): [list(rule) for rule in rules]
+                for question_id, rules in self.rules.items()
+            },
+        }
+
@@ -0,0 +1,167 @@
+"""
+Conditional GET support for the read-only survey pages.
+
+Each page derives a small "state" from a few index lookups (survey
+``updated_at`` and published version, plus the latest response and timing
+event where the page shows them, and when responses were last deleted) so
+that unchanged pages can be answered with ``304 Not Modified`` before the
+view runs any of its heavier queries. Nothing is counted: a count reads
+every row it counts. Published versions are immutable,
+so edits to a survey's draft questions leave its pages' validators alone.
+The results of a survey never published show its draft, which has no such
+cheap state, so they are not validated at all.
+
+Only the survey list may be stored by shared caches. The survey form
+carries a CSRF token and sets the CSRF cookie, and the results pages are
+the owner's, so those are ``private``.
+"""
+from functools import lru_cache, wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Survey, SurveyVersion, Response, TimingEvent
+
+
+def _cached_state(request, key, compute):
+    # etag_func and last_modified_func are called separately by ``condition``;
+    # remember the result on the request so the aggregate only runs once.
+    cache = request.__dict__.setdefault('_survey_page_state', {})
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def survey_list_state(request, *args, **kwargs):
+    """
+    The survey list: the latest survey edit or response deletion, version
+    and response, each read off the end of an index rather than counted.
+    Soft deletes bump ``updated_at``, and purged surveys were unlisted then.
+    """
+    def compute():
+        surveys = Survey.all_objects.aggregate(updated=Max('updated_at'), deleted=Max('responses_deleted_at'))
+        version = SurveyVersion.objects.order_by('-id').values('id', 'published_at').first() or {}
+        response = Response.objects.order_by('-id').values('id', 'submitted_at').first() or {}
+        return {
+            'last_modified': _latest(surveys['updated'], surveys['deleted'], version.get('published_at'),
+                                     response.get('submitted_at')),
+            'parts': ('list', surveys['updated'], surveys['deleted'], version.get('id'), response.get('id')),
+        }
+    return _cached_state(request, 'list', compute)
+
+
+def _survey_row(survey_id):
+    return Survey.objects.filter(id=survey_id).values(
+        'updated_at', 'is_active', 'published_version', 'published_version__published_at', 'responses_deleted_at'
+    ).first()
+
+
+def survey_state(request, survey_id, *args, **kwargs):
+    """The survey form: the survey and its published version, whatever the responses"""
+    def compute():
+        survey = _survey_row(survey_id)
+        if survey is None:
+            # Let the view raise its usual 404.
+            return None
+        return {
+            'last_modified': _latest(survey['updated_at'], survey['published_version__published_at']),
+            'parts': (survey_id, survey['updated_at'], survey['is_active'], survey['published_version']),
+        }
+    return _cached_state(request, ('survey', survey_id), compute)
+
+
+def survey_results_state(request, survey_id, *args, **kwargs):
+    """
+    The results page: the survey plus its latest response and the latest
+    timing event behind its drop-off funnel, index lookups on
+    ``(survey, submitted_at)`` and ``(survey, id)`` rather than counts.
+    """
+    def compute():
+        survey = _survey_row(survey_id)
+        if survey is None or survey['published_version'] is None:
+            # Missing: let the view 404. Never published: the page shows
+            # the draft, whose edits nothing here would notice.
+            return None
+        latest = Response.objects.filter(survey_id=survey_id).aggregate(latest=Max('submitted_at'))['latest']
+        # Events are written in batches and carry the time they were
+        # reported, not written, so only their ids show that more arrived.
+        timing = TimingEvent.objects.filter(survey_id=survey_id).aggregate(latest=Max('id'))['latest']
+        return {
+            'last_modified': _latest(survey['updated_at'], survey['published_version__published_at'], latest,
+                                     survey['responses_deleted_at']),
+            'parts': ('results', survey_id, survey['updated_at'], survey['is_active'],
+                      survey['published_version'], latest, survey['responses_deleted_at'], timing),
+        }
+    return _cached_state(request, ('results', survey_id), compute)
+
+
+@lru_cache(maxsize=None)
+def build_id():
+    """
+    Fingerprint of the deployed static files: pages link content-hashed
+    asset names, so a deploy that changes an asset must change every
+    page's validator too. Empty when assets are not hashed.
+    """
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if not hashed_files:
+        return ''
+    return md5(repr(sorted(hashed_files.items())).encode(), usedforsecurity=False).hexdigest()
+
+
+def _etag_func(state_func):
+    def etag(request, *args, **kwargs):
+        state = state_func(request, *args, **kwargs)
+        if state is None:
+            return None
+        # Pages render the navbar differently per user, so the user is part
+        # of the validator even though the survey data is shared.
+        parts = state['parts'] + (build_id(), request.get_full_path(), request.user.pk)
+        return md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return etag
+
+
+def _last_modified_func(state_func):
+    def last_modified(request, *args, **kwargs):
+        state = state_func(request, *args, **kwargs)
+        return state['last_modified'] if state else None
+    return last_modified
+
+
+def conditional_survey_page(state_func, public=False):
+    """
+    Answer GET/HEAD with 304 when the page state is unchanged. Responses are
+    ``private`` and revalidated on every use, except that with ``public``
+    anonymous visitors get a ``public`` response a reverse proxy or CDN may
+    serve for ``SURVEYS_CACHE_MAX_AGE`` seconds; only use it for pages
+    without per-visitor content such as CSRF tokens.
+    """
+    def decorator(view_func):
+        conditional_view = condition(
+            etag_func=_etag_func(state_func),
+            last_modified_func=_last_modified_func(state_func),
+        )(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                # Submissions have nothing to validate; skip the state query.
+                return view_func(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                if public and not request.user.is_authenticated:
+                    max_age = getattr(settings, 'SURVEYS_CACHE_MAX_AGE', 60)
+                    patch_cache_control(response, public=True, max_age=max_age, must_revalidate=True)
+                else:
+                    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+            return response
+        return _wrapped_view
+    return decorator
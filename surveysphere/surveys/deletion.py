@@ -0,0 +1,101 @@
+"""
+Deleting surveys and responses without one giant cascade.
+
+``Model.delete()`` collects every dependent row into memory before deleting
+them all in a single transaction; for a popular survey that means millions
+of ``Answer`` objects and table locks held for minutes. Instead a survey is
+hidden at once (``deleted_at``) and its responses are then purged by a
+background job, ``SURVEYS_DELETE_BATCH_SIZE`` responses per transaction,
+with raw DELETEs that skip the collector.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Survey, Response, Answer, ResponseReservoir, ResponseSample, OwnerStats, TimingEvent
+from .text import forget_terms
+
+SelectedOption = Answer.selected_options.through
+SkippedQuestion = Response.skipped.through
+
+
+def batch_size():
+    return getattr(settings, 'SURVEYS_DELETE_BATCH_SIZE', 1000)
+
+
+def delete_survey(survey, requested_by=None):
+    """Hide ``survey`` now and queue the removal of its rows; returns the job"""
+    now = timezone.now()
+    Survey.all_objects.filter(pk=survey.pk).update(deleted_at=now, is_active=False, updated_at=now)
+    OwnerStats.rebuild(survey.created_by_id)
+    return enqueue('purge_survey', created_by=requested_by, survey_id=survey.pk)
+
+
+def delete_responses(responses, report=None, forget=True):
+    """
+    Delete ``responses`` (a queryset) and their answers in bounded batches.
+    ``report(done)`` is called after each batch; returns the number deleted.
+    ``forget=False`` leaves term frequencies alone, for surveys about to go.
+    """
+    surveys = dict(
+        Survey.all_objects.filter(responses__in=responses).values_list('id', 'created_by_id').distinct()
+    )
+    ids_query = responses.order_by('id').values_list('id', flat=True)
+    done = 0
+    while True:
+        with transaction.atomic():
+            ids = list(ids_query[:batch_size()])
+            if not ids:
+                break
+            if forget:
+                forget_terms(Answer.objects.filter(response_id__in=ids))
+            per_survey = Response.objects.filter(id__in=ids).order_by().values_list('survey_id').annotate(
+                count=Count('id')
+            )
+            # Keep the reservoirs' response counts, which decide when results
+            # are approximated and scale the estimates, in step. Samples just
+            # lose the deleted responses; estimates use the sample size left.
+            for survey_id, count in per_survey:
+                ResponseReservoir.objects.filter(survey_id=survey_id).update(seen=Greatest(F('seen') - count, 0))
+            # Children first: raw deletes do not cascade.
+            for queryset in (
+                SelectedOption.objects.filter(answer__response_id__in=ids),
+                Answer.objects.filter(response_id__in=ids),
+                SkippedQuestion.objects.filter(response_id__in=ids),
+                ResponseSample.objects.filter(response_id__in=ids),
+                Response.objects.filter(id__in=ids),
+            ):
+                queryset._raw_delete(queryset.db)
+        done += len(ids)
+        if report:
+            report(done)
+
+    if done:
+        # Page validators (caching.py) see new responses but not removed ones.
+        Survey.all_objects.filter(id__in=list(surveys)).update(responses_deleted_at=timezone.now())
+    for owner_id in set(surveys.values()):
+        OwnerStats.rebuild(owner_id)
+    return done
+
+
+def purge_survey(survey_id, report=None):
+    """Remove a deleted survey's responses in batches, then the survey itself"""
+    survey = Survey.all_objects.filter(pk=survey_id).first()
+    if survey is None:
+        return 0
+    deleted = delete_responses(Response.objects.filter(survey_id=survey_id), report, forget=False)
+    # Timing events grow with traffic too.
+    event_ids = TimingEvent.objects.filter(survey_id=survey_id).order_by('id').values_list('id', flat=True)
+    while True:
+        ids = list(event_ids[:batch_size()])
+        if not ids:
+            break
+        events = TimingEvent.objects.filter(id__in=ids)
+        events._raw_delete(events.db)
+    # What is left (questions, options, rules, samples) is bounded by the
+    # survey's size, not its popularity, so the regular cascade is fine.
+    survey.delete()
+    return deleted
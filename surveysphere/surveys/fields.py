@@ -0,0 +1,69 @@
+from django import forms
+
+
+def question_field(question):
+    """
+    Build the form field used to collect and validate answers to ``question``.
+
+    Fields are stateless once built, so compiled survey schemas can build them
+    once and reuse them for every submission. Choice questions take their
+    options from ``option_list`` (see ``versions.version_questions``).
+    """
+    if question.question_type == 'text':
+        return forms.CharField(
+            label=question.text,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.TextInput(attrs={'class': 'form-control'})
+        )
+    elif question.question_type == 'textarea':
+        return forms.CharField(
+            label=question.text,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 4})
+        )
+    elif question.question_type == 'email':
+        return forms.EmailField(
+            label=question.text,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.EmailInput(attrs={'class': 'form-control'})
+        )
+    elif question.question_type == 'number':
+        return forms.DecimalField(
+            label=question.text,
+            required=question.is_required,
+            help_text=question.help_text,
+            max_digits=10,
+            decimal_places=2,
+            widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
+        )
+    elif question.question_type == 'radio':
+        choices = [(opt.id, opt.text) for opt in question.option_list]
+        return forms.ChoiceField(
+            label=question.text,
+            choices=choices,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.RadioSelect()
+        )
+    elif question.question_type == 'checkbox':
+        choices = [(opt.id, opt.text) for opt in question.option_list]
+        return forms.MultipleChoiceField(
+            label=question.text,
+            choices=choices,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.CheckboxSelectMultiple()
+        )
+    elif question.question_type == 'rating':
+        rating_choices = [(i, str(i)) for i in range(1, 6)]
+        return forms.ChoiceField(
+            label=question.text,
+            choices=rating_choices,
+            required=question.is_required,
+            help_text=question.help_text,
+            widget=forms.RadioSelect()
+        )
+    return None
@@ -1,7 +1,12 @@
+import copy
+
 from django import forms
 from django.core.exceptions import ValidationError
 from django.forms import inlineformset_factory
-from .models import Survey, Question, Option, Response, Answer
+from .models import Survey, Question, Option, Response, TimingEvent
+from .ingest import client_ip, get_schema, write_responses
+from .segments import Segment
+from .timing import read_token, record
 
 
 class SurveyResponseForm(forms.Form):
@@ -12,127 +17,62 @@ class SurveyResponseForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.survey = survey
         
-        for question in survey.questions.all():
-            field_name = f'question_{question.id}'
-            
-            if question.question_type == 'text':
-                self.fields[field_name] = forms.CharField(
-                    label=question.text,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.TextInput(attrs={'class': 'form-control'})
-                )
-            elif question.question_type == 'textarea':
-                self.fields[field_name] = forms.CharField(
-                    label=question.text,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 4})
-                )
-            elif question.question_type == 'email':
-                self.fields[field_name] = forms.EmailField(
-                    label=question.text,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.EmailInput(attrs={'class': 'form-control'})
-                )
-            elif question.question_type == 'number':
-                self.fields[field_name] = forms.DecimalField(
-                    label=question.text,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    max_digits=10,
-                    decimal_places=2,
-                    widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'})
-                )
-            elif question.question_type == 'radio':
-                choices = [(opt.id, opt.text) for opt in question.options.all()]
-                self.fields[field_name] = forms.ChoiceField(
-                    label=question.text,
-                    choices=choices,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.RadioSelect()
-                )
-            elif question.question_type == 'checkbox':
-                choices = [(opt.id, opt.text) for opt in question.options.all()]
-                self.fields[field_name] = forms.MultipleChoiceField(
-                    label=question.text,
-                    choices=choices,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.CheckboxSelectMultiple()
-                )
-            elif question.question_type == 'rating':
-                rating_choices = [(i, str(i)) for i in range(1, 6)]
-                self.fields[field_name] = forms.ChoiceField(
-                    label=question.text,
-                    choices=rating_choices,
-                    required=question.is_required,
-                    help_text=question.help_text,
-                    widget=forms.RadioSelect()
-                )
+        self.schema = get_schema(survey)
+
+        for spec in self.schema.questions:
+            # Compiled fields are shared between requests; give each form its own copy.
+            field = copy.deepcopy(spec.field)
+            if spec.id in self.schema.rules.conditional:
+                # Only required when shown; enforced in clean().
+                field.required = False
+            self.fields[f'question_{spec.id}'] = field
+
+    @property
+    def display_rules(self):
+        return self.schema.rules.as_json()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        answers = {
+            spec.id: cleaned_data[f'question_{spec.id}']
+            for spec in self.schema.questions
+            if f'question_{spec.id}' in cleaned_data
+        }
+        reachable = self.schema.rules.reachable(answers)
+
+        for spec in self.schema.questions:
+            field_name = f'question_{spec.id}'
+            if spec.id not in reachable:
+                # Hidden questions are neither validated nor saved.
+                self._errors.pop(field_name, None)
+                cleaned_data.pop(field_name, None)
+            elif (spec.id in self.schema.rules.conditional and spec.field.required
+                    and cleaned_data.get(field_name) in spec.field.empty_values):
+                self.add_error(field_name, spec.field.error_messages['required'])
+        return cleaned_data
 
     def save(self, request):
-        response = Response.objects.create(
-            survey=self.survey,
+        cleaned = {
+            spec.id: self.cleaned_data[f'question_{spec.id}']
+            for spec in self.schema.questions
+            if f'question_{spec.id}' in self.cleaned_data  # Only if the field existed in the form
+        }
+        # The timing token is posted alongside the answers, not as a form field.
+        timing = read_token(request.POST.get('timing'), self.survey.id)
+        response = write_responses(
+            self.schema,
+            [cleaned],
             ip_address=self.get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            is_complete=True
-        )
-
-        for question in self.survey.questions.all():
-            field_name = f'question_{question.id}'
-            answer_data = self.cleaned_data.get(field_name)
-            
-            # 🐛 BUG FIX: The original logic was wrong!
-            # It was skipping answers when answer_data was falsy (empty string, empty list, etc.)
-            # But we should create Answer objects even for empty responses to track that the question was presented
-            
-            # Create answer object for every question that was in the form
-            if field_name in self.cleaned_data:  # Only if the field existed in the form
-                answer = Answer.objects.create(response=response, question=question)
-
-                if question.question_type == 'radio':
-                    if answer_data:  # Only set option if something was selected
-                        try:
-                            option = Option.objects.get(id=int(answer_data))
-                            answer.selected_options.add(option)
-                        except (Option.DoesNotExist, ValueError, TypeError):
-                            # Handle invalid option IDs gracefully
-                            pass
-
-                elif question.question_type == 'checkbox':
-                    if answer_data:  # Only set options if something was selected
-                        try:
-                            option_ids = [int(opt_id) for opt_id in answer_data]
-                            options = Option.objects.filter(id__in=option_ids)
-                            answer.selected_options.set(options)
-                        except (ValueError, TypeError):
-                            # Handle invalid option IDs gracefully
-                            pass
-
-                elif question.question_type == 'rating':
-                    if answer_data:  # Only save if a rating was selected
-                        answer.text_answer = str(answer_data)
-                        answer.save()
-
-                elif question.question_type == 'number':
-                    if answer_data is not None:  # Save even if 0
-                        answer.numeric_answer = answer_data
-                        answer.save()
-
-                else:
-                    # text, textarea, email, etc.
-                    if answer_data:  # Only save if there's actual text
-                        answer.text_answer = str(answer_data)
-                        answer.save()
-
+            started_at=timing[1] if timing else None,
+        )[0]
+        if timing:
+            record([TimingEvent(survey_id=self.survey.id, version_id=self.schema.version_id, visit=timing[0],
+                                kind='submit')])
         return response
     
     def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        return x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+        return client_ip(request)
 
 
 class SurveyCreationForm(forms.ModelForm):
@@ -153,6 +93,15 @@ class SurveyCreationForm(forms.ModelForm):
 
 
 class QuestionCreationForm(forms.ModelForm):
+    # A 1-based position rather than the raw ordering key; blank appends.
+    order = forms.IntegerField(
+        required=False,
+        min_value=1,
+        label="Position",
+        help_text="Leave blank to add the question at the end.",
+        widget=forms.NumberInput(attrs={'class': 'form-control'})
+    )
+
     class Meta:
         model = Question
         fields = ['text', 'question_type', 'is_required', 'order', 'help_text']
@@ -187,10 +136,90 @@ class OptionCreationForm(forms.ModelForm):
         return text
 
 
+def _document_formats():
+    # transfer.py validates with the forms above.
+    from .transfer import FORMATS
+    return [(fmt, fmt.upper()) for fmt in FORMATS]
+
+
+class SurveyImportForm(forms.Form):
+    format = forms.ChoiceField(
+        choices=_document_formats,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    document = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 12})
+    )
+    file = forms.FileField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get('file')
+        if upload:
+            try:
+                cleaned_data['document'] = upload.read().decode('utf-8')
+            except UnicodeDecodeError:
+                raise ValidationError("Uploaded file must be UTF-8 text.")
+        if not cleaned_data.get('document', '').strip():
+            raise ValidationError("Paste a survey document or upload a file.")
+        return cleaned_data
+
+
 # ✅ Inline formset to tie options to a single question
 OptionFormSet = inlineformset_factory(
     Question, Option,
     form=OptionCreationForm,
     extra=2,          # Show 2 blank option fields by default
     can_delete=True
-)
\ No newline at end of file
+)
+
+class SegmentForm(forms.Form):
+    """Result filters, read from the results page's query string"""
+    since = forms.DateField(
+        required=False, label="From",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'})
+    )
+    until = forms.DateField(
+        required=False, label="Until",
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'})
+    )
+    client = forms.ChoiceField(
+        required=False, label="Device",
+        choices=[('', 'Any device')] + list(Response.CLIENT_CLASSES),
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    option = forms.ModelChoiceField(
+        queryset=Option.objects.none(), required=False, label="Answered", empty_label="Any answer",
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+
+    def __init__(self, survey, *args, version=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if version is not None:
+            # Only the options respondents of that version could choose.
+            options = Option.objects.filter(versions=version)
+        else:
+            options = Option.objects.filter(question__survey=survey, question__question_type__in=('radio', 'checkbox'))
+        self.fields['option'].queryset = options.select_related('question').order_by(
+            'question__order', 'question_id', 'order', 'id'
+        )
+        self.fields['option'].label_from_instance = lambda option: f"{option.question.text[:40]}: {option.text}"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            raise ValidationError("The start date must not be after the end date.")
+        return cleaned_data
+
+    def segment(self):
+        """The Segment these filters describe; empty if the form is invalid"""
+        if not self.is_valid():
+            return Segment()
+        return Segment(
+            since=self.cleaned_data['since'],
+            until=self.cleaned_data['until'],
+            client_class=self.cleaned_data['client'] or None,
+            option=self.cleaned_data['option'],
+        )
@@ -0,0 +1,245 @@
+"""
+Validation and bulk writing of survey responses.
+
+A survey's published version is compiled once into a ``SurveySchema`` (its
+questions and the form fields that validate them) and cached by version;
+versions never change, so the cache needs no invalidation and validating a
+response does not touch the database. Validated responses are
+then written with one bulk insert each for ``Response``, ``Answer``, the
+answer/option table and the skipped-question table, whether that is one response from the HTML form or
+thousands from an offline collector. Empty answers are not stored as rows
+unless ``SURVEYS_SPARSE_ANSWERS`` is turned off.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .fields import question_field
+from .jobs import enqueue
+from .live import build_delta, publish_delta
+from .models import Response, Answer, OwnerStats, ResponseReservoir, SurveyVersion
+from .segments import classify_user_agent
+from .text import record_terms
+from .versions import version_questions, version_rules
+
+SelectedOption = Answer.selected_options.through
+SkippedQuestion = Response.skipped.through
+
+SCHEMA_CACHE_SIZE = 256
+
+_schema_cache = OrderedDict()
+_schema_lock = Lock()
+
+
+class QuestionSpec:
+    __slots__ = ('id', 'question_type', 'field')
+
+    def __init__(self, question):
+        self.id = question.id
+        self.question_type = question.question_type
+        self.field = question_field(question)
+
+    def build_answer(self, value):
+        """Return an unsaved Answer and the option ids to attach to it"""
+        answer = Answer(question_id=self.id)
+        option_ids = []
+
+        if self.question_type == 'radio':
+            if value:  # Only set option if something was selected
+                option_ids = [int(value)]
+        elif self.question_type == 'checkbox':
+            option_ids = [int(opt_id) for opt_id in value or []]
+        elif self.question_type == 'number':
+            answer.numeric_answer = value  # None when left blank, 0 is kept
+        elif value:
+            # rating, text, textarea, email
+            answer.text_answer = str(value)
+
+        return answer, option_ids
+
+
+class SurveySchema:
+    """Everything needed to validate and store responses to one survey version"""
+
+    def __init__(self, survey, version):
+        self.survey_id = survey.id
+        self.owner_id = survey.created_by_id
+        self.version_id = version.id
+        self.version = version.number
+        self.rules = version_rules(version)
+        specs = (QuestionSpec(question) for question in version_questions(version))
+        self.questions = [spec for spec in specs if spec.field is not None]
+        self.question_types = {spec.id: spec.question_type for spec in self.questions}
+
+    def clean(self, answers):
+        """
+        Validate ``answers`` (a mapping of question id to raw value) and return
+        ``(cleaned, errors)``; both are keyed by question id. Questions hidden
+        by display rules are neither validated nor included in ``cleaned``.
+        """
+        answers = {str(key): value for key, value in (answers or {}).items()}
+        cleaned, errors = {}, {}
+        for spec in self.questions:
+            if not self.rules.is_shown(spec.id, cleaned):
+                continue
+            try:
+                cleaned[spec.id] = spec.field.clean(answers.get(str(spec.id)))
+            except ValidationError as e:
+                errors[str(spec.id)] = e.messages
+        return cleaned, errors
+
+
+def client_ip(request):
+    """
+    ``REMOTE_ADDR``, or behind ``SURVEYS_TRUSTED_PROXIES`` reverse proxies
+    the X-Forwarded-For entry added by the outermost of them. Entries to
+    its left come from the client and may be forged.
+    """
+    proxies = getattr(settings, 'SURVEYS_TRUSTED_PROXIES', 0)
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    if proxies and len(hops) >= proxies:
+        return hops[-proxies]
+    return request.META.get('REMOTE_ADDR')
+
+
+def get_schema(survey):
+    """
+    Return the compiled schema of the version of ``survey`` respondents get,
+    compiling each version at most once. Raises ValueError if the survey has
+    not been published.
+    """
+    if survey.published_version_id is None:
+        raise ValueError(f"Survey {survey.id} has not been published.")
+    key = survey.published_version_id
+    with _schema_lock:
+        schema = _schema_cache.get(key)
+        if schema is not None:
+            _schema_cache.move_to_end(key)
+            return schema
+
+    schema = SurveySchema(survey, SurveyVersion.objects.get(pk=survey.published_version_id))
+
+    with _schema_lock:
+        _schema_cache[key] = schema
+        while len(_schema_cache) > SCHEMA_CACHE_SIZE:
+            _schema_cache.popitem(last=False)
+    return schema
+
+
+def clear_schema_cache():
+    """
+    Forget compiled schemas. For tests: SQLite hands out the ids of
+    rolled-back versions again, to versions with other questions.
+    """
+    with _schema_lock:
+        _schema_cache.clear()
+
+
+def _is_empty(answer, option_ids):
+    return not option_ids and answer.numeric_answer is None and not answer.text_answer
+
+
+def write_responses(schema, cleaned_items, ip_address=None, user_agent='', started_at=None):
+    """
+    Store already-validated responses in one transaction and return the
+    created Response objects, in the same order as ``cleaned_items``.
+    ``started_at`` is when the respondent opened the form, if known.
+    """
+    # Questions that were presented but left empty are either stored as
+    # empty answers or, in sparse mode, listed on the Response itself so
+    # results can still tell "skipped" from "not shown". Questions hidden
+    # by display rules are absent from ``cleaned``.
+    sparse = getattr(settings, 'SURVEYS_SPARSE_ANSWERS', True)
+    built = []
+    for cleaned in cleaned_items:
+        answers, skipped = [], []
+        for spec in schema.questions:
+            if spec.id not in cleaned:
+                continue
+            answer, option_ids = spec.build_answer(cleaned[spec.id])
+            if sparse and _is_empty(answer, option_ids):
+                skipped.append(spec.id)
+            else:
+                answers.append((answer, option_ids))
+        built.append((answers, skipped))
+
+    client_class = classify_user_agent(user_agent)
+    with transaction.atomic():
+        responses = Response.objects.bulk_create([
+            Response(
+                survey_id=schema.survey_id,
+                version_id=schema.version_id,
+                ip_address=ip_address,
+                user_agent=user_agent,
+                client_class=client_class,
+                started_at=started_at,
+                is_complete=True,
+            )
+            for _ in built
+        ])
+        SkippedQuestion.objects.bulk_create([
+            SkippedQuestion(response_id=response.id, question_id=question_id)
+            for response, (_, skipped) in zip(responses, built)
+            for question_id in skipped
+        ])
+
+        answers, selections = [], []
+        for response, (built_answers, _) in zip(responses, built):
+            for answer, option_ids in built_answers:
+                answer.response = response
+                answers.append(answer)
+                selections.append(option_ids)
+
+        Answer.objects.bulk_create(answers)
+        if getattr(settings, 'SURVEYS_TEXT_ANALYTICS', True):
+            transaction.on_commit(
+                lambda: record_terms(answers, schema.question_types, schema.version_id), robust=True
+            )
+        SelectedOption.objects.bulk_create([
+            SelectedOption(answer_id=answer.id, option_id=option_id)
+            for answer, option_ids in zip(answers, selections)
+            for option_id in option_ids
+        ])
+
+        if responses:
+            OwnerStats.record_responses(schema.owner_id, len(responses), timezone.now())
+            if ResponseReservoir.offer(schema.survey_id, [response.id for response in responses]):
+                enqueue('rebuild_response_samples', survey_ids=[schema.survey_id])
+
+        skipped_by_response = {response.id: ids for response, (_, ids) in zip(responses, built)}
+        delta = build_delta(answers, selections, schema.question_types, skipped_by_response)
+        transaction.on_commit(lambda: publish_delta(schema.survey_id, delta), robust=True)
+
+    return responses
+
+
+def ingest(schema, items, ip_address=None, user_agent=''):
+    """
+    Validate a batch of ``{"answers": {...}}`` items, store the valid ones and
+    return a per-item result list in input order.
+    """
+    results, valid, positions = [], [], []
+    for index, item in enumerate(items):
+        answers = item.get('answers') if isinstance(item, dict) else None
+        if not isinstance(answers, dict):
+            results.append({'index': index, 'status': 'invalid',
+                            'errors': {'answers': ["Expected an object of question id to answer."]}})
+            continue
+        cleaned, errors = schema.clean(answers)
+        if errors:
+            results.append({'index': index, 'status': 'invalid', 'errors': errors})
+        else:
+            results.append(None)
+            valid.append(cleaned)
+            positions.append(index)
+
+    if valid:
+        created = write_responses(schema, valid, ip_address, user_agent)
+        for index, response in zip(positions, created):
+            results[index] = {'index': index, 'status': 'created', 'id': response.id}
+
+    return results
@@ -0,0 +1,165 @@
+"""
+A small database-backed job queue for work too heavy for a web request.
+
+Job kinds are plain functions registered with ``@job('kind')``; they are
+called as ``handler(job, **job.params)``, should do their work in bounded
+transactions and call ``job.report(done, total)`` as they go. Whatever they
+return is stored as the job's result.
+
+Jobs are queued with ``enqueue()`` and run by ``manage.py run_jobs``.
+Workers claim jobs with a conditional UPDATE, so any number of them can poll
+the same table. While a handler runs, a heartbeat thread keeps the job's
+``heartbeat_at`` fresh, so long single steps need not call ``report()``; a
+job whose worker stopped beating for ``SURVEYS_JOBS_STALE_AFTER`` seconds is
+picked up again, up to ``SURVEYS_JOBS_MAX_ATTEMPTS`` claims in all, and then
+marked failed. A claim is identified by its ``started_at``: a worker whose
+job was reclaimed can no longer record progress or an outcome for it.
+"""
+import logging
+import traceback
+from datetime import timedelta
+from importlib import import_module
+from threading import Event, Thread
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def job(kind):
+    """Register a function as the handler for ``kind`` jobs"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    # Handlers live in surveys.tasks; import them where jobs are run.
+    import_module('surveys.tasks')
+
+
+def enqueue(kind, created_by=None, **params):
+    """
+    Queue a job and return it. With ``SURVEYS_JOBS_EAGER`` the job runs in
+    this process once the current transaction commits, for development
+    without a worker.
+    """
+    new_job = Job.objects.create(kind=kind, params=params, created_by=created_by)
+    if getattr(settings, 'SURVEYS_JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job(new_job.pk))
+    return new_job
+
+
+def stale_after():
+    return timedelta(seconds=getattr(settings, 'SURVEYS_JOBS_STALE_AFTER', 600))
+
+
+def max_attempts():
+    return getattr(settings, 'SURVEYS_JOBS_MAX_ATTEMPTS', 3)
+
+
+def _stale(now):
+    return Q(status='running', heartbeat_at__lt=now - stale_after())
+
+
+def _claimable(now):
+    return Q(status='queued') | (_stale(now) & Q(attempts__lt=max_attempts()))
+
+
+def _give_up(now):
+    """Fail stale jobs that have used up their attempts"""
+    Job.objects.filter(_stale(now), attempts__gte=max_attempts()).update(
+        status='failed', finished_at=now,
+        error=f"Abandoned: the worker stopped responding on each of {max_attempts()} attempts.",
+    )
+
+
+def _claim(job_id, now):
+    # Only one worker's UPDATE can match; the others move on.
+    return Job.objects.filter(_claimable(now), id=job_id).update(
+        status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+    )
+
+
+def claim(kinds=None):
+    """Mark the oldest runnable job as running and return it, or None"""
+    now = timezone.now()
+    _give_up(now)
+    candidates = Job.objects.filter(_claimable(now))
+    if kinds:
+        candidates = candidates.filter(kind__in=kinds)
+
+    for job_id in candidates.order_by('created_at', 'id').values_list('id', flat=True)[:10]:
+        if _claim(job_id, now):
+            return Job.objects.get(id=job_id)
+    return None
+
+
+class Heartbeat(Thread):
+    """Refreshes a claimed job's ``heartbeat_at`` until stopped"""
+
+    def __init__(self, claimed):
+        super().__init__(name=f"job-{claimed.pk}-heartbeat", daemon=True)
+        self.claimed = claimed
+        self.interval = stale_after().total_seconds() / 3
+        self.stopped = Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                Job.objects.filter(pk=self.claimed.pk, status='running', started_at=self.claimed.started_at).update(
+                    heartbeat_at=timezone.now()
+                )
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job_id):
+    """
+    Run a claimed (or eagerly queued) job to completion and return its
+    outcome: 'done', 'failed', or 'lost' when the job was reclaimed by
+    another worker meanwhile, which then owns its outcome.
+    """
+    autodiscover()
+    current = Job.objects.get(id=job_id)
+    if current.status == 'queued':
+        # Eager jobs skip the worker's claim().
+        if not _claim(current.pk, timezone.now()):
+            return 'lost'
+        current.refresh_from_db()
+    handler = _handlers.get(current.kind)
+    heartbeat = Heartbeat(current)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{current.kind}'.")
+        result = handler(current, **current.params)
+        outcome = {
+            'status': 'done', 'result': result,
+            'progress': current.total if current.total is not None else current.progress,
+        }
+    except Exception:
+        logger.exception("Job %s (%s) failed", current.pk, current.kind)
+        outcome = {'status': 'failed', 'error': traceback.format_exc()}
+    finally:
+        heartbeat.stop()
+
+    finished = Job.objects.filter(pk=current.pk, status='running', started_at=current.started_at).update(
+        finished_at=timezone.now(), **outcome
+    )
+    if not finished:
+        logger.warning("Job %s (%s) was reclaimed while running; dropping its outcome", current.pk, current.kind)
+        return 'lost'
+    return outcome['status']
@@ -0,0 +1,188 @@
+"""
+Live results: tally deltas pushed to watchers as responses are committed.
+
+Writers publish one small delta per committed batch of responses (option
+counts, answer totals, numeric sums), computed from the rows they just
+inserted. Watchers add deltas to the figures their results page was
+rendered with, so N people watching a survey cost one delta computation per
+submission rather than N full recomputes of the results. The stream is only
+served when ``SURVEYS_LIVE_RESULTS`` is on, i.e. under ASGI.
+
+A page records the newest response it counted. Its stream subscribes first
+and then catches up on responses committed since, built from the database
+by ``catch_up_delta``; live deltas for batches the catch-up already covered
+are dropped by their ``first_id``.
+
+The broker is pluggable through ``SURVEYS_LIVE_BROKER``. ``LocalBroker``
+delivers within one process, which suits a single ASGI worker and tests;
+multi-process deployments point the setting at a broker backed by a shared
+channel with the same ``publish``/``subscribe`` interface.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from functools import lru_cache
+from threading import Lock
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Answer, Question, Response
+
+# More responses than this since the page was rendered: reload it instead.
+MAX_CATCH_UP = 1000
+
+
+class Subscription:
+    """Async iterator of deltas for one survey; close it to unsubscribe"""
+
+    def __init__(self, broker, survey_id):
+        self.broker = broker
+        self.survey_id = survey_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=broker.max_pending)
+
+    def deliver(self, delta):
+        # Called from the publishing thread; hand over to the watcher's loop.
+        self.loop.call_soon_threadsafe(self._put, delta)
+
+    def _put(self, delta):
+        try:
+            self.queue.put_nowait(delta)
+        except asyncio.QueueFull:
+            # A watcher that stopped reading gets a resync instead of
+            # unbounded memory growth.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'resync': True})
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub channel"""
+    max_pending = 1000
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = Lock()
+
+    def subscribe(self, survey_id):
+        subscription = Subscription(self, survey_id)
+        with self._lock:
+            self._subscriptions[survey_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            watchers = self._subscriptions.get(subscription.survey_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self._subscriptions[subscription.survey_id]
+
+    def watcher_count(self, survey_id):
+        with self._lock:
+            return len(self._subscriptions.get(survey_id, ()))
+
+    def publish(self, survey_id, delta):
+        with self._lock:
+            watchers = list(self._subscriptions.get(survey_id, ()))
+        for subscription in watchers:
+            try:
+                subscription.deliver(delta)
+            except RuntimeError:
+                # The watcher's event loop has gone away.
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    path = getattr(settings, 'SURVEYS_LIVE_BROKER', 'surveys.live.LocalBroker')
+    return import_string(path)()
+
+
+def build_delta(answers, selections, question_types, skipped=None):
+    """
+    Tally delta for freshly written answers.
+
+    ``answers`` are saved Answer objects, ``selections`` the option ids chosen
+    for each (in the same order) and ``question_types`` maps question id to
+    its type. ``skipped`` maps response id to the questions it left empty
+    without an Answer row.
+    """
+    skipped = skipped or {}
+    responses = {answer.response_id for answer in answers} | set(skipped)
+    questions = defaultdict(lambda: {'total': 0, 'options': defaultdict(int), 'count': 0, 'sum': 0.0})
+
+    for question_ids in skipped.values():
+        for question_id in question_ids:
+            questions[question_id]['total'] += 1
+
+    for answer, option_ids in zip(answers, selections):
+        tally = questions[answer.question_id]
+        tally['total'] += 1
+        for option_id in option_ids:
+            tally['options'][option_id] += 1
+        if answer.numeric_answer is not None:
+            tally['count'] += 1
+            tally['sum'] += float(answer.numeric_answer)
+        elif question_types.get(answer.question_id) == 'rating' and answer.text_answer.isdigit():
+            tally['count'] += 1
+            tally['sum'] += int(answer.text_answer)
+
+    return {
+        'responses': len(responses),
+        # Identifies the batch, so a stream's catch-up can skip it.
+        'first_id': min(responses, default=None),
+        'questions': {
+            question_id: {
+                'total': tally['total'],
+                'options': dict(tally['options']),
+                'count': tally['count'],
+                'sum': tally['sum'],
+            }
+            for question_id, tally in questions.items()
+        },
+    }
+
+
+def catch_up_delta(survey_id, version_id, since):
+    """
+    Delta for the responses to ``version_id`` after id ``since`` and the set
+    of their ids, or None when there are more than ``MAX_CATCH_UP``.
+    """
+    response_ids = list(
+        Response.objects.filter(survey_id=survey_id, version_id=version_id, id__gt=since)
+        .order_by('id').values_list('id', flat=True)[:MAX_CATCH_UP + 1]
+    )
+    if len(response_ids) > MAX_CATCH_UP:
+        return None
+    answers = list(Answer.objects.filter(response_id__in=response_ids))
+    chosen = defaultdict(list)
+    for answer_id, option_id in Answer.selected_options.through.objects.filter(
+        answer__response_id__in=response_ids
+    ).values_list('answer_id', 'option_id'):
+        chosen[answer_id].append(option_id)
+    skipped = {response_id: [] for response_id in response_ids}
+    for response_id, question_id in Response.skipped.through.objects.filter(
+        response_id__in=response_ids
+    ).values_list('response_id', 'question_id'):
+        skipped[response_id].append(question_id)
+    question_types = dict(
+        Question.objects.filter(id__in={answer.question_id for answer in answers}).values_list('id', 'question_type')
+    )
+    delta = build_delta(answers, [chosen[answer.id] for answer in answers], question_types, skipped)
+    return delta, set(response_ids)
+
+
+def publish_delta(survey_id, delta):
+    get_broker().publish(survey_id, delta)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
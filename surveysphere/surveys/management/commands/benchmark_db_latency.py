@@ -0,0 +1,65 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure request latency (p50/p99) for short views through the full "
+        "WSGI handler, including per-request connection setup and teardown. "
+        "Run once with and once without DB_POOL_MAX_SIZE / DB_CONN_MAX_AGE "
+        "to compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--url', action='append', dest='urls',
+                            help="Path to request (repeatable); defaults to survey_success and survey_list")
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or [reverse('surveys:survey_success'), reverse('surveys:survey_list')]
+        db = settings.DATABASES['default']
+        pool = db.get('OPTIONS', {}).get('pool')
+        self.stdout.write(
+            f"{connection.vendor}: CONN_MAX_AGE={db.get('CONN_MAX_AGE')} "
+            f"pool={'max_size=%s' % pool['max_size'] if pool else 'off'} "
+            f"concurrency={options['concurrency']}"
+        )
+
+        handler = WSGIHandler()
+        factory = RequestFactory()
+
+        def hit(path):
+            environ = factory.get(path).environ
+            started = time.perf_counter()
+            # The handler fires request_started/request_finished, which open
+            # and close (or return) the connection just like gunicorn does.
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - started
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for path in urls:
+                hit(path)  # warm up imports and templates
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    samples = list(executor.map(hit, [path] * options['requests']))
+                self.stdout.write(
+                    f"  {path:40} p50={percentile(samples, 50) * 1000:7.2f}ms "
+                    f"p99={percentile(samples, 99) * 1000:7.2f}ms "
+                    f"mean={statistics.mean(samples) * 1000:7.2f}ms"
+                )
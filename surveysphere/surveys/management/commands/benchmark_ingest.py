@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from surveys.ingest import get_schema, ingest
+from surveys.transfer import import_survey
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure batch response ingestion throughput against the configured "
+        "database. Everything written is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--questions', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['responses'], options['batch_size'], options['questions'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, total, batch_size, question_count):
+        owner, _ = get_user_model().objects.get_or_create(
+            username='benchmark-ingest', defaults={'email': 'benchmark-ingest@example.com'}
+        )
+        types = ['radio', 'checkbox', 'text', 'number', 'rating']
+        survey = import_survey({
+            'title': 'Ingest benchmark',
+            'questions': [
+                {
+                    'text': f'Benchmark question {n}',
+                    'question_type': types[n % len(types)],
+                    'options': ['Alpha', 'Beta', 'Gamma'] if types[n % len(types)] in ('radio', 'checkbox') else [],
+                }
+                for n in range(question_count)
+            ],
+        }, owner)
+
+        schema = get_schema(survey)
+        questions = list(survey.questions.prefetch_related('options'))
+
+        def item():
+            answers = {}
+            for question in questions:
+                option_ids = [option.id for option in question.options.all()]
+                if question.question_type == 'radio':
+                    answers[question.id] = random.choice(option_ids)
+                elif question.question_type == 'checkbox':
+                    answers[question.id] = random.sample(option_ids, 2)
+                elif question.question_type == 'number':
+                    answers[question.id] = random.randint(0, 100)
+                elif question.question_type == 'rating':
+                    answers[question.id] = random.randint(1, 5)
+                else:
+                    answers[question.id] = 'benchmark answer'
+            return {'answers': answers}
+
+        items = [item() for _ in range(total)]
+
+        started = time.perf_counter()
+        created = 0
+        for offset in range(0, total, batch_size):
+            results = ingest(schema, items[offset:offset + batch_size], ip_address='127.0.0.1')
+            created += sum(1 for result in results if result['status'] == 'created')
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Ingested {created}/{total} responses x {len(questions)} questions "
+            f"in batches of {batch_size}: {elapsed:.2f}s, {created / elapsed:,.0f} responses/s"
+        )
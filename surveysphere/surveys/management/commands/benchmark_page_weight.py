@@ -0,0 +1,117 @@
+import gzip
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from surveys.ingest import get_schema, write_responses
+from surveys.transfer import import_survey
+
+ASSET_RE = re.compile(r'(?:href|src)="([^"]+)"')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bytes per page view (HTML plus same-site CSS/JS, first and repeat "
+        "views) and server CPU time per request for the main pages. Run "
+        "collectstatic first so compressed assets are measured as served. "
+        "Everything written is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per page for the CPU figure")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                owner, survey = self.seed()
+                self.measure(owner, survey, options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self):
+        owner, _ = get_user_model().objects.get_or_create(
+            username='benchmark-pages', defaults={'email': 'benchmark-pages@example.com'}
+        )
+        survey = import_survey({
+            'title': 'Page weight benchmark',
+            'description': 'A typical short survey.',
+            'questions': [
+                {'text': 'How did you hear about us?', 'question_type': 'radio', 'options': ['Friend', 'Search', 'Advert']},
+                {'text': 'Which features do you use?', 'question_type': 'checkbox', 'options': ['Reports', 'Export', 'API']},
+                {'text': 'How would you rate the service?', 'question_type': 'rating'},
+                {'text': 'Anything else you would like to tell us?', 'question_type': 'textarea'},
+            ],
+        }, owner)
+        schema = get_schema(survey)
+        write_responses(schema, [{}] * 20)
+        return owner, survey
+
+    def measure(self, owner, survey, requests):
+        anonymous, logged_in = Client(), Client()
+        logged_in.force_login(owner)
+        pages = [
+            ('survey list', anonymous, reverse('surveys:survey_list')),
+            ('survey form', anonymous, reverse('surveys:survey_detail', args=[survey.id])),
+            ('login', anonymous, reverse('login')),
+            ('dashboard', logged_in, reverse('dashboard')),
+            ('results', logged_in, reverse('surveys:survey_results', args=[survey.id])),
+        ]
+
+        self.stdout.write(f"{'page':<14}{'html':>9}{'html gz':>9}{'assets':>9}{'first view':>12}"
+                          f"{'repeat view':>13}{'cpu ms':>9}")
+        for label, client, url in pages:
+            html = client.get(url).content
+            assets = sum(self.asset_size(asset) for asset in self.local_assets(html.decode()))
+            compressed = len(gzip.compress(html))
+
+            started = time.process_time()
+            for _ in range(requests):
+                client.get(url)
+            cpu = (time.process_time() - started) / requests * 1000
+
+            # Hashed assets are cached for a year, so repeat views only fetch the HTML.
+            self.stdout.write(f"{label:<14}{len(html):>9}{compressed:>9}{assets:>9}{compressed + assets:>12}"
+                              f"{compressed:>13}{cpu:>9.2f}")
+
+        static = list(self.local_assets(anonymous.get(pages[0][2]).content.decode()))
+        if static:
+            started = time.process_time()
+            for _ in range(requests):
+                response = anonymous.get(static[0], HTTP_ACCEPT_ENCODING='br, gzip')
+                b''.join(response.streaming_content if response.streaming else [response.content])
+            cpu = (time.process_time() - started) / requests * 1000
+            self.stdout.write(f"Serving {static[0]}: {cpu:.2f} cpu ms per request")
+
+    def local_assets(self, html):
+        for url in ASSET_RE.findall(html):
+            if url.startswith(settings.STATIC_URL) and url.endswith(('.css', '.js')):
+                yield url
+
+    def asset_size(self, url):
+        """Bytes on the wire: the smallest precompressed copy collectstatic wrote"""
+        name = url[len(settings.STATIC_URL):]
+        collected = settings.STATIC_ROOT / name
+        if collected.exists():
+            sizes = [path.stat().st_size for path in (collected, collected.with_name(collected.name + '.gz'),
+                                                      collected.with_name(collected.name + '.br'))
+                     if path.exists()]
+            return min(sizes)
+        found = finders.find(name)
+        if found is None:
+            return 0
+        with open(found, 'rb') as source:
+            return len(gzip.compress(source.read()))
@@ -0,0 +1,117 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from surveys.models import Answer, Response
+from surveys.results import compute_results
+from surveys.segments import Segment
+from surveys.transfer import import_survey
+
+SelectedOption = Answer.selected_options.through
+
+CLIENT_WEIGHTS = {'desktop': 50, 'mobile': 35, 'tablet': 10, 'bot': 2, 'unknown': 3}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a survey with many responses and time filtered (segmented) result "
+        "queries against it. Everything written is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--explain', action='store_true', help="Print the plan of each segment's totals query")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                survey = self.seed(options['responses'], options['batch_size'])
+                self.measure(survey, options['explain'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, total, batch_size):
+        owner, _ = get_user_model().objects.get_or_create(
+            username='benchmark-segments', defaults={'email': 'benchmark-segments@example.com'}
+        )
+        survey = import_survey({
+            'title': 'Segment benchmark',
+            'questions': [
+                {'text': 'How did you hear about us?', 'question_type': 'radio', 'options': ['Friend', 'Search', 'Advert']},
+                {'text': 'Which features do you use?', 'question_type': 'checkbox', 'options': ['Reports', 'Export', 'API']},
+                {'text': 'How old are you in years?', 'question_type': 'number'},
+            ],
+        }, owner)
+        radio, checkbox, number = survey.questions.prefetch_related('options')
+        radio_options = [option.id for option in radio.options.all()]
+        checkbox_options = [option.id for option in checkbox.options.all()]
+
+        now = timezone.now()
+        classes, weights = zip(*CLIENT_WEIGHTS.items())
+        started = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            count = min(batch_size, total - offset)
+            responses = Response.objects.bulk_create([
+                Response(survey=survey, is_complete=True, client_class=client_class)
+                for client_class in random.choices(classes, weights, k=count)
+            ])
+            # submitted_at is auto_now_add; spread the responses over a year.
+            for response in responses:
+                response.submitted_at = now - timedelta(minutes=random.randrange(365 * 24 * 60))
+            Response.objects.bulk_update(responses, ['submitted_at'])
+
+            answers, selections = [], []
+            for response in responses:
+                answers.append(Answer(response=response, question=radio))
+                selections.append([random.choice(radio_options)])
+                answers.append(Answer(response=response, question=checkbox))
+                selections.append(random.sample(checkbox_options, random.randint(1, 2)))
+                answers.append(Answer(response=response, question=number, numeric_answer=random.randint(16, 80)))
+                selections.append([])
+            Answer.objects.bulk_create(answers)
+            SelectedOption.objects.bulk_create([
+                SelectedOption(answer_id=answer.id, option_id=option_id)
+                for answer, option_ids in zip(answers, selections)
+                for option_id in option_ids
+            ])
+        self.stdout.write(f"Seeded {total} responses in {time.perf_counter() - started:.1f}s")
+        self.radio_options = radio_options
+        return survey
+
+    def measure(self, survey, explain):
+        today = timezone.localdate()
+        segments = [
+            ('all responses', Segment()),
+            ('last 30 days', Segment(since=today - timedelta(days=30))),
+            ('one week, a year ago', Segment(since=today - timedelta(days=360), until=today - timedelta(days=353))),
+            ('mobile', Segment(client_class='mobile')),
+            ('answered "Friend"', Segment(option=survey.questions.first().options.first())),
+            ('tablet, last 90 days, "Search"', Segment(
+                since=today - timedelta(days=90), client_class='tablet',
+                option=survey.questions.first().options.all()[1],
+            )),
+        ]
+        self.stdout.write(f"{'segment':<34}{'responses':>10}{'queries':>9}{'seconds':>10}")
+        for label, segment in segments:
+            responses = segment.responses(survey) if segment else None
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                compute_results(survey, include_answers=False, responses=responses)
+                elapsed = time.perf_counter() - started
+            matched = responses.count() if segment else survey.responses.count()
+            self.stdout.write(f"{label:<34}{matched:>10}{len(queries):>9}{elapsed:>10.3f}")
+            if explain and segment:
+                totals = Answer.objects.filter(question__survey=survey, response__in=responses).values('question')
+                self.stdout.write(totals.explain())
@@ -0,0 +1,97 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from surveys.transfer import import_survey
+
+WRITE_RE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+PROFILES = {
+    'database sessions': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.session.SessionStorage',
+    },
+    'default (settings.py)': {},
+    'performance profile': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def count_writes(counter):
+    def wrapper(execute, sql, params, many, context):
+        match = WRITE_RE.match(sql)
+        if match:
+            counter[match.group(2)] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+class Command(BaseCommand):
+    help = (
+        "Count database writes per anonymous survey submission (GET the form, "
+        "POST it, follow the redirect) under different session/message "
+        "settings. Everything written is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['submissions'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, submissions):
+        owner, _ = get_user_model().objects.get_or_create(
+            username='benchmark-writes', defaults={'email': 'benchmark-writes@example.com'}
+        )
+        survey = import_survey({
+            'title': 'Write benchmark',
+            'questions': [
+                {'text': 'Benchmark question one', 'question_type': 'radio', 'options': ['Yes', 'No']},
+                {'text': 'Benchmark question two', 'question_type': 'text'},
+            ],
+        }, owner)
+        radio, text = survey.questions.prefetch_related('options')
+        data = {
+            f'question_{radio.id}': radio.options.all()[0].id,
+            f'question_{text.id}': 'benchmark',
+        }
+        url = reverse('surveys:survey_detail', args=[survey.id])
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+
+        for name, overrides in PROFILES.items():
+            counter = Counter()
+            with override_settings(ALLOWED_HOSTS=allowed_hosts, **overrides), count_writes(counter):
+                for _ in range(submissions):
+                    client = Client()  # a fresh anonymous respondent
+                    client.get(url)
+                    client.post(url, data, follow=True)
+
+            total = sum(counter.values())
+            sessions = counter.get('django_session', 0)
+            self.stdout.write(
+                f"{name:24} {total / submissions:5.1f} writes/submission "
+                f"({sessions / submissions:.1f} to django_session)"
+            )
+            for table, count in sorted(counter.items()):
+                self.stdout.write(f"    {table:40} {count / submissions:.1f}")
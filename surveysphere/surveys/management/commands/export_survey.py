@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.models import Survey, SurveyVersion
+from surveys.transfer import FORMATS, dump_document, export_survey
+
+
+class Command(BaseCommand):
+    help = "Write a survey with its questions and options as a JSON or YAML document"
+
+    def add_arguments(self, parser):
+        parser.add_argument('survey_id', type=int)
+        parser.add_argument('--format', choices=FORMATS, default='json')
+        # --version is taken by Django itself.
+        parser.add_argument('--survey-version', type=int, help="Export this published version instead of the draft")
+        parser.add_argument('-o', '--output', help="File to write instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            survey = Survey.objects.get(id=options['survey_id'])
+        except Survey.DoesNotExist:
+            raise CommandError(f"Survey {options['survey_id']} does not exist.")
+        version = None
+        if options['survey_version'] is not None:
+            try:
+                version = survey.versions.get(number=options['survey_version'])
+            except SurveyVersion.DoesNotExist:
+                raise CommandError(f"Survey {survey.id} has no version {options['survey_version']}.")
+
+        document = dump_document(export_survey(survey, version), options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(document)
+        else:
+            self.stdout.write(document)
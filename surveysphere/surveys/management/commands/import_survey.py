@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from surveys.transfer import FORMATS, import_survey, load_document
+
+
+class Command(BaseCommand):
+    help = "Create a survey with its questions and options from a JSON or YAML file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Survey document to import")
+        parser.add_argument('--owner', required=True, help="Username of the survey owner")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or ('yaml' if path.suffix in ('.yaml', '.yml') else 'json')
+
+        try:
+            owner = get_user_model().objects.get(username=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named '{options['owner']}'.")
+
+        try:
+            survey = import_survey(load_document(path.read_text(encoding='utf-8'), fmt), owner)
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError("\n".join(e.messages))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported survey {survey.id} '{survey.title}' with {survey.questions.count()} questions."
+        ))
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STARTUP_CODE = """
+import time
+started = time.perf_counter()
+import {module}
+{first_request}
+print(f"{{(time.perf_counter() - started) * 1000:.1f}}")
+"""
+
+FIRST_REQUEST_CODE = """
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+
+def parse_importtime(stderr):
+    """Yield (self_us, cumulative_us, module) from ``-X importtime`` output"""
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        yield int(self_us), int(cumulative_us), name.strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the WSGI or ASGI application in a fresh interpreter under "
+        "'python -X importtime' and report the slowest imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--first-request', action='store_true',
+                            help="Also load the URLconf, as the first request would")
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+
+    def handle(self, *args, **options):
+        module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        if options['target'] == 'asgi':
+            module = module.rsplit('.', 1)[0] + '.asgi'
+
+        code = STARTUP_CODE.format(
+            module=module,
+            first_request=FIRST_REQUEST_CODE if options['first_request'] else '',
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE
+        ))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr[-2000:])
+
+        imports = list(parse_importtime(result.stderr))
+        key = 1 if options['sort'] == 'cumulative' else 0
+        imports.sort(key=lambda row: row[key], reverse=True)
+
+        self.stdout.write(
+            f"{module}: {len(imports)} modules imported, "
+            f"startup took {result.stdout.strip().splitlines()[-1]}ms"
+        )
+        self.stdout.write(f"{'self ms':>9} {'cumul ms':>9}  module")
+        for self_us, cumulative_us, name in imports[:options['top']]:
+            self.stdout.write(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {name}")
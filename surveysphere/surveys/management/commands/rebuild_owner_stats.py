@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from surveys.models import OwnerStats, OwnerHourlyResponses
+
+
+class Command(BaseCommand):
+    help = "Recompute per-owner dashboard stats and prune hourly buckets older than a day"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help="Only rebuild this username")
+        parser.add_argument('--prune-only', action='store_true', help="Only delete stale hourly buckets")
+
+    def handle(self, *args, **options):
+        # Owners receiving responses prune their own buckets; this catches the rest.
+        cutoff = timezone.now() - timedelta(hours=OwnerHourlyResponses.KEEP_HOURS)
+        pruned, _ = OwnerHourlyResponses.objects.filter(hour__lt=cutoff).delete()
+        self.stdout.write(f"Pruned {pruned} hourly buckets.")
+        if options['prune_only']:
+            return
+
+        owners = get_user_model().objects.filter(surveys__isnull=False).distinct()
+        if options['owner']:
+            owners = owners.filter(username=options['owner'])
+
+        rebuilt = 0
+        for owner_id in owners.values_list('pk', flat=True).iterator():
+            OwnerStats.rebuild(owner_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} owners."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from surveys.models import Survey, ResponseReservoir
+
+
+class Command(BaseCommand):
+    help = "Draw fresh response samples used for approximate results (run once for surveys that predate sampling)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int, help="Only rebuild this survey id")
+        parser.add_argument('--min-responses', type=int, default=0,
+                            help="Skip surveys with fewer responses than this")
+
+    def handle(self, *args, **options):
+        surveys = Survey.objects.all()
+        if options['survey']:
+            surveys = surveys.filter(id=options['survey'])
+
+        rebuilt = 0
+        for survey in surveys.with_counts().only('id').iterator():
+            if survey.response_total < options['min_responses']:
+                continue
+            reservoir = ResponseReservoir.rebuild(survey.id)
+            rebuilt += 1
+            self.stdout.write(f"Survey {survey.id}: sampled {reservoir.samples.count()} of {reservoir.seen} responses.")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt samples for {rebuilt} surveys."))
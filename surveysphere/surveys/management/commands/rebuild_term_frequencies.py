@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from surveys.models import Question
+from surveys.text import TEXT_TYPES, prune_terms, rebuild_terms
+
+
+class Command(BaseCommand):
+    help = "Recount word and phrase frequencies of text answers, or prune their long tail"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int, help="Only this survey id")
+        parser.add_argument('--question', type=int, help="Only this question id")
+        parser.add_argument('--prune-only', action='store_true',
+                            help="Only drop terms beyond SURVEYS_TEXT_MAX_TERMS per question")
+
+    def handle(self, *args, **options):
+        questions = Question.objects.filter(question_type__in=TEXT_TYPES, survey__deleted_at__isnull=True)
+        if options['survey']:
+            questions = questions.filter(survey_id=options['survey'])
+        if options['question']:
+            questions = questions.filter(id=options['question'])
+
+        count = 0
+        for question_id in questions.order_by('id').values_list('id', flat=True).iterator():
+            if options['prune_only']:
+                self.stdout.write(f"Question {question_id}: pruned {prune_terms(question_id)} terms.")
+            else:
+                rebuild_terms(question_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} text questions."))
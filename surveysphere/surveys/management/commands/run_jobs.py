@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from surveys.jobs import autodiscover, claim, run_job
+from surveys.models import Job
+from surveys.worker import init_process, run_in_process
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (exports, exact results, rebuilds, deletions)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=0,
+                            help="Run jobs in a pool of this many processes, for CPU-bound work")
+        parser.add_argument('--kind', action='append', dest='kinds', help="Only run jobs of this kind (repeatable)")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        autodiscover()
+        try:
+            if options['processes'] > 0:
+                self._run_pool(options)
+            else:
+                self._run_inline(options)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
+
+    def _report(self, job, outcome):
+        style = self.style.SUCCESS if outcome == 'done' else self.style.ERROR
+        self.stdout.write(style(f"{job.kind} #{job.pk}: {outcome}"))
+
+    def _run_inline(self, options):
+        while True:
+            job = claim(options['kinds'])
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            self._report(job, run_job(job.pk))
+
+    def _run_pool(self, options):
+        # Connections must not be shared with child processes.
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['processes'],
+            mp_context=get_context('spawn'),
+            initializer=init_process,
+        )
+        running = {}
+        with pool:
+            while True:
+                while len(running) < options['processes']:
+                    job = claim(options['kinds'])
+                    if job is None:
+                        break
+                    running[pool.submit(run_in_process, job.pk)] = job
+
+                if not running:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+
+                finished, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception as e:  # the child process itself died
+                        outcome = f"failed ({e})"
+                        Job.objects.filter(pk=job.pk, status='running', started_at=job.started_at).update(
+                            status='failed', error=outcome, finished_at=timezone.now()
+                        )
+                    self._report(job, outcome)
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0001_initial'),
+        ('users', '0003_remove_customuser_dob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerStats',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='survey_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('survey_count', models.PositiveIntegerField(default=0)),
+                ('total_responses', models.PositiveBigIntegerField(default=0)),
+                ('last_response_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Owner stats',
+                'verbose_name_plural': 'Owner stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='OwnerHourlyResponses',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_responses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('owner', 'hour')},
+            },
+        ),
+    ]
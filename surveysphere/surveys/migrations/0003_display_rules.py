@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0002_owner_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisplayRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operator', models.CharField(choices=[('equals', 'Is'), ('not_equals', 'Is not'), ('answered', 'Is answered')], default='equals', max_length=20)),
+                ('value', models.CharField(blank=True, max_length=200)),
+                ('option', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveys.option')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='display_rules', to='surveys.question')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependent_rules', to='surveys.question')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
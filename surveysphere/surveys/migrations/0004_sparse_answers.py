@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:53
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def compact_empty_answers(apps, schema_editor):
+    """Replace empty Answer rows with one Response.skipped row each"""
+    Answer = apps.get_model('surveys', 'Answer')
+    Response = apps.get_model('surveys', 'Response')
+    SkippedQuestion = Response.skipped.through
+    empty = Answer.objects.filter(
+        text_answer='', numeric_answer__isnull=True, selected_options__isnull=True
+    ).order_by('id')
+
+    while True:
+        rows = list(empty.values_list('id', 'response_id', 'question_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        SkippedQuestion.objects.bulk_create([
+            SkippedQuestion(response_id=response_id, question_id=question_id)
+            for _, response_id, question_id in rows
+        ], ignore_conflicts=True)
+        Answer.objects.filter(id__in=[answer_id for answer_id, _, _ in rows]).delete()
+
+
+def restore_empty_answers(apps, schema_editor):
+    Answer = apps.get_model('surveys', 'Answer')
+    Response = apps.get_model('surveys', 'Response')
+    SkippedQuestion = Response.skipped.through
+    skipped = SkippedQuestion.objects.order_by('id')
+
+    while True:
+        rows = list(skipped.values_list('id', 'response_id', 'question_id')[:BATCH_SIZE])
+        if not rows:
+            break
+        Answer.objects.bulk_create([
+            Answer(response_id=response_id, question_id=question_id)
+            for _, response_id, question_id in rows
+        ])
+        SkippedQuestion.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0003_display_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='skipped',
+            field=models.ManyToManyField(blank=True, related_name='+', to='surveys.question'),
+        ),
+        migrations.RunPython(compact_empty_answers, restore_empty_answers),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0004_sparse_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseReservoir',
+            fields=[
+                ('survey', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reservoir', serialize=False, to='surveys.survey')),
+                ('seen', models.PositiveBigIntegerField(default=0)),
+                ('ready', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResultsSnapshot',
+            fields=[
+                ('survey', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='results_snapshot', serialize=False, to='surveys.survey')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('response_count', models.PositiveBigIntegerField(default=0)),
+                ('results', models.JSONField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResponseSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveIntegerField()),
+                ('reservoir', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='surveys.responsereservoir')),
+                ('response', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='surveys.response')),
+            ],
+            options={
+                'unique_together': {('reservoir', 'slot')},
+            },
+        ),
+    ]
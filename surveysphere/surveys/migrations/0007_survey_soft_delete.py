@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0006_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0007_survey_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermFrequency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('words', models.PositiveSmallIntegerField(default=1)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_frequencies', to='surveys.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', 'words', '-count'], name='surveys_ter_questio_b2ca36_idx')],
+                'unique_together': {('question', 'term')},
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:02
+
+import re
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# surveys.segments.classify_user_agent as of this migration: later changes
+# to the classifier must not change what this migration does.
+_BOT_RE = re.compile(r'bot|crawl|spider|slurp|curl|wget|python|java/|okhttp|httpclient|postman', re.I)
+_TABLET_RE = re.compile(r'ipad|tablet|kindle|silk|playbook', re.I)
+_MOBILE_RE = re.compile(r'mobi|iphone|ipod|android|windows phone|blackberry|opera mini', re.I)
+_DESKTOP_RE = re.compile(r'windows|macintosh|mac os x|x11|linux|cros', re.I)
+
+
+def classify_user_agent(user_agent):
+    if not user_agent:
+        return 'unknown'
+    if _BOT_RE.search(user_agent):
+        return 'bot'
+    if _TABLET_RE.search(user_agent) or ('android' in user_agent.lower() and 'mobile' not in user_agent.lower()):
+        return 'tablet'
+    if _MOBILE_RE.search(user_agent):
+        return 'mobile'
+    if _DESKTOP_RE.search(user_agent):
+        return 'desktop'
+    return 'unknown'
+
+
+def classify_existing_responses(apps, schema_editor):
+    """One UPDATE per device class, matching on the distinct user agents"""
+    Response = apps.get_model('surveys', 'Response')
+    by_class = defaultdict(list)
+    user_agents = Response.objects.exclude(user_agent='').values_list('user_agent', flat=True).distinct()
+    for user_agent in user_agents.iterator():
+        by_class[classify_user_agent(user_agent)].append(user_agent)
+
+    for client_class, agents in by_class.items():
+        if client_class == 'unknown':
+            continue
+        for start in range(0, len(agents), 500):
+            Response.objects.filter(user_agent__in=agents[start:start + 500]).update(client_class=client_class)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0008_term_frequencies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='client_class',
+            field=models.CharField(choices=[('desktop', 'Desktop'), ('mobile', 'Mobile'), ('tablet', 'Tablet'), ('bot', 'Bot / script'), ('unknown', 'Unknown')], default='unknown', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['survey', 'submitted_at'], name='surveys_res_survey__1681e4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['survey', 'client_class'], name='surveys_res_survey__4239d7_idx'),
+        ),
+        migrations.RunPython(classify_existing_responses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0009_response_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TimingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visit', models.CharField(max_length=32)),
+                ('kind', models.CharField(choices=[('view', 'Opened the survey'), ('dwell', 'Time on a question'), ('abandon', 'Left without submitting'), ('submit', 'Submitted')], max_length=10)),
+                ('dwell_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('question', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='surveys.question')),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timing_events', to='surveys.survey')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['survey', 'kind', 'question'], name='surveys_tim_survey__1fd063_idx'),
+                    models.Index(fields=['survey', 'id'], name='surveys_tim_survey__9de2ee_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def build_document(questions, rules):
+    """surveys.versions.build_document as of this migration, which must not follow later changes to it"""
+    show_if = {}
+    for rule in rules:
+        expected = str(rule.option_id) if rule.option_id else rule.value
+        show_if.setdefault(rule.question_id, []).append([rule.source_id, rule.operator, expected])
+
+    return {
+        'questions': [
+            {
+                'id': question.id,
+                'text': question.text,
+                'question_type': question.question_type,
+                'is_required': question.is_required,
+                'help_text': question.help_text,
+                'order': question.order,
+                'options': [
+                    {'id': option.id, 'text': option.text, 'order': option.order}
+                    for option in question.options.all()
+                ],
+                'show_if': show_if.get(question.id, []),
+            }
+            for question in questions
+        ],
+    }
+
+
+def pin_responses(Response, survey, version):
+    """Point the survey's responses at ``version``, one id range of BATCH_SIZE responses at a time"""
+    responses = Response.objects.filter(survey=survey).order_by('id')
+    last = 0
+    while True:
+        batch = responses.filter(id__gt=last)
+        upper = next(iter(batch.values_list('id', flat=True)[BATCH_SIZE - 1:BATCH_SIZE]), None)
+        if upper is None:
+            batch.update(version=version)
+            return
+        batch.filter(id__lte=upper).update(version=version)
+        last = upper
+
+
+def publish_existing_surveys(apps, schema_editor):
+    """Every live survey was being served from its rows: publish them as version 1"""
+    Survey = apps.get_model('surveys', 'Survey')
+    SurveyVersion = apps.get_model('surveys', 'SurveyVersion')
+    VersionQuestion = apps.get_model('surveys', 'VersionQuestion')
+    VersionOption = apps.get_model('surveys', 'VersionOption')
+    DisplayRule = apps.get_model('surveys', 'DisplayRule')
+    Response = apps.get_model('surveys', 'Response')
+
+    for survey in Survey.objects.filter(deleted_at__isnull=True).iterator():
+        document = build_document(
+            survey.questions.prefetch_related('options'),
+            DisplayRule.objects.filter(question__survey=survey).order_by('id'),
+        )
+        version = SurveyVersion.objects.create(survey=survey, number=1, published_at=survey.updated_at,
+                                               document=document)
+        VersionQuestion.objects.bulk_create([
+            VersionQuestion(version=version, question_id=question['id']) for question in document['questions']
+        ])
+        VersionOption.objects.bulk_create([
+            VersionOption(version=version, option_id=option['id'])
+            for question in document['questions'] for option in question['options']
+        ])
+        Survey.objects.filter(pk=survey.pk).update(published_version=version)
+        pin_responses(Response, survey, version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0010_response_timing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SurveyVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('published_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('document', models.JSONField()),
+                ('published_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='surveys.survey')),
+            ],
+            options={
+                'ordering': ['survey', '-number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='responses', to='surveys.surveyversion'),
+        ),
+        migrations.AddField(
+            model_name='resultssnapshot',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='surveys.surveyversion'),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='published_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='surveys.surveyversion'),
+        ),
+        migrations.CreateModel(
+            name='VersionOption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='surveys.option')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.surveyversion')),
+            ],
+            options={
+                'unique_together': {('version', 'option')},
+            },
+        ),
+        migrations.AddField(
+            model_name='surveyversion',
+            name='options',
+            field=models.ManyToManyField(related_name='versions', through='surveys.VersionOption', to='surveys.option'),
+        ),
+        migrations.CreateModel(
+            name='VersionQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='surveys.question')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.surveyversion')),
+            ],
+            options={
+                'unique_together': {('version', 'question')},
+            },
+        ),
+        migrations.AddField(
+            model_name='surveyversion',
+            name='questions',
+            field=models.ManyToManyField(related_name='versions', through='surveys.VersionQuestion', to='surveys.question'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='surveyversion',
+            unique_together={('survey', 'number')},
+        ),
+        migrations.RunPython(publish_existing_surveys, migrations.RunPython.noop),
+    ]
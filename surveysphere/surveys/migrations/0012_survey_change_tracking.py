@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0011_survey_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='responses_deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='survey',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
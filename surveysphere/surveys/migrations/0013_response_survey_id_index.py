@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0012_survey_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['survey', 'id'], name='surveys_res_survey__8fbf4c_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def split_by_version(apps, schema_editor):
+    """
+    Tallies so far counted the answers to every version together. A survey
+    published once has only that version's; the others' are dropped and
+    recounted per version by a queued rebuild_term_frequencies job.
+    """
+    TermFrequency = apps.get_model('surveys', 'TermFrequency')
+    SurveyVersion = apps.get_model('surveys', 'SurveyVersion')
+    Job = apps.get_model('surveys', 'Job')
+    survey_ids = TermFrequency.objects.order_by().values_list('question__survey_id', flat=True).distinct()
+
+    for survey_id in list(survey_ids):
+        version_ids = list(SurveyVersion.objects.filter(survey_id=survey_id).values_list('id', flat=True)[:2])
+        tallies = TermFrequency.objects.filter(question__survey_id=survey_id)
+        if len(version_ids) == 1:
+            tallies.update(version_id=version_ids[0])
+            continue
+        tallies.delete()
+        if version_ids:
+            Job.objects.create(kind='rebuild_term_frequencies', params={'survey_id': survey_id})
+
+
+def merge_versions(apps, schema_editor):
+    TermFrequency = apps.get_model('surveys', 'TermFrequency')
+    shared = TermFrequency.objects.order_by().values('question_id', 'term').annotate(
+        total=Sum('count'), kept=Min('id'), rows=Count('id')
+    ).filter(rows__gt=1)
+
+    for row in list(shared):
+        TermFrequency.objects.filter(id=row['kept']).update(count=row['total'])
+        TermFrequency.objects.filter(question_id=row['question_id'], term=row['term']).exclude(
+            id=row['kept']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0013_response_survey_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='termfrequency',
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='termfrequency',
+            name='surveys_ter_questio_b2ca36_idx',
+        ),
+        migrations.AddField(
+            model_name='termfrequency',
+            name='version',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='term_frequencies', to='surveys.surveyversion'),
+        ),
+        # The key is completed in 0015: PostgreSQL cannot alter a table with
+        # foreign key checks still pending from this update.
+        migrations.RunPython(split_by_version, merge_versions),
+    ]
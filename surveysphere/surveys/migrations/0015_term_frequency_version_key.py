@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0014_term_frequency_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='termfrequency',
+            name='version',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_frequencies', to='surveys.surveyversion'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='termfrequency',
+            unique_together={('question', 'version', 'term')},
+        ),
+        migrations.AddIndex(
+            model_name='termfrequency',
+            index=models.Index(fields=['question', 'version', 'words', '-count'], name='surveys_ter_questio_9d97d0_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 10000
+
+
+def tag_single_version_events(apps, schema_editor):
+    """
+    Events so far were not tagged with a version. Those of a survey published
+    once were all served that version; other surveys' stay untagged and only
+    count towards the all-versions figures.
+    """
+    SurveyVersion = apps.get_model('surveys', 'SurveyVersion')
+    TimingEvent = apps.get_model('surveys', 'TimingEvent')
+    single = SurveyVersion.objects.order_by().values('survey_id').annotate(
+        versions=models.Count('id'), version_id=models.Min('id')
+    ).filter(versions=1)
+
+    for row in list(single):
+        events = TimingEvent.objects.filter(survey_id=row['survey_id'], version__isnull=True).order_by('id')
+        last = 0
+        while True:
+            batch = events.filter(id__gt=last)
+            upper = next(iter(batch.values_list('id', flat=True)[BATCH_SIZE - 1:BATCH_SIZE]), None)
+            if upper is None:
+                batch.update(version_id=row['version_id'])
+                break
+            batch.filter(id__lte=upper).update(version_id=row['version_id'])
+            last = upper
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0015_term_frequency_version_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timingevent',
+            name='surveys_tim_survey__1fd063_idx',
+        ),
+        migrations.AddField(
+            model_name='timingevent',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='surveys.surveyversion'),
+        ),
+        migrations.AddIndex(
+            model_name='timingevent',
+            index=models.Index(fields=['survey', 'version', 'kind', 'question'], name='surveys_tim_survey__da0c49_idx'),
+        ),
+        migrations.RunPython(tag_single_version_events, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,55 @@
-from django.db import models
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncHour
+from django.utils import timezone
 from users.models import CustomUser
 from django.core.exceptions import ValidationError
 
 
+class SurveyQuerySet(models.QuerySet):
+    def with_counts(self):
+        """
+        Annotate question_total (questions in the published version) and
+        response_total without per-row queries
+        """
+        def count_of(rows, group):
+            return Coalesce(Subquery(
+                rows.order_by().values(group).annotate(total=models.Count('pk')).values('total')
+            ), 0)
+        return self.annotate(
+            question_total=count_of(VersionQuestion.objects.filter(version=OuterRef('published_version')), 'version'),
+            response_total=count_of(Response.objects.filter(survey=OuterRef('pk')), 'survey'),
+        )
+
+
+class SurveyManager(models.Manager.from_queryset(SurveyQuerySet)):
+    """Hides surveys that were deleted and are waiting to be purged"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Survey(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="surveys")
+    # Bumped whenever responses are deleted, which no "latest response" notices.
+    responses_deleted_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    # Set when the survey is deleted; its rows are then purged in the background.
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # What respondents get; the survey's own questions are the editable draft.
+    published_version = models.ForeignKey(
+        'SurveyVersion', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+"
+    )
+
+    objects = SurveyManager()
+    all_objects = SurveyQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -18,6 +58,18 @@ class Survey(models.Model):
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            OwnerStats.record_survey(self.created_by_id, 1)
+
+    def delete(self, *args, **kwargs):
+        owner_id = self.created_by_id
+        result = super().delete(*args, **kwargs)
+        OwnerStats.rebuild(owner_id)
+        return result
     
     @property
     def response_count(self):
@@ -67,22 +119,135 @@ class Option(models.Model):
         return f"{self.question.text[:30]} - {self.text}"
 
 
+class DisplayRule(models.Model):
+    """
+    Show ``question`` only when an earlier question, ``source``, was answered
+    a certain way. A question with several rules is shown when all of them hold.
+    """
+    OPERATORS = (
+        ('equals', 'Is'),
+        ('not_equals', 'Is not'),
+        ('answered', 'Is answered'),
+    )
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="display_rules")
+    source = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="dependent_rules")
+    operator = models.CharField(max_length=20, choices=OPERATORS, default='equals')
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, null=True, blank=True)  # for choice questions
+    value = models.CharField(max_length=200, blank=True)  # for everything else
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        expected = self.option.text if self.option_id else self.value
+        return f"Show '{self.question.text[:30]}' if '{self.source.text[:30]}' {self.get_operator_display().lower()} {expected}"
+
+    def clean(self):
+        if self.source_id is None or self.question_id is None:
+            # The form reports the missing field itself.
+            return
+        if self.source.survey_id != self.question.survey_id:
+            raise ValidationError("Rules can only depend on questions from the same survey.")
+        if (self.source.order, self.source.id) >= (self.question.order, self.question.id):
+            raise ValidationError("Rules can only depend on earlier questions.")
+        if self.option_id and self.option.question_id != self.source_id:
+            raise ValidationError("The option must belong to the source question.")
+        if self.operator != 'answered' and not self.option_id and not self.value:
+            raise ValidationError("Choose an option or enter a value to compare with.")
+
+    @property
+    def expected(self):
+        return str(self.option_id) if self.option_id else self.value
+
+
+class SurveyVersion(models.Model):
+    """
+    An immutable snapshot of a survey's questions, options and display rules,
+    taken when the survey is published (see versions.py). ``document`` holds
+    their content as published; ``questions`` and ``options`` link the rows
+    it refers to so they cannot be deleted while answers may point at them.
+    """
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name="versions")
+    number = models.PositiveIntegerField()
+    published_at = models.DateTimeField(default=timezone.now)
+    published_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    document = models.JSONField()
+    questions = models.ManyToManyField(Question, through='VersionQuestion', related_name="versions")
+    options = models.ManyToManyField(Option, through='VersionOption', related_name="versions")
+
+    class Meta:
+        ordering = ['survey', '-number']
+        unique_together = ['survey', 'number']
+
+    def __str__(self):
+        return f"{self.survey_id} v{self.number}"
+
+
+class VersionQuestion(models.Model):
+    version = models.ForeignKey(SurveyVersion, on_delete=models.CASCADE)
+    # RESTRICT: a published question goes only when its survey does.
+    question = models.ForeignKey(Question, on_delete=models.RESTRICT)
+
+    class Meta:
+        unique_together = ['version', 'question']
+
+
+class VersionOption(models.Model):
+    version = models.ForeignKey(SurveyVersion, on_delete=models.CASCADE)
+    option = models.ForeignKey(Option, on_delete=models.RESTRICT)
+
+    class Meta:
+        unique_together = ['version', 'option']
+
+
 class Response(models.Model):
+    CLIENT_CLASSES = (
+        ('desktop', 'Desktop'),
+        ('mobile', 'Mobile'),
+        ('tablet', 'Tablet'),
+        ('bot', 'Bot / script'),
+        ('unknown', 'Unknown'),
+    )
+
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name="responses")
     submitted_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
     is_complete = models.BooleanField(default=False)
+    # Questions presented but left empty, when empty answers are not stored
+    # as Answer rows (SURVEYS_SPARSE_ANSWERS).
+    skipped = models.ManyToManyField(Question, blank=True, related_name='+')
+    # Device class parsed from user_agent at submission, for result segments.
+    client_class = models.CharField(max_length=10, choices=CLIENT_CLASSES, default='unknown')
+    # When the respondent opened the form, from the page's timing token.
+    started_at = models.DateTimeField(null=True, blank=True)
+    # The published version that was answered.
+    version = models.ForeignKey(
+        SurveyVersion, on_delete=models.RESTRICT, null=True, blank=True, related_name="responses"
+    )
     
     class Meta:
         ordering = ['-submitted_at']
+        indexes = [
+            models.Index(fields=['survey', 'submitted_at']),
+            models.Index(fields=['survey', 'client_class']),
+            # Newest response of a survey, and those after it (live results).
+            models.Index(fields=['survey', 'id']),
+        ]
 
     def __str__(self):
         return f"Response to {self.survey.title} at {self.submitted_at.strftime('%Y-%m-%d %H:%M')}"
     
     @property
     def completion_time(self):
-        pass
+        if self.started_at is None or self.submitted_at is None:
+            return None
+        return self.submitted_at - self.started_at
+
+    @property
+    def skipped_question_ids(self):
+        return [question.pk for question in self.skipped.all()]
 
 
 class Answer(models.Model):
@@ -129,4 +294,343 @@ class Answer(models.Model):
         elif self.question.question_type == 'number':
             return str(self.numeric_answer) if self.numeric_answer is not None else ""
         else:
-            return self.text_answer
\ No newline at end of file
+            return self.text_answer
+
+
+class OwnerStats(models.Model):
+    """
+    Per-user survey totals, kept current on survey creation and response
+    submission so the owner dashboard never aggregates over responses.
+    """
+    owner = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name="survey_stats")
+    survey_count = models.PositiveIntegerField(default=0)
+    total_responses = models.PositiveBigIntegerField(default=0)
+    last_response_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Owner stats"
+        verbose_name_plural = "Owner stats"
+
+    def __str__(self):
+        return f"Stats for {self.owner_id}"
+
+    @classmethod
+    def _increment(cls, owner_id, **changes):
+        # Update first; only the very first event for an owner pays for the insert.
+        if not cls.objects.filter(owner_id=owner_id).update(**changes):
+            cls.objects.bulk_create([cls(owner_id=owner_id)], ignore_conflicts=True)
+            cls.objects.filter(owner_id=owner_id).update(**changes)
+
+    @classmethod
+    def record_survey(cls, owner_id, count):
+        cls._increment(owner_id, survey_count=models.F('survey_count') + count)
+
+    @classmethod
+    def record_responses(cls, owner_id, count, submitted_at):
+        cls._increment(
+            owner_id,
+            total_responses=models.F('total_responses') + count,
+            last_response_at=submitted_at,
+        )
+        OwnerHourlyResponses.record(owner_id, count, submitted_at)
+
+    @classmethod
+    def rebuild(cls, owner_id):
+        """Recompute an owner's stats from the survey and response tables"""
+        surveys = Survey.objects.filter(created_by_id=owner_id)
+        responses = Response.objects.filter(
+            survey__created_by_id=owner_id, survey__deleted_at__isnull=True
+        ).aggregate(
+            total=models.Count('id'), latest=models.Max('submitted_at')
+        )
+        stats, _ = cls.objects.update_or_create(owner_id=owner_id, defaults={
+            'survey_count': surveys.count(),
+            'total_responses': responses['total'],
+            'last_response_at': responses['latest'],
+        })
+        OwnerHourlyResponses.rebuild(owner_id)
+        return stats
+
+
+class OwnerHourlyResponses(models.Model):
+    """
+    Responses per owner per hour, for rolling "last 24 hours" counts. Buckets
+    older than ``KEEP_HOURS`` are dropped as new ones are opened, so an owner
+    never has more than a day's worth of rows.
+    """
+    KEEP_HOURS = 25
+
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="hourly_responses")
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['owner', 'hour']
+
+    def __str__(self):
+        return f"{self.owner_id} @ {self.hour:%Y-%m-%d %H:00}: {self.count}"
+
+    @classmethod
+    def record(cls, owner_id, count, submitted_at):
+        hour = submitted_at.replace(minute=0, second=0, microsecond=0)
+        bucket = cls.objects.filter(owner_id=owner_id, hour=hour)
+        if not bucket.update(count=models.F('count') + count):
+            cls.objects.bulk_create([cls(owner_id=owner_id, hour=hour)], ignore_conflicts=True)
+            bucket.update(count=models.F('count') + count)
+            # First response of the hour for this owner: prune its stale buckets.
+            cls.objects.filter(owner_id=owner_id, hour__lt=hour - timedelta(hours=cls.KEEP_HOURS)).delete()
+
+    @classmethod
+    def rebuild(cls, owner_id, hours=24):
+        since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        buckets = (
+            Response.objects.filter(survey__created_by_id=owner_id, survey__deleted_at__isnull=True,
+                                    submitted_at__gte=since)
+            .annotate(bucket=TruncHour('submitted_at')).order_by()
+            .values('bucket').annotate(total=models.Count('id'))
+        )
+        cls.objects.filter(owner_id=owner_id).delete()
+        cls.objects.bulk_create([
+            cls(owner_id=owner_id, hour=row['bucket'], count=row['total']) for row in buckets
+        ])
+
+    @classmethod
+    def recent_total(cls, owner_id, now, hours=24):
+        """Responses in the last ``hours`` hours, at hourly granularity"""
+        since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        return cls.objects.filter(owner_id=owner_id, hour__gte=since).aggregate(
+            total=models.Sum('count')
+        )['total'] or 0
+
+
+class ResponseReservoir(models.Model):
+    """
+    A uniform random sample of a survey's responses, kept up to date as
+    responses arrive (reservoir sampling), for approximate results on very
+    large surveys.
+
+    Every survey's responses are counted, but the sample is only drawn once
+    the survey passes ``SURVEYS_APPROXIMATE_RESULTS_AFTER`` responses, by a
+    ``rebuild_response_samples`` job; from then on new responses are offered
+    to it as they are written.
+    """
+    survey = models.OneToOneField(Survey, on_delete=models.CASCADE, primary_key=True, related_name="reservoir")
+    seen = models.PositiveBigIntegerField(default=0)  # responses offered to the sample
+    ready = models.BooleanField(default=False)  # the sample covers every response counted in ``seen``
+
+    def __str__(self):
+        return f"Sample of survey {self.survey_id} ({self.seen} seen)"
+
+    @staticmethod
+    def sample_size():
+        return getattr(settings, 'SURVEYS_RESULTS_SAMPLE_SIZE', 10000)
+
+    @staticmethod
+    def approximate_after():
+        return getattr(settings, 'SURVEYS_APPROXIMATE_RESULTS_AFTER', 100000)
+
+    @classmethod
+    def offer(cls, survey_id, response_ids):
+        """
+        Count newly written responses and, once the survey is sampled,
+        consider them for the sample; call inside their transaction. Returns
+        True when these responses took the survey past the approximation
+        threshold, so its sample should now be drawn.
+        """
+        added = len(response_ids)
+        if not added:
+            return False
+        size, after = cls.sample_size(), cls.approximate_after()
+        reservoir = cls.objects.filter(survey_id=survey_id)
+        # Small surveys, nearly all of them, take one blind increment and no sampling.
+        if after and reservoir.filter(seen__lte=after - added).update(seen=F('seen') + added):
+            return False
+        if not reservoir.update(seen=F('seen') + added):
+            cls.objects.get_or_create(survey_id=survey_id)
+            reservoir.update(seen=F('seen') + added)
+        if not size or not after:
+            return False
+
+        # Read back under the row lock our UPDATE holds, so ``seen`` is exact.
+        seen, ready = reservoir.values_list('seen', 'ready').get()
+        if not ready:
+            return seen - added <= after < seen
+
+        slots = {}
+        for position, response_id in enumerate(response_ids, seen - added + 1):
+            slot = position - 1 if position <= size else random.randrange(position)
+            if slot < size:
+                slots[slot] = response_id
+
+        if slots:
+            ResponseSample.objects.filter(reservoir_id=survey_id, slot__in=list(slots)).delete()
+            ResponseSample.objects.bulk_create([
+                ResponseSample(reservoir_id=survey_id, slot=slot, response_id=response_id)
+                for slot, response_id in slots.items()
+            ])
+        return False
+
+    @classmethod
+    def rebuild(cls, survey_id):
+        """Draw a fresh sample from all of the survey's responses"""
+        size = cls.sample_size()
+        with transaction.atomic():
+            cls.objects.filter(survey_id=survey_id).delete()
+            reservoir = cls.objects.create(survey_id=survey_id)
+            response_ids = Response.objects.filter(survey_id=survey_id).order_by('id').values_list('id', flat=True)
+            sample = []
+            for response_id in response_ids.iterator(chunk_size=2000):
+                reservoir.seen += 1
+                if reservoir.seen <= size:
+                    sample.append(response_id)
+                else:
+                    slot = random.randrange(reservoir.seen)
+                    if slot < size:
+                        sample[slot] = response_id
+            ResponseSample.objects.bulk_create([
+                ResponseSample(reservoir=reservoir, slot=slot, response_id=response_id)
+                for slot, response_id in enumerate(sample)
+            ], batch_size=2000)
+            # Below the threshold new responses are only counted, so the
+            # sample would fall behind; it is drawn again on crossing.
+            reservoir.ready = reservoir.seen > cls.approximate_after()
+            reservoir.save(update_fields=['seen', 'ready'])
+        return reservoir
+
+
+class ResponseSample(models.Model):
+    reservoir = models.ForeignKey(ResponseReservoir, on_delete=models.CASCADE, related_name="samples")
+    slot = models.PositiveIntegerField()
+    response = models.OneToOneField(Response, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        unique_together = ['reservoir', 'slot']
+
+    def __str__(self):
+        return f"Slot {self.slot} of survey {self.reservoir_id}: response {self.response_id}"
+
+
+class ResultsSnapshot(models.Model):
+    """Exact results of a large survey, computed in the background"""
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
+    survey = models.OneToOneField(Survey, on_delete=models.CASCADE, primary_key=True, related_name="results_snapshot")
+    # The published version the results are for.
+    version = models.ForeignKey(SurveyVersion, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    requested_at = models.DateTimeField(default=timezone.now)
+    computed_at = models.DateTimeField(null=True, blank=True)
+    response_count = models.PositiveBigIntegerField(default=0)
+    results = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Results of survey {self.survey_id} ({self.status})"
+
+
+class Job(models.Model):
+    """A unit of background work, run by ``manage.py run_jobs`` (see jobs.py)"""
+    STATUSES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    progress = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="jobs")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    def report(self, progress, total=None):
+        """Record progress, unless the job has since been claimed again"""
+        self.progress = progress
+        changes = {'progress': progress, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            self.total = changes['total'] = total
+        Job.objects.filter(pk=self.pk, status='running', started_at=self.started_at).update(**changes)
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class TermFrequency(models.Model):
+    """
+    How many answers to a text question, from respondents to one published
+    version, use a word (or two-word phrase)
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name="term_frequencies")
+    version = models.ForeignKey(SurveyVersion, on_delete=models.CASCADE, related_name="term_frequencies")
+    term = models.CharField(max_length=100)
+    words = models.PositiveSmallIntegerField(default=1)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['question', 'version', 'term']
+        indexes = [models.Index(fields=['question', 'version', 'words', '-count'])]
+
+    def __str__(self):
+        return f"{self.term}: {self.count}"
+
+
+class TimingEvent(models.Model):
+    """
+    One respondent timing event from the survey page, keyed by visit (one
+    page view). Append-only and written in bulk by surveys/timing.py.
+    """
+    KINDS = (
+        ('view', 'Opened the survey'),
+        ('dwell', 'Time on a question'),
+        ('abandon', 'Left without submitting'),
+        ('submit', 'Submitted'),
+    )
+
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name="timing_events")
+    # The published version the page was serving; null for events recorded
+    # before surveys had versions.
+    version = models.ForeignKey(SurveyVersion, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    visit = models.CharField(max_length=32)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    question = models.ForeignKey(Question, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    dwell_ms = models.PositiveIntegerField(null=True, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['survey', 'version', 'kind', 'question']),
+            # The results page validator: the survey's latest event.
+            models.Index(fields=['survey', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} on survey {self.survey_id} ({self.visit})"
@@ -0,0 +1,120 @@
+"""
+Sparse ordering for questions and options.
+
+Items are ordered by gapped integer keys (multiples of ``ORDER_GAP``), so
+inserting or moving an item only rewrites that item's key: it takes the
+midpoint between its new neighbours. Only when two neighbours have run out
+of room is the whole sibling list renumbered, in two bulk statements.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+
+ORDER_GAP = 1024
+
+
+def siblings_of(item):
+    """The queryset an item is ordered within"""
+    model = type(item)
+    if hasattr(item, 'survey_id'):
+        return model.objects.filter(survey_id=item.survey_id)
+    return model.objects.filter(question_id=item.question_id)
+
+
+def next_order(siblings):
+    """Key that places a new item after all of ``siblings``"""
+    last = siblings.aggregate(last=Max('order'))['last']
+    return (last or 0) + ORDER_GAP
+
+
+def rebalance(siblings):
+    """
+    Renumber ``siblings`` to ``ORDER_GAP, 2 * ORDER_GAP, ...`` keeping their
+    current order.
+
+    The keys are unique per parent, so every row is first shifted above both
+    the old and the new key ranges, then written to its final key; neither
+    statement can collide with a row it has not moved yet.
+    """
+    items = list(siblings.order_by('order', 'id').only('id', 'order'))
+    if not items:
+        return
+    offset = max(items[-1].order, len(items) * ORDER_GAP) + ORDER_GAP
+    with transaction.atomic():
+        siblings.update(order=F('order') + offset)
+        for position, item in enumerate(items, 1):
+            item.order = position * ORDER_GAP
+        type(items[0]).objects.bulk_update(items, ['order'])
+
+
+def _neighbours(siblings, item, after):
+    """Keys of the items the moved item should sit between"""
+    others = siblings.exclude(pk=item.pk).order_by('order', 'id')
+    if after is None:
+        lower = None
+        upper = others.values_list('order', flat=True).first()
+    else:
+        lower = after.order
+        upper = others.filter(order__gt=after.order).values_list('order', flat=True).first()
+    return lower, upper
+
+
+def _key_between(lower, upper):
+    lower = 0 if lower is None else lower
+    if upper is None:
+        return lower + ORDER_GAP
+    if upper - lower > 1:
+        return (lower + upper) // 2
+    return None
+
+
+def move(item, after=None):
+    """
+    Place ``item`` directly after ``after`` (a sibling), or first when
+    ``after`` is None. Returns True if the siblings had to be rebalanced.
+    """
+    siblings = siblings_of(item)
+    with transaction.atomic():
+        lower, upper = _neighbours(siblings, item, after)
+        key = _key_between(lower, upper)
+        rebalanced = key is None
+        if rebalanced:
+            rebalance(siblings)
+            if after is not None:
+                after.refresh_from_db(fields=['order'])
+            item.refresh_from_db(fields=['order'])
+            lower, upper = _neighbours(siblings, item, after)
+            key = _key_between(lower, upper)
+        item.order = key
+        item.save(update_fields=['order'])
+    return rebalanced
+
+
+def _slot(siblings, position):
+    """Keys either side of 1-based ``position``, or None when it is past the end"""
+    start = max(position - 2, 0)
+    keys = list(siblings.order_by('order', 'id').values_list('order', flat=True)[start:position])
+    needed = 1 if position == 1 else 2
+    if len(keys) < needed:
+        return None
+    return (None, keys[0]) if position == 1 else (keys[0], keys[1])
+
+
+def insert_at(item, position=None):
+    """
+    Give a new, unsaved ``item`` the key for 1-based ``position`` among its
+    siblings, appending when no position is given or it is past the end.
+    Returns True if the siblings had to be rebalanced.
+    """
+    siblings = siblings_of(item)
+    slot = _slot(siblings, position) if position and position > 0 else None
+    if slot is None:
+        item.order = next_order(siblings)
+        return False
+
+    key = _key_between(*slot)
+    rebalanced = key is None
+    if rebalanced:
+        rebalance(siblings)
+        key = _key_between(*_slot(siblings, position))
+    item.order = key
+    return rebalanced
@@ -0,0 +1,172 @@
+"""
+Aggregated survey results computed with grouped queries.
+
+A survey's results take a fixed number of queries no matter how many
+questions, options or answers it has: one per aggregate, each grouped by
+question or option, instead of one count per option per question.
+Text questions report their most common terms rather than every answer:
+from the stored tallies, or counted from the matching answers when the
+results are filtered.
+Questions a response left empty count towards the question's total whether
+they were stored as an empty Answer or as a ``Response.skipped`` row.
+"""
+from django.db.models import Avg, Count, FloatField, Max, Min, StdDev
+from django.db.models.functions import Cast
+
+from .models import Answer, Response
+from .text import TEXT_TYPES, filtered_top_terms, top_terms
+from .versions import draft_questions, version_questions
+
+CHOICE_TYPES = ('radio', 'checkbox')
+NUMERIC_TYPES = ('number', 'rating')
+SelectedOption = Answer.selected_options.through
+SkippedQuestion = Response.skipped.through
+
+
+def _round(value, digits=2):
+    return round(float(value), digits) if value is not None else None
+
+
+def skipped_counts(survey, questions, responses=None, version=None):
+    """
+    Count, per question, the responses that left it empty without storing an
+    Answer row; one query grouped by question over the skipped-question
+    table's question index.
+    """
+    skipped = SkippedQuestion.objects.filter(question__in=[question.id for question in questions])
+    if version is not None:
+        skipped = skipped.filter(response__version=version)
+    if responses is not None:
+        skipped = skipped.filter(response__in=responses)
+    return dict(skipped.order_by().values_list('question').annotate(count=Count('id')))
+
+
+def compute_results(survey, questions=None, include_answers=True, responses=None, version=None):
+    """
+    Return a list of per-question result dicts for ``survey``.
+
+    ``include_answers`` adds the raw numeric and text answers, which the HTML
+    results page lists; API clients only get the aggregates. ``responses``
+    (a queryset of response ids) restricts the results to those responses,
+    and adds the standard deviation of numeric answers. ``version`` reports
+    on that published version: its questions as published, over the
+    responses pinned to it. Without one the survey's draft questions are
+    used, over every response.
+    """
+    if questions is None:
+        if version is not None:
+            questions = version_questions(version)
+        else:
+            questions = draft_questions(survey)
+    # Types come from ``questions``: a version's may differ from the draft's.
+    question_types = {question.id: question.question_type for question in questions}
+
+    def ids_of(*types):
+        return [question_id for question_id, question_type in question_types.items() if question_type in types]
+
+    answers = Answer.objects.filter(question__survey=survey)
+    selections = SelectedOption.objects.filter(answer__question__survey=survey)
+    if version is not None:
+        answers = answers.filter(response__version=version)
+        selections = selections.filter(answer__response__version=version)
+    if responses is not None:
+        answers = answers.filter(response__in=responses)
+        selections = selections.filter(answer__response__in=responses)
+
+    totals = dict(
+        answers.order_by().values_list('question').annotate(total=Count('id'))
+    )
+    for question_id, skipped in skipped_counts(survey, questions, responses, version).items():
+        totals[question_id] = totals.get(question_id, 0) + skipped
+    option_counts = dict(
+        selections.order_by().values_list('option').annotate(count=Count('id'))
+    )
+
+    numeric_stats = {
+        row['question']: row
+        for row in answers.filter(question__in=ids_of('number'), numeric_answer__isnull=False)
+        .order_by().values('question')
+        .annotate(count=Count('id'), average=Avg('numeric_answer'), stddev=StdDev('numeric_answer', sample=True),
+                  minimum=Min('numeric_answer'), maximum=Max('numeric_answer'))
+    }
+    # Ratings are stored as text ("1".."5"), so aggregate them as numbers.
+    numeric_stats.update({
+        row['question']: row
+        for row in answers.filter(question__in=ids_of('rating')).exclude(text_answer='')
+        .annotate(rating=Cast('text_answer', FloatField()))
+        .order_by().values('question')
+        .annotate(count=Count('id'), average=Avg('rating'), stddev=StdDev('rating', sample=True),
+                  minimum=Min('rating'), maximum=Max('rating'))
+    })
+
+    raw_answers = {}
+    if include_answers:
+        # Text answers are summarised by their term frequencies instead.
+        rows = answers.filter(question__in=ids_of('number', 'rating', 'email')).order_by('id').values_list(
+            'question', 'text_answer', 'numeric_answer'
+        )
+        for question_id, text, number in rows:
+            question_type = question_types[question_id]
+            if question_type == 'number':
+                value = number
+            elif question_type == 'rating':
+                value = int(text) if text.isdigit() else None
+            else:
+                value = text or None
+            if value is not None:
+                raw_answers.setdefault(question_id, []).append(value)
+
+    text_ids = ids_of(*TEXT_TYPES)
+    # The stored tallies are per version; only segments need a recount.
+    if responses is None:
+        terms = top_terms(text_ids, version)
+    else:
+        terms = filtered_top_terms(answers, text_ids)
+
+    results = []
+    for question in questions:
+        total = totals.get(question.id, 0)
+
+        if question.question_type in CHOICE_TYPES:
+            options_data = []
+            for option in question.option_list:
+                count = option_counts.get(option.id, 0)
+                percentage = (count / total * 100) if total > 0 else 0
+                options_data.append({
+                    "id": option.id,
+                    "option": option.text,
+                    "count": count,
+                    "percentage": round(percentage, 2),
+                })
+            result_data = {"options": options_data}
+
+        elif question.question_type in NUMERIC_TYPES:
+            stats = numeric_stats.get(question.id, {})
+            result_data = {
+                "count": stats.get("count", 0),
+                "average": _round(stats.get("average")),
+                "minimum": _round(stats.get("minimum")),
+                "maximum": _round(stats.get("maximum")),
+            }
+            if responses is not None:
+                result_data["stddev"] = _round(stats.get("stddev"), 4)
+            if include_answers:
+                result_data["answers"] = raw_answers.get(question.id, [])
+
+        elif question.question_type in TEXT_TYPES:
+            result_data = terms[question.id]
+
+        else:  # email
+            result_data = {}
+            if include_answers:
+                result_data["answers"] = raw_answers.get(question.id, [])
+
+        results.append({
+            "id": question.id,
+            "question": question.text,
+            "type": question.question_type,
+            "total": total,
+            "results": result_data,
+        })
+
+    return results
@@ -0,0 +1,121 @@
+"""
+Approximate results for very large surveys.
+
+Once a survey has more than ``SURVEYS_APPROXIMATE_RESULTS_AFTER`` responses
+its results page is computed from the survey's ``ResponseReservoir``, a
+uniform random sample of at most ``SURVEYS_RESULTS_SAMPLE_SIZE`` responses
+drawn by a job when the survey crosses that threshold and kept up to date as
+responses are written after it, and shown with 95% confidence
+intervals. Exact results can still be requested: they are computed in the
+background by the job worker into a ``ResultsSnapshot`` and swapped in once
+ready.
+"""
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Survey, ResponseReservoir, ResponseSample, ResultsSnapshot
+from .results import compute_results
+
+Z_95 = 1.96
+
+# A pending computation older than this is assumed lost and may be
+# requested again.
+PENDING_TIMEOUT = timedelta(minutes=30)
+
+
+def large_survey_reservoir(survey):
+    """Return the survey's reservoir if its results should be approximated"""
+    threshold = ResponseReservoir.approximate_after()
+    if not threshold:
+        return None
+    # Until its sample has been drawn a survey's results stay exact.
+    return ResponseReservoir.objects.filter(survey=survey, seen__gt=threshold, ready=True).first()
+
+
+def approximate_results(survey, reservoir, segment=None, version=None):
+    """
+    Estimate ``compute_results(survey, version=version)`` from the reservoir
+    sample, optionally restricted to a Segment.
+
+    Counts are scaled up to the whole survey; option percentages and numeric
+    averages get a ``margin``, the half-width of their 95% confidence
+    interval.
+    """
+    sample = ResponseSample.objects.filter(reservoir=reservoir)
+    sample_size = sample.count()
+    if version is not None:
+        sample = sample.filter(response__version=version)
+    if segment:
+        sample = sample.filter(response__in=segment.responses(survey))
+    segment_size = sample.count() if segment or version is not None else sample_size
+    sample = sample.values('response_id')
+
+    seen = max(reservoir.seen, sample_size)
+    scale = seen / sample_size if sample_size else 0
+    population = round(segment_size * scale)
+    # Finite population correction: a sample of the whole survey is exact.
+    fpc = math.sqrt((population - segment_size) / (population - 1)) if population > 1 else 0
+
+    questions = compute_results(survey, responses=sample, version=version)
+    for question in questions:
+        total = question['total']
+        question['sample_total'] = total
+        question['total'] = round(total * scale)
+        results = question['results']
+
+        for option in results.get('options', []):
+            p = option['count'] / total if total else 0
+            option['count'] = round(option['count'] * scale)
+            option['margin'] = round(Z_95 * math.sqrt(p * (1 - p) / total) * fpc * 100, 2) if total else None
+
+        if 'average' in results:
+            count, stddev = results['count'], results.pop('stddev', None)
+            results['count'] = round(count * scale)
+            results['margin'] = round(Z_95 * stddev / math.sqrt(count) * fpc, 2) if count > 1 and stddev is not None else None
+
+    return {
+        'sample_size': segment_size,
+        'population': population,
+        'confidence': 95,
+        'questions': questions,
+    }
+
+
+def request_exact_results(survey, requested_by=None):
+    """
+    Queue an exact computation of the survey's results, unless one is already
+    running, and return its ResultsSnapshot.
+    """
+    with transaction.atomic():
+        snapshot, created = ResultsSnapshot.objects.select_for_update().get_or_create(survey=survey)
+        if not created and snapshot.status == 'pending' and snapshot.requested_at > timezone.now() - PENDING_TIMEOUT:
+            return snapshot
+        snapshot.status = 'pending'
+        snapshot.requested_at = timezone.now()
+        snapshot.save(update_fields=['status', 'requested_at'])
+        enqueue('exact_results', created_by=requested_by, survey_id=survey.id)
+    return snapshot
+
+
+def compute_exact_results(survey_id):
+    """Compute the full results of a survey's published version into its ResultsSnapshot"""
+    snapshot = ResultsSnapshot.objects.filter(survey_id=survey_id)
+    try:
+        survey = Survey.objects.select_related('published_version').get(id=survey_id)
+        version = survey.published_version
+        response_count = survey.responses.filter(version=version).count()
+        results = compute_results(survey, include_answers=False, version=version)
+        snapshot.update(
+            status='ready',
+            computed_at=timezone.now(),
+            version=version,
+            response_count=response_count,
+            results=results,
+        )
+    except Exception:
+        snapshot.update(status='failed')
+        raise
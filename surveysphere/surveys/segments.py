@@ -0,0 +1,86 @@
+"""
+Result segments: restrict a survey's results to responses submitted in a
+date range, from a class of device, or that chose a given option.
+
+A segment compiles to a single subquery of response ids, which the results
+engine applies to each of its grouped aggregates, so a filtered page takes
+as many queries as an unfiltered one. Every filter is backed by an index:
+``(survey, submitted_at)``, ``(survey, client_class)`` and the
+answer/option table's option index.
+"""
+import re
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Answer, Response
+
+SelectedOption = Answer.selected_options.through
+
+_BOT_RE = re.compile(r'bot|crawl|spider|slurp|curl|wget|python|java/|okhttp|httpclient|postman', re.I)
+_TABLET_RE = re.compile(r'ipad|tablet|kindle|silk|playbook', re.I)
+_MOBILE_RE = re.compile(r'mobi|iphone|ipod|android|windows phone|blackberry|opera mini', re.I)
+_DESKTOP_RE = re.compile(r'windows|macintosh|mac os x|x11|linux|cros', re.I)
+
+
+def classify_user_agent(user_agent):
+    """Coarse device class of a User-Agent header, stored with each response"""
+    if not user_agent:
+        return 'unknown'
+    if _BOT_RE.search(user_agent):
+        return 'bot'
+    # Android tablets leave "Mobile" out of their user agent.
+    if _TABLET_RE.search(user_agent) or ('android' in user_agent.lower() and 'mobile' not in user_agent.lower()):
+        return 'tablet'
+    if _MOBILE_RE.search(user_agent):
+        return 'mobile'
+    if _DESKTOP_RE.search(user_agent):
+        return 'desktop'
+    return 'unknown'
+
+
+class Segment:
+    """A set of response filters; an empty segment matches every response"""
+    __slots__ = ('since', 'until', 'client_class', 'option')
+
+    def __init__(self, since=None, until=None, client_class=None, option=None):
+        self.since = since
+        self.until = until
+        self.client_class = client_class
+        self.option = option
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None for name in self.__slots__)
+
+    def describe(self):
+        parts = []
+        if self.since:
+            parts.append(f"from {self.since:%Y-%m-%d}")
+        if self.until:
+            parts.append(f"until {self.until:%Y-%m-%d}")
+        if self.client_class:
+            parts.append(f"on {dict(Response.CLIENT_CLASSES)[self.client_class].lower()}")
+        if self.option:
+            parts.append(f"who answered “{self.option.text}” to “{self.option.question.text}”")
+        return ', '.join(parts)
+
+    def responses(self, survey):
+        """The ids of the survey's responses in this segment, as a subquery"""
+        responses = Response.objects.filter(survey=survey)
+        if self.since:
+            responses = responses.filter(submitted_at__gte=_start_of(self.since))
+        if self.until:
+            responses = responses.filter(submitted_at__lt=_start_of(self.until, days=1))
+        if self.client_class:
+            responses = responses.filter(client_class=self.client_class)
+        if self.option:
+            # Driven by the option index: option -> answers -> their responses.
+            responses = responses.filter(id__in=SelectedOption.objects.filter(
+                option=self.option
+            ).values('answer__response_id'))
+        return responses.order_by().values('id')
+
+
+def _start_of(day, days=0):
+    moment = datetime.combine(day, time.min) + timedelta(days=days)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
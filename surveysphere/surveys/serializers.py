@@ -0,0 +1,87 @@
+from rest_framework import serializers
+
+from .models import Survey, Question, Option, Response, Answer
+from .versions import published_questions
+
+
+class SparseFieldsetMixin:
+    """
+    Let clients ask for a subset of fields with ``?fields=id,title``.
+
+    Only mix this into top-level serializers so nested schemas keep their
+    full shape.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            wanted = {name.strip() for name in requested.split(',') if name.strip()}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class OptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Option
+        fields = ['id', 'text', 'order']
+
+
+class QuestionSerializer(serializers.ModelSerializer):
+    options = OptionSerializer(source='option_list', many=True, read_only=True)
+
+    class Meta:
+        model = Question
+        fields = ['id', 'text', 'question_type', 'is_required', 'order', 'help_text', 'options']
+
+
+class SurveySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # Annotated by the view (Survey.objects.with_counts) so listing surveys
+    # does not count per row.
+    question_count = serializers.IntegerField(source='question_total', read_only=True)
+
+    class Meta:
+        model = Survey
+        fields = ['id', 'title', 'description', 'is_active', 'created_at', 'updated_at', 'question_count']
+
+
+class SurveyDetailSerializer(SurveySerializer):
+    """A survey with the questions of its published version"""
+    version = serializers.IntegerField(source='published_version.number', read_only=True)
+    questions = serializers.SerializerMethodField()
+
+    class Meta(SurveySerializer.Meta):
+        fields = SurveySerializer.Meta.fields + ['version', 'questions']
+
+    def get_questions(self, survey):
+        return QuestionSerializer(published_questions(survey), many=True).data
+
+
+class AnswerSerializer(serializers.ModelSerializer):
+    selected_options = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Answer
+        fields = ['question', 'text_answer', 'numeric_answer', 'selected_options']
+
+
+class ResponseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    answers = AnswerSerializer(many=True, read_only=True)
+    skipped_questions = serializers.ListField(
+        source='skipped_question_ids', child=serializers.IntegerField(), read_only=True
+    )
+
+    class Meta:
+        model = Response
+        fields = ['id', 'submitted_at', 'is_complete', 'answers', 'skipped_questions']
+
+
+class ResponseSubmissionSerializer(serializers.Serializer):
+    """
+    One submitted response: ``{"answers": {"<question id>": value}}``.
+
+    Values are whatever the HTML form would post for that question: a string
+    or number, an option id for single choice, a list of option ids for
+    multiple choice.
+    """
+    answers = serializers.DictField(child=serializers.JSONField(), allow_empty=True)
@@ -0,0 +1,77 @@
+"""
+Job kinds run by the background worker (see jobs.py).
+"""
+from .deletion import delete_responses, purge_survey
+from .jobs import job
+from .models import Survey, Question, Response, OwnerStats, ResponseReservoir
+from .sampling import compute_exact_results
+from .text import TEXT_TYPES, rebuild_terms
+from .transfer import export_survey
+
+
+@job('exact_results')
+def exact_results(current, survey_id):
+    compute_exact_results(survey_id)
+    return {'survey': survey_id}
+
+
+@job('export_survey')
+def export_survey_document(current, survey_id, version=None):
+    survey = Survey.objects.get(id=survey_id)
+    if version is not None:
+        version = survey.versions.get(number=version)
+    return export_survey(survey, version)
+
+
+@job('rebuild_response_samples')
+def rebuild_response_samples(current, survey_ids=None):
+    surveys = Survey.objects.order_by('id').values_list('id', flat=True)
+    if survey_ids:
+        surveys = surveys.filter(id__in=survey_ids)
+    survey_ids = list(surveys)
+    current.report(0, len(survey_ids))
+    # One survey per transaction keeps locks short.
+    for done, survey_id in enumerate(survey_ids, 1):
+        ResponseReservoir.rebuild(survey_id)
+        current.report(done)
+    return {'surveys': len(survey_ids)}
+
+
+@job('rebuild_owner_stats')
+def rebuild_owner_stats(current, owner_ids=None):
+    owners = Survey.objects.order_by('created_by_id').values_list('created_by_id', flat=True).distinct()
+    if owner_ids:
+        owners = owners.filter(created_by_id__in=owner_ids)
+    owner_ids = list(owners)
+    current.report(0, len(owner_ids))
+    for done, owner_id in enumerate(owner_ids, 1):
+        OwnerStats.rebuild(owner_id)
+        current.report(done)
+    return {'owners': len(owner_ids)}
+
+
+@job('purge_survey')
+def purge_deleted_survey(current, survey_id):
+    current.report(0, Response.objects.filter(survey_id=survey_id).count())
+    return {'responses': purge_survey(survey_id, current.report)}
+
+
+@job('delete_responses')
+def delete_response_batch(current, filters=None, id_range=None, response_ids=None):
+    if response_ids is not None:
+        # Queued before jobs carried a filter.
+        responses = Response.objects.filter(id__in=response_ids)
+    else:
+        responses = Response.objects.filter(id__range=id_range, **filters)
+    current.report(0, responses.count())
+    return {'responses': delete_responses(responses, current.report)}
+
+
+@job('rebuild_term_frequencies')
+def rebuild_term_frequencies(current, survey_id):
+    question_ids = list(Question.objects.filter(survey_id=survey_id, question_type__in=TEXT_TYPES).values_list('id', flat=True))
+    current.report(0, len(question_ids))
+    for done, question_id in enumerate(question_ids, 1):
+        rebuild_terms(question_id)
+        current.report(done)
+    return {'questions': len(question_ids)}
@@ -0,0 +1,237 @@
+"""
+Query-budget harness for view tests.
+
+Each view gets a ``Budget``: the most queries one request may run and how
+long it may take. ``QueryBudgetMixin`` requests every case once against a
+small fixture, grows the fixture (more surveys, questions, options and
+responses), requests them again, and fails if
+
+- the query count changed with the data size (an N+1 in the making), or
+- a request went over its query budget.
+
+Failures list the offending SQL as fingerprints (literals replaced by ``?``)
+with how often each ran, so the culprit is visible without a debugger.
+
+Wall-clock time depends on the machine, so latency budgets only warn by
+default. Setting ``QUERY_BUDGET_LATENCY_FACTOR`` in the environment makes
+them fail the test, scaled by that factor (``1`` on a quiet benchmark box,
+more on shared CI runners).
+"""
+import os
+import re
+import time
+import warnings
+from collections import Counter, namedtuple
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .ingest import clear_schema_cache, get_schema, write_responses
+from .models import Survey, Question, Option, DisplayRule, TimingEvent
+from .ordering import ORDER_GAP
+from .timing import get_buffer
+from .versions import publish
+
+Budget = namedtuple('Budget', ['queries', 'ms'])
+
+
+class Case(namedtuple('Case', ['url_name', 'budget', 'method', 'user', 'args', 'data'])):
+    """
+    One request to measure. ``user`` is the fixture attribute to log in as
+    (None for anonymous), ``args`` the URL kwargs to fill from the fixture
+    and ``data`` the name of a test method returning the request body.
+    """
+    __slots__ = ()
+
+    def __new__(cls, url_name, budget, method='get', user=None, args=(), data=None):
+        return super().__new__(cls, url_name, budget, method, user, args, data)
+
+    @property
+    def label(self):
+        return self.url_name if self.method == 'get' else f"{self.url_name} ({self.method.upper()})"
+
+
+_SAVEPOINT_RE = re.compile(r'"s\d+_x\d+"')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\((?:\s*(?:\?|NULL)\s*,)*\s*(?:\?|NULL)\s*\)")
+_ROWS_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """``sql`` with literals, IN lists and VALUES rows collapsed, for grouping similar queries"""
+    sql = _SAVEPOINT_RE.sub('?', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _LIST_RE.sub('(...)', sql)
+    sql = _ROWS_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprints(queries):
+    return Counter(fingerprint(query['sql']) for query in queries)
+
+
+def describe(counts, limit=15):
+    lines = [f"  {count:>4} x {sql[:300]}" for sql, count in counts.most_common(limit)]
+    if len(counts) > limit:
+        lines.append(f"  ... and {len(counts) - limit} more")
+    return '\n'.join(lines)
+
+
+def latency_factor():
+    """How much to scale latency budgets by, or None to only warn about them"""
+    factor = os.environ.get('QUERY_BUDGET_LATENCY_FACTOR')
+    return float(factor) if factor else None
+
+
+class SurveyDataMixin:
+    """
+    Builds the survey data the budgets are measured against, and grows it.
+    Every survey has one question of each type, a display rule and answered
+    responses with timing events, so each page has rows to loop over. Added
+    questions are published at once.
+    """
+    QUESTION_TYPES = ['radio', 'checkbox', 'text', 'textarea', 'rating', 'number', 'email']
+
+    @classmethod
+    def setUpClass(cls):
+        clear_schema_cache()
+        super().setUpClass()
+
+    def setUp(self):
+        clear_schema_cache()
+        super().setUp()
+
+    @classmethod
+    def add_surveys(cls, owner, count, questions=1, responses=3):
+        surveys = []
+        for index in range(count):
+            survey = Survey.objects.create(title=f"Budget survey {index} of {owner.username}",
+                                           description="Query budget fixture", created_by=owner)
+            cls.add_questions(survey, questions)
+            cls.add_responses(survey, responses)
+            surveys.append(survey)
+        return surveys
+
+    @classmethod
+    def add_questions(cls, survey, rounds, options=3):
+        """Add ``rounds`` questions of each type, with ``options`` options per choice question"""
+        start = (survey.questions.count() + 1) * ORDER_GAP
+        created = []
+        for position in range(rounds * len(cls.QUESTION_TYPES)):
+            question_type = cls.QUESTION_TYPES[position % len(cls.QUESTION_TYPES)]
+            question = Question.objects.create(
+                survey=survey, text=f"Budget question {position} ({question_type})",
+                question_type=question_type, order=start + position * ORDER_GAP,
+            )
+            if question_type in ('radio', 'checkbox'):
+                Option.objects.bulk_create([
+                    Option(question=question, text=f"Option {number}", order=number * ORDER_GAP)
+                    for number in range(1, options + 1)
+                ])
+            created.append(question)
+        radio = next(question for question in created if question.question_type == 'radio')
+        DisplayRule.objects.create(question=created[-1], source=radio, operator='answered')
+        publish(survey)
+        return created
+
+    @classmethod
+    def add_responses(cls, survey, count):
+        survey.refresh_from_db()
+        schema = get_schema(survey)
+        options = {}
+        for option in Option.objects.filter(question__survey=survey).order_by('id'):
+            options.setdefault(option.question_id, []).append(str(option.id))
+
+        values = {
+            'radio': lambda question_id, n: options[question_id][n % len(options[question_id])],
+            'checkbox': lambda question_id, n: options[question_id][:1 + n % len(options[question_id])],
+            'text': lambda question_id, n: f"answer number {n} about the service",
+            'textarea': lambda question_id, n: f"longer answer {n} about the quality of service",
+            'rating': lambda question_id, n: str(1 + n % 5),
+            'number': lambda question_id, n: Decimal(n),
+            'email': lambda question_id, n: f"respondent{n}@example.com",
+        }
+        cleaned = [
+            {spec.id: values[spec.question_type](spec.id, n) for spec in schema.questions}
+            for n in range(count)
+        ]
+        # Term counts are recorded once the responses commit.
+        with cls.captureOnCommitCallbacks(execute=True):
+            write_responses(schema, cleaned, ip_address='127.0.0.1', user_agent='Mozilla/5.0 (X11; Linux x86_64)')
+
+        question_ids = [spec.id for spec in schema.questions]
+        TimingEvent.objects.bulk_create([
+            TimingEvent(survey=survey, visit=f"v{survey.id}-{n}", kind=kind, question_id=question_id,
+                        dwell_ms=1500 if kind == 'dwell' else None)
+            for n in range(count)
+            for kind, question_id in [('view', None), ('submit', None)] + [('dwell', qid) for qid in question_ids]
+        ])
+
+
+class QueryBudgetMixin(SurveyDataMixin):
+    """
+    For TestCase subclasses: set ``cases`` and build the fixture in
+    ``setUpTestData``, including the ``owner`` and ``survey`` that ``grow()``
+    adds to; extend ``grow()`` with anything else the cases list.
+    """
+    cases = []
+
+    def url_kwargs(self):
+        return {}
+
+    def grow(self):
+        """Add data every case's page would show more of"""
+        self.add_surveys(self.owner, 4)
+        self.add_questions(self.survey, 2, options=6)
+        self.add_responses(self.survey, 25)
+
+    def request(self, case):
+        kwargs = self.url_kwargs()
+        url = reverse(case.url_name, kwargs={name: kwargs[name] for name in case.args})
+        data = getattr(self, case.data)() if case.data else None
+        self.client.logout()
+        if case.user:
+            self.client.force_login(getattr(self, case.user))
+
+        method = getattr(self.client, case.method)
+        if case.method == 'post' and isinstance(data, str):
+            call = lambda: method(url, data, content_type='application/json')  # noqa: E731
+        else:
+            call = lambda: method(url, data)  # noqa: E731
+
+        call()  # warm up caches (templates, compiled schemas)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = call()
+            elapsed = (time.perf_counter() - started) * 1000
+        # Write buffered timing events inside the test's transaction.
+        get_buffer().flush()
+        self.assertLess(response.status_code, 400, f"{case.label} returned {response.status_code}")
+        return list(captured.captured_queries), elapsed
+
+    def test_query_budgets(self):
+        small = {case.label: self.request(case)[0] for case in self.cases}
+        self.grow()
+        for case in self.cases:
+            with self.subTest(case.label):
+                queries, elapsed = self.request(case)
+                before, after = fingerprints(small[case.label]), fingerprints(queries)
+                self.assertLessEqual(len(queries), len(small[case.label]), (
+                    f"{case.label} ran {len(small[case.label])} queries on the small fixture and "
+                    f"{len(queries)} on the large one. Queries that grew with the data:\n{describe(after - before)}"
+                ))
+                self.assertLessEqual(len(queries), case.budget.queries, (
+                    f"{case.label} ran {len(queries)} queries, budget {case.budget.queries}:\n{describe(after)}"
+                ))
+                factor = latency_factor()
+                slow = f"{case.label} took {elapsed:.0f}ms, budget {case.budget.ms}ms"
+                if factor is None:
+                    if elapsed > case.budget.ms:
+                        warnings.warn(slow)
+                else:
+                    self.assertLessEqual(elapsed, case.budget.ms * factor, slow)
@@ -1,3 +1,1271 @@
-from django.test import TestCase
+import copy
+import json
+import math
+import random
+import time
+import unittest
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection
+from django.db.models import RestrictedError
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import resolve, reverse
+
+from users.models import CustomUser
+
+from . import jobs, urls as survey_urls
+from .deletion import delete_responses
+from .branching import RuleSet
+from .ingest import client_ip, get_schema, ingest, write_responses
+from .live import publish_delta
+from .models import (
+    DisplayRule, Job, Option, OwnerHourlyResponses, OwnerStats, Question, Response, ResponseReservoir,
+    ResultsSnapshot, Survey, TermFrequency, TimingEvent,
+)
+from .ordering import ORDER_GAP, insert_at, move
+from .results import compute_results, skipped_counts
+from .sampling import approximate_results, large_survey_reservoir
+from .testing import Budget, Case, QueryBudgetMixin, SurveyDataMixin, fingerprint
+from .text import rebuild_terms
+from .timing import EventBuffer, get_buffer, make_token, parse_beacon, read_token, timing_stats
+from .transfer import FORMATS, dump_document, export_survey, import_survey, load_document
+from .versions import publish
+
+# URLs that cannot be measured as a single request, and why.
+UNBUDGETED = {
+    'survey_results_stream': "an endless event stream of deltas; it runs no queries after the survey lookup",
+}
+
+
+class SurveyBudgetFixture:
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(
+            'owner', 'owner@example.com', 'password', first_name='Ada', last_name='Owner'
+        )
+        cls.other = CustomUser.objects.create_user(
+            'other', 'other@example.com', 'password', first_name='Bo', last_name='Other'
+        )
+        cls.admin = CustomUser.objects.create_superuser(
+            'admin', 'admin@example.com', 'password', first_name='Cy', last_name='Admin'
+        )
+        cls.survey = cls.add_surveys(cls.owner, 2)[0]
+        # Republished after its first responses, so results are filtered by version.
+        cls.add_questions(cls.survey, 1)
+        cls.add_surveys(cls.other, 1)
+        ResultsSnapshot.objects.create(survey=cls.survey, status='ready', results=[])
+        cls.job = Job.objects.create(kind='export_survey', params={'survey_id': cls.survey.id}, created_by=cls.owner)
+
+    def grow(self):
+        # The job pages list jobs, and the admin everyone's surveys.
+        super().grow()
+        for survey in self.add_surveys(self.other, 2):
+            Job.objects.create(kind='export_survey', params={'survey_id': survey.id}, created_by=self.owner)
+
+    def url_kwargs(self):
+        return {'survey_id': self.survey.id, 'job_id': self.job.id}
+
+
+class SurveyViewQueryBudgetTests(SurveyBudgetFixture, QueryBudgetMixin, TestCase):
+    cases = [
+        Case('surveys:survey_list', Budget(queries=4, ms=100)),
+        Case('surveys:my_surveys', Budget(queries=3, ms=100), user='owner'),
+        Case('surveys:survey_detail', Budget(queries=3, ms=250), args=['survey_id']),
+        Case('surveys:survey_detail', Budget(queries=13, ms=100), method='post', args=['survey_id'],
+             data='submission'),
+        Case('surveys:survey_beacon', Budget(queries=1, ms=50), method='post', args=['survey_id'],
+             data='beacon'),
+        Case('surveys:survey_results', Budget(queries=20, ms=200), user='owner', args=['survey_id']),
+        Case('surveys:survey_results_exact', Budget(queries=4, ms=50), user='owner', args=['survey_id']),
+        Case('surveys:survey_create', Budget(queries=2, ms=100), user='owner'),
+        Case('surveys:add_questions', Budget(queries=5, ms=200), user='owner', args=['survey_id']),
+        Case('surveys:survey_reorder', Budget(queries=10, ms=100), method='post', user='owner',
+             args=['survey_id'], data='reorder'),
+        Case('surveys:survey_publish', Budget(queries=9, ms=100), method='post', user='owner', args=['survey_id']),
+        Case('surveys:survey_success', Budget(queries=0, ms=50)),
+        Case('surveys:create_success', Budget(queries=0, ms=50)),
+        Case('surveys:survey_import', Budget(queries=2, ms=100), user='owner'),
+        Case('surveys:survey_export', Budget(queries=6, ms=100), user='owner', args=['survey_id']),
+        Case('surveys:job_status', Budget(queries=3, ms=50), user='owner', args=['job_id']),
+    ]
+
+    def submission(self):
+        questions = self.survey.questions.filter(question_type__in=['text', 'number'])
+        return {f'question_{question.id}': '7' for question in questions}
+
+    def beacon(self):
+        question = self.survey.questions.first()
+        return json.dumps({'token': make_token(self.survey.id), 'events': [
+            {'type': 'dwell', 'question': question.id, 'ms': 1200},
+            {'type': 'abandon', 'question': question.id},
+        ]})
+
+    def reorder(self):
+        first, second = self.survey.questions.all()[:2]
+        return json.dumps({'question': first.id, 'after': second.id})
+
+    def test_every_url_has_a_budget(self):
+        budgeted = {case.url_name.split(':')[1] for case in self.cases}
+        for pattern in survey_urls.urlpatterns:
+            with self.subTest(pattern.name):
+                self.assertTrue(pattern.name in budgeted or pattern.name in UNBUDGETED,
+                                f"Declare a query budget for surveys:{pattern.name}")
+
+
+class AdminChangelistQueryBudgetTests(SurveyBudgetFixture, QueryBudgetMixin, TestCase):
+    """Every changelist of the project's models, as a superuser"""
+    budgets = {
+        'surveys.survey': Budget(queries=6, ms=150),
+        'surveys.question': Budget(queries=6, ms=400),
+        'surveys.option': Budget(queries=6, ms=250),
+        'surveys.response': Budget(queries=6, ms=250),
+        'surveys.answer': Budget(queries=7, ms=250),
+        'surveys.job': Budget(queries=6, ms=100),
+    }
+    cases = [
+        Case(f"admin:{label.replace('.', '_')}_changelist", budget, user='admin')
+        for label, budget in budgets.items()
+    ]
+
+    def test_every_changelist_has_a_budget(self):
+        for model in admin.site._registry:
+            if model._meta.app_label in ('surveys', 'users'):
+                with self.subTest(model._meta.label):
+                    self.assertIn(model._meta.label_lower, self.budgets,
+                                  f"Declare a query budget for the {model._meta.label} changelist")
+
+
+class QueryBudgetHarnessTests(SimpleTestCase):
+    """The harness itself, fed canned queries instead of real requests"""
+
+    def run_budgets(self, small, large, elapsed=10, budget=Budget(queries=3, ms=50)):
+        class Harness(QueryBudgetMixin, SimpleTestCase):
+            cases = [Case('surveys:survey_list', budget)]
+            grown = False
+
+            def grow(self):
+                self.grown = True
+
+            def request(self, case):
+                queries = large if self.grown else small
+                return [{'sql': sql} for sql in queries], elapsed
+
+        result = unittest.TestResult()
+        Harness('test_query_budgets').run(result)
+        return [error for _, error in result.failures + result.errors]
+
+    def test_fingerprints_collapse_literals(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (1, 2, 3) AND "name" = \'a\'\'b\'  LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND "name" = ? LIMIT ?',
+        )
+
+    def test_constant_queries_within_budget_pass(self):
+        self.assertEqual(self.run_budgets(['SELECT 1'], ['SELECT 2']), [])
+
+    def test_queries_growing_with_the_data_fail_and_are_named(self):
+        lookup = 'SELECT * FROM "option" WHERE "question_id" = {}'
+        failures = self.run_budgets([lookup.format(1)], [lookup.format(1), lookup.format(2)])
+        self.assertEqual(len(failures), 1)
+        self.assertIn('ran 1 queries on the small fixture and 2 on the large one', failures[0])
+        self.assertIn('1 x SELECT * FROM "option" WHERE "question_id" = ?', failures[0])
+
+    def test_queries_over_budget_fail(self):
+        failures = self.run_budgets(['SELECT 1'] * 4, ['SELECT 1'] * 4)
+        self.assertEqual(len(failures), 1)
+        self.assertIn('ran 4 queries, budget 3', failures[0])
+
+    def test_latency_only_warns_unless_a_factor_is_set(self):
+        with mock.patch.dict('os.environ', {}, clear=True), warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual(self.run_budgets(['SELECT 1'], ['SELECT 1'], elapsed=80), [])
+        self.assertIn('took 80ms, budget 50ms', str(caught[0].message))
+
+        with mock.patch.dict('os.environ', {'QUERY_BUDGET_LATENCY_FACTOR': '2'}):
+            self.assertEqual(self.run_budgets(['SELECT 1'], ['SELECT 1'], elapsed=80), [])
+            failures = self.run_budgets(['SELECT 1'], ['SELECT 1'], elapsed=120)
+        self.assertEqual(len(failures), 1)
+        self.assertIn('took 120ms, budget 50ms', failures[0])
+
+
+class SurveyVersionTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(cls.owner, 1, responses=2)[0]
+
+    def setUp(self):
+        super().setUp()
+        self.survey.refresh_from_db()
+        self.radio = self.survey.questions.get(question_type='radio')
+
+    def test_draft_edits_leave_the_published_version_alone(self):
+        version = self.survey.published_version
+        schema = get_schema(self.survey)
+        self.radio.text = "Edited in the draft"
+        self.radio.save()
+        Option.objects.filter(question=self.radio).update(text="Edited option")
+
+        self.survey.refresh_from_db()
+        self.assertIs(get_schema(self.survey), schema)
+        self.assertEqual(version.document['questions'][0]['text'], "Budget question 0 (radio)")
+        results = compute_results(self.survey, version=version)
+        self.assertEqual(results[0]['question'], "Budget question 0 (radio)")
+        self.assertEqual(export_survey(self.survey, version)['questions'][0]['options'][0], "Option 1")
+        self.assertEqual(export_survey(self.survey)['questions'][0]['options'][0], "Edited option")
+
+    def test_publishing_pins_new_responses_to_the_new_version(self):
+        first = self.survey.published_version
+        self.assertEqual(publish(self.survey), first)  # nothing changed
+
+        self.add_questions(self.survey, 1)
+        self.survey.refresh_from_db()
+        second = self.survey.published_version
+        self.assertEqual(second.number, first.number + 1)
+        self.add_responses(self.survey, 3)
+
+        self.assertEqual(first.responses.count(), 2)
+        self.assertEqual(second.responses.count(), 3)
+        self.assertEqual(len(compute_results(self.survey, version=first)), 7)
+        self.assertEqual(compute_results(self.survey, version=second)[0]['total'], 3)
+
+    def test_completion_times_follow_the_version(self):
+        first = self.survey.published_version
+        started_at = timezone.now() - timedelta(minutes=5)
+        write_responses(get_schema(self.survey), [{}], started_at=started_at)
+        self.add_questions(self.survey, 1)
+        self.survey.refresh_from_db()
+        write_responses(get_schema(self.survey), [{}, {}], started_at=started_at)
+
+        self.assertEqual(timing_stats(self.survey, version=first)['completions'], 1)
+        self.assertEqual(timing_stats(self.survey, version=self.survey.published_version)['completions'], 2)
+
+    def test_published_questions_cannot_be_deleted(self):
+        with self.assertRaises(RestrictedError):
+            self.radio.delete()
+        with self.assertRaises(RestrictedError):
+            self.radio.options.first().delete()
+
+
+class ConditionalPageTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(cls.owner, 1)[0]
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_only_the_survey_list_is_public(self):
+        listing = self.client.get(reverse('surveys:survey_list'))
+        self.assertIn('public', listing['Cache-Control'])
+        form = self.client.get(reverse('surveys:survey_detail', args=[self.survey.id]))
+        self.assertIn('private', form['Cache-Control'])
+        self.assertNotIn('public', form['Cache-Control'])
+
+    def test_new_responses_leave_the_form_validator_alone(self):
+        status = self.revalidate(reverse('surveys:survey_detail', args=[self.survey.id]))
+        self.add_responses(self.survey, 1)
+        self.assertEqual(status(), 304)
+
+    def test_new_responses_change_the_results_validator(self):
+        self.client.force_login(self.owner)
+        status = self.revalidate(reverse('surveys:survey_results', args=[self.survey.id]))
+        self.assertEqual(status(), 304)
+        self.add_responses(self.survey, 1)
+        self.assertEqual(status(), 200)
+
+    def test_list_validator_counts_nothing_and_notices_deletions(self):
+        status = self.revalidate(reverse('surveys:survey_list'))
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(status(), 304)
+        self.assertFalse([query for query in captured.captured_queries if 'COUNT(' in query['sql'].upper()])
+        delete_responses(Response.objects.filter(id=self.survey.responses.first().id))
+        self.assertEqual(status(), 200)
+
+    def test_deleted_responses_change_the_results_validator(self):
+        self.client.force_login(self.owner)
+        status = self.revalidate(reverse('surveys:survey_results', args=[self.survey.id]))
+        # Not the latest response, so the latest submission time stays put.
+        delete_responses(Response.objects.filter(id=self.survey.responses.order_by('id').first().id))
+        self.assertEqual(status(), 200)
+
+    def test_results_of_unpublished_surveys_are_not_validated(self):
+        draft = Survey.objects.create(title="Draft", created_by=self.owner)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('surveys:survey_results', args=[draft.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_new_timing_events_change_the_results_validator(self):
+        self.client.force_login(self.owner)
+        status = self.revalidate(reverse('surveys:survey_results', args=[self.survey.id]))
+        TimingEvent.objects.create(survey=self.survey, visit='late', kind='view')
+        self.assertEqual(status(), 200)
+
+    def test_deploying_new_assets_invalidates_pages(self):
+        status = self.revalidate(reverse('surveys:survey_list'))
+        self.assertEqual(status(), 304)
+        with mock.patch('surveys.caching.build_id', return_value='next-deploy'):
+            self.assertEqual(status(), 200)
+
+
+class SurveyTransferTests(TestCase):
+    DOCUMENT = {
+        'title': "Customer feedback",
+        'description': "",
+        'is_active': True,
+        'questions': [
+            {'text': "How did you hear about us?", 'question_type': 'radio', 'is_required': True,
+             'help_text': "", 'options': ["Friend", "Search engine"]},
+            {'text': "Which search engine?", 'question_type': 'text', 'is_required': False, 'help_text': "",
+             'show_if': [{'question': 1, 'operator': 'equals', 'value': "Search engine"}]},
+        ],
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+
+    def questions(self, count):
+        return dict(self.DOCUMENT, questions=[
+            {'text': f"Question {n}", 'question_type': 'radio', 'options': ["Yes", "No"]} for n in range(count)
+        ])
+
+    def test_round_trip(self):
+        survey = import_survey(self.DOCUMENT, self.owner)
+        exported = export_survey(survey)
+        self.assertEqual(export_survey(survey, survey.published_version), exported)
+
+        self.assertEqual([question.pop('order') for question in exported['questions']], [ORDER_GAP, 2 * ORDER_GAP])
+        expected = copy.deepcopy(self.DOCUMENT)
+        expected['questions'][0]['show_if'] = []
+        expected['questions'][1]['options'] = []
+        self.assertEqual(exported, expected)
+
+        again = export_survey(import_survey(exported, self.owner))
+        for question in again['questions']:
+            del question['order']
+        self.assertEqual(again, expected)
+
+    def test_import_cost_does_not_grow_with_the_survey(self):
+        import_survey(self.questions(1), self.owner)  # first-survey setup, such as the owner's stats row
+        counts = []
+        for size in (2, 20):
+            with CaptureQueriesContext(connection) as captured:
+                import_survey(self.questions(size), self.owner)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_documents_report_every_problem_and_create_nothing(self):
+        document = dict(self.DOCUMENT, questions=[
+            {'text': "", 'question_type': 'text'},
+            {'text': "Pick one of these", 'question_type': 'radio'},
+            {'text': "Which search engine?", 'question_type': 'text'},
+        ])
+        with self.assertRaises(ValidationError) as raised:
+            import_survey(document, self.owner)
+        messages = raised.exception.messages
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(messages[0].startswith("Question 1: "))
+        self.assertEqual(messages[1], "Question 2: Choice questions must have at least one option.")
+        self.assertFalse(Survey.all_objects.exists())
+
+        # Rules are checked once the questions themselves are valid.
+        document = copy.deepcopy(self.DOCUMENT)
+        document['questions'][1]['show_if'] = [{'question': 2, 'operator': 'answered'}]
+        with self.assertRaisesMessage(ValidationError, "Question 2: show_if must refer to an earlier question."):
+            import_survey(document, self.owner)
+        self.assertFalse(Survey.all_objects.exists())
+
+    def test_yaml_is_offered_only_when_installed(self):
+        self.client.force_login(self.owner)
+        page = self.client.get(reverse('surveys:survey_import'))
+        self.assertEqual('yaml' in FORMATS, b'value="yaml"' in page.content)
+        if 'yaml' not in FORMATS:
+            with self.assertRaises(ValidationError):
+                load_document("title: x", 'yaml')
+            return
+        text = dump_document(self.DOCUMENT, 'yaml')
+        self.assertEqual(load_document(text, 'yaml'), self.DOCUMENT)
+
+    def test_version_numbers_must_be_ascii_digits(self):
+        survey = import_survey(self.DOCUMENT, self.owner)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('surveys:survey_results', args=[survey.id]), {'version': '\u00b2'})
+        self.assertEqual(response.status_code, 200)
+
+
+class ApiTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        cls.survey, cls.hidden = cls.add_surveys(cls.owner, 2, responses=2)
+        Survey.objects.filter(pk=cls.hidden.pk).update(is_active=False)
+        cls.draft = Survey.objects.create(title="Draft", created_by=cls.owner)
+        cls.number = cls.survey.questions.get(question_type='number')
+
+    def url(self, name, *args):
+        return reverse(f'api-v1:{name}', args=args or [self.survey.id])
+
+    def test_surveys_lists_only_published_active_surveys(self):
+        listed = self.client.get(reverse('api-v1:survey_list')).json()['results']
+        self.assertEqual([survey['id'] for survey in listed], [self.survey.id])
+        self.assertEqual(listed[0]['question_count'], 7)
+        self.assertEqual(self.client.get(self.url('survey_detail', self.draft.id)).status_code, 404)
+        detail = self.client.get(self.url('survey_detail'), {'fields': 'id,version'}).json()
+        self.assertEqual(detail, {'id': self.survey.id, 'version': 1})
+
+    def test_results_are_for_the_owner_only(self):
+        url = self.url('survey_results')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.owner)
+        results = self.client.get(url).json()
+        self.assertEqual((results['version'], results['responses']), (1, 2))
+        self.assertEqual(self.client.get(url, {'version': '\u00b2'}).json()['version'], 1)
+        self.assertEqual(self.client.get(url, {'version': '9'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'since': 'soon'}).status_code, 400)
+
+    def test_submissions_are_all_or_nothing(self):
+        url = self.url('survey_responses')
+        single = self.client.post(url, {'answers': {str(self.number.id): 3}}, content_type='application/json')
+        self.assertEqual(single.status_code, 201)
+        self.assertEqual(Response.objects.get(id=single.json()['id']).answers.get().numeric_answer, 3)
+
+        batch = [{'answers': {}}, {'answers': {str(self.number.id): 'many'}}]
+        rejected = self.client.post(url, batch, content_type='application/json')
+        self.assertEqual(rejected.status_code, 400)
+        self.assertEqual([error['index'] for error in rejected.json()['errors']], [1])
+        self.assertEqual(self.survey.responses.count(), 3)
+
+        created = self.client.post(url, [{'answers': {}}] * 2, content_type='application/json')
+        self.assertEqual(len(created.json()['ids']), 2)
+        self.assertEqual(self.client.post(self.url('survey_responses', self.hidden.id), {'answers': {}},
+                                          content_type='application/json').status_code, 404)
+
+    def test_responses_are_listed_to_the_owner_in_pages(self):
+        url = self.url('survey_responses')
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.owner)
+        first = self.client.get(url, {'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 2)
+        self.assertGreater(first['results'][0]['id'], second['results'][0]['id'])
+        self.assertIsNone(second['next'])
+
+    def test_exports_and_jobs_belong_to_their_owner(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.post(self.url('survey_export')).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.post(self.url('survey_export'), {'version': 9},
+                                          content_type='application/json').status_code, 400)
+        queued = self.client.post(self.url('survey_export'), {'version': 1}, content_type='application/json')
+        self.assertEqual(queued.status_code, 202)
+        job_url = queued['Location']
+        self.assertEqual(self.client.get(job_url).json()['status'], 'queued')
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(job_url).status_code, 404)
+
+
+class IngestTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey, = cls.add_surveys(cls.owner, 1, responses=0)
+        cls.number = cls.survey.questions.get(question_type='number')
+        cls.checkbox = cls.survey.questions.get(question_type='checkbox')
+        cls.options = [str(option.id) for option in cls.checkbox.options.order_by('id')]
+
+    def post(self, payload):
+        url = reverse('api-v1:survey_batch_ingest', args=[self.survey.id])
+        return self.client.post(url, payload, content_type='application/json')
+
+    def test_each_item_gets_its_own_result(self):
+        batch = [
+            {'answers': {str(self.number.id): 4, str(self.checkbox.id): self.options[:2]}},
+            {'answers': {str(self.number.id): 'four'}},
+            'not an item',
+        ]
+        response = self.post({'responses': batch})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (1, 2))
+        self.assertEqual([result['status'] for result in body['results']], ['created', 'invalid', 'invalid'])
+        self.assertIn(str(self.number.id), body['results'][1]['errors'])
+
+        stored = Response.objects.get(id=body['results'][0]['id'])
+        self.assertEqual(stored.version.number, 1)
+        self.assertEqual(stored.answers.get(question=self.number).numeric_answer, 4)
+        selected = stored.answers.get(question=self.checkbox).selected_options.values_list('id', flat=True)
+        self.assertEqual(sorted(map(str, selected)), self.options[:2])
+        # Presented but unanswered questions are listed, not stored as empty answers
+        # Unanswered questions are listed as skipped; the email question is
+        # hidden until the radio question is answered, so it is neither.
+        self.assertEqual(sorted(stored.skipped.values_list('question_type', flat=True)),
+                         ['radio', 'rating', 'text', 'textarea'])
+
+    def test_a_fully_valid_batch_is_created(self):
+        response = self.post([{'answers': {}}] * 3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 3)
+        self.assertEqual(self.survey.responses.count(), 3)
+
+    def test_malformed_and_oversized_batches_are_rejected(self):
+        self.assertEqual(self.post({'responses': {'answers': {}}}).status_code, 400)
+        with mock.patch('surveys.api.MAX_INGEST_SIZE', 2):
+            self.assertEqual(self.post([{'answers': {}}] * 3).status_code, 400)
+        self.assertFalse(self.survey.responses.exists())
+
+    def test_write_cost_does_not_grow_with_the_batch(self):
+        schema = get_schema(self.survey)
+        item = {'answers': {str(self.number.id): 1, str(self.checkbox.id): self.options[:1]}}
+        costs = []
+        # A fixed clock: the first response of an hour opens a new bucket.
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):
+            ingest(schema, [item])  # creates the owner's counters and the reservoir
+            for size in (1, 25):
+                with CaptureQueriesContext(connection) as queries:
+                    ingest(schema, [item] * size)
+                costs.append(len(queries))
+        self.assertEqual(costs[0], costs[1])
+        self.assertEqual(self.survey.responses.count(), 27)
+
+
+class OwnerStatsTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.surveys = cls.add_surveys(cls.owner, 2, responses=3)
+
+    def assertMatchesRebuild(self):
+        counted = OwnerStats.objects.get(owner=self.owner)
+        hourly = OwnerHourlyResponses.recent_total(self.owner.pk, timezone.now())
+        rebuilt = OwnerStats.rebuild(self.owner.pk)
+        self.assertEqual(
+            (counted.survey_count, counted.total_responses, hourly),
+            (rebuilt.survey_count, rebuilt.total_responses,
+             OwnerHourlyResponses.recent_total(self.owner.pk, timezone.now())),
+        )
+        # Recorded when the batch is written rather than per response.
+        self.assertAlmostEqual(counted.last_response_at, rebuilt.last_response_at, delta=timedelta(seconds=5))
+
+    def test_surveys_and_responses_are_counted_as_they_arrive(self):
+        stats = OwnerStats.objects.get(owner=self.owner)
+        self.assertEqual((stats.survey_count, stats.total_responses), (2, 6))
+        self.assertEqual(OwnerHourlyResponses.recent_total(self.owner.pk, timezone.now()), 6)
+        self.assertMatchesRebuild()
+
+    def test_deleting_responses_updates_the_totals(self):
+        delete_responses(self.surveys[0].responses.all())
+        stats = OwnerStats.objects.get(owner=self.owner)
+        self.assertEqual(stats.total_responses, 3)
+        self.assertEqual(OwnerHourlyResponses.recent_total(self.owner.pk, timezone.now()), 3)
+        self.assertMatchesRebuild()
+
+    def test_opening_an_hour_prunes_the_owners_stale_buckets(self):
+        now = timezone.now()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        OwnerHourlyResponses.objects.filter(owner=self.owner).update(hour=hour - timedelta(hours=30))
+        OwnerHourlyResponses.objects.create(owner=self.owner, hour=hour - timedelta(hours=2), count=4)
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        OwnerHourlyResponses.objects.create(owner=other, hour=hour - timedelta(hours=30), count=1)
+
+        OwnerStats.record_responses(self.owner.pk, 1, now)
+        self.assertEqual(
+            list(OwnerHourlyResponses.objects.filter(owner=self.owner).order_by('hour').values_list('count', flat=True)),
+            [4, 1],
+        )
+        self.assertEqual(OwnerHourlyResponses.recent_total(self.owner.pk, now), 5)
+        # Other owners' buckets are left to the rebuild_owner_stats command.
+        self.assertTrue(OwnerHourlyResponses.objects.filter(owner=other).exists())
+
+        # Later responses in the same hour only touch their bucket.
+        with self.assertNumQueries(2):
+            OwnerStats.record_responses(self.owner.pk, 1, now)
+
+    def test_dashboard_reads_the_counters(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['stats'].total_responses, 6)
+        self.assertEqual(response.context['responses_last_24h'], 6)
+
+
+class LiveResultsTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(cls.owner, 1)[0]
+
+    def test_stream_is_off_unless_served_over_asgi(self):
+        self.client.force_login(self.owner)
+        results = self.client.get(reverse('surveys:survey_results', args=[self.survey.id]))
+        self.assertNotContains(results, 'EventSource')
+        stream = self.client.get(reverse('surveys:survey_results_stream', args=[self.survey.id]))
+        self.assertEqual(stream.status_code, 404)
+
+    @override_settings(SURVEYS_LIVE_RESULTS=True)
+    async def test_stream_sends_deltas_on_top_of_the_rendered_page(self):
+        response = await self.async_client.get(reverse('surveys:survey_results_stream', args=[self.survey.id]))
+        events = aiter(response.streaming_content)
+        publish_delta(self.survey.id, {'responses': 1, 'questions': {}})
+        publish_delta(self.survey.id, {'resync': True})
+        self.assertEqual(
+            await anext(events),
+            b'event: delta\ndata: {"responses": 1, "questions": {}}\n\n',
+        )
+        self.assertEqual(await anext(events), b'event: resync\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    @override_settings(SURVEYS_LIVE_RESULTS=True)
+    def test_stream_catches_up_on_responses_committed_after_the_page(self):
+        self.client.force_login(self.owner)
+        page = self.client.get(reverse('surveys:survey_results', args=[self.survey.id]))
+        since = page.context['live_since']
+        self.assertContains(page, f'?since={since}')
+        # Their deltas were published before the stream subscribed.
+        self.add_responses(self.survey, 2)
+
+        async def stream():
+            response = await self.async_client.get(
+                reverse('surveys:survey_results_stream', args=[self.survey.id]), {'since': since}
+            )
+            events = aiter(response.streaming_content)
+            first = json.loads((await anext(events)).decode().split('data: ', 1)[1])
+            # The batch behind the catch-up arrives late and is dropped.
+            publish_delta(self.survey.id, {'responses': 2, 'first_id': first['first_id'], 'questions': {}})
+            publish_delta(self.survey.id, {'responses': 1, 'first_id': None, 'questions': {}})
+            return first, await anext(events)
+
+        first, second = async_to_sync(stream)()
+        self.assertEqual(first['responses'], 2)
+        radio = self.survey.questions.get(question_type='radio')
+        self.assertEqual(sum(first['questions'][str(radio.id)]['options'].values()), 2)
+        self.assertIn(b'"responses": 1', second)
+
+    @override_settings(SURVEYS_LIVE_RESULTS=True)
+    async def test_stream_asks_for_a_reload_after_too_many_responses(self):
+        url = reverse('surveys:survey_results_stream', args=[self.survey.id])
+        with mock.patch('surveys.live.MAX_CATCH_UP', 2):
+            response = await self.async_client.get(url, {'since': 0})
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b'event: resync\ndata: {}\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    def test_a_failing_broker_does_not_fail_the_submission(self):
+        with mock.patch('surveys.ingest.publish_delta', side_effect=RuntimeError("broker down")), \
+                self.assertLogs('django.test', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            self.add_responses(self.survey, 1)
+        self.assertEqual(self.survey.responses.count(), 4)
+
+
+class LazyApiViewTests(TestCase):
+    def test_lazy_views_are_named_after_the_api_view(self):
+        match = resolve(reverse('api-v1:survey_list'))
+        self.assertEqual(match._func_path, 'surveys.api.SurveyListView')
+        self.assertTrue(match.func.csrf_exempt)
+
+
+class OrderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        survey = Survey.objects.create(title="Ordering", created_by=owner)
+        cls.question = Question.objects.create(survey=survey, text="Pick", question_type='radio', order=ORDER_GAP)
+
+    def add_options(self, *keys):
+        return [Option.objects.create(question=self.question, text=chr(ord('A') + n), order=key)
+                for n, key in enumerate(keys)]
+
+    def listing(self):
+        return list(self.question.options.order_by('order').values_list('text', 'order'))
+
+    def test_move_takes_the_midpoint_of_its_new_neighbours(self):
+        a, b, c = self.add_options(ORDER_GAP, 2 * ORDER_GAP, 3 * ORDER_GAP)
+        self.assertFalse(move(c, a))
+        self.assertEqual(self.listing(), [('A', ORDER_GAP), ('C', ORDER_GAP * 3 // 2), ('B', 2 * ORDER_GAP)])
+        self.assertFalse(move(b))
+        self.assertEqual(self.listing()[0], ('B', ORDER_GAP // 2))
+
+    def test_move_rebalances_adjacent_neighbours(self):
+        a, b, c = self.add_options(1, 2, 3)
+        self.assertTrue(move(c, a))
+        self.assertEqual(self.listing(), [('A', ORDER_GAP), ('C', ORDER_GAP * 3 // 2), ('B', 2 * ORDER_GAP)])
+
+    def test_repeated_moves_into_one_gap_keep_the_order(self):
+        first, *rest = self.add_options(*(n * ORDER_GAP for n in range(1, 14)))
+        rebalanced = [move(option, first) for option in rest]
+        # B is already after A; every later move halves the gap after A
+        # (2 * ORDER_GAP wide to start with) until it runs out of room.
+        self.assertEqual(rebalanced.index(True), 11)
+        texts = [text for text, _ in self.listing()]
+        self.assertEqual(texts, ['A'] + [option.text for option in reversed(rest)])
+
+    def test_insert_at_rebalances_a_full_slot(self):
+        self.add_options(1, 2)
+        option = Option(question=self.question, text='New')
+        self.assertTrue(insert_at(option, 2))
+        option.save()
+        self.assertEqual(self.listing(), [('A', ORDER_GAP), ('New', ORDER_GAP * 3 // 2), ('B', 2 * ORDER_GAP)])
+
+    def test_insert_at_appends_past_the_end(self):
+        self.add_options(ORDER_GAP)
+        option = Option(question=self.question, text='New')
+        self.assertFalse(insert_at(option, 5))
+        self.assertEqual(option.order, 2 * ORDER_GAP)
+
+
+class ReorderViewTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(cls.owner, 1, responses=0)[0]
+        # add_questions makes the last question depend on the radio question.
+        cls.questions = list(cls.survey.questions.order_by('order'))
+
+    def reorder(self, payload):
+        self.client.force_login(self.owner)
+        return self.client.post(reverse('surveys:survey_reorder', args=[self.survey.id]),
+                                json.dumps(payload), content_type='application/json')
+
+    def test_ids_must_be_integers(self):
+        radio = self.questions[0]
+        for payload in ([radio.id], {'question': str(radio.id)}, {'question': radio.id, 'after': [1]},
+                        {'question': True}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.reorder(payload).status_code, 400)
+
+    def test_questions_stay_below_their_rule_sources(self):
+        radio, text, dependent = self.questions[0], self.questions[2], self.questions[-1]
+        self.assertEqual(self.reorder({'question': dependent.id, 'after': None}).status_code, 400)
+        self.assertEqual(self.reorder({'question': radio.id, 'after': dependent.id}).status_code, 400)
+        self.assertEqual(self.reorder({'question': dependent.id, 'after': text.id}).status_code, 200)
+        self.assertEqual(self.reorder({'question': radio.id, 'after': self.questions[1].id}).status_code, 200)
+
+
+class RuleSetTests(TestCase):
+    rules = RuleSet([1, 2, 3, 4, 5], {
+        2: [(1, 'equals', '10')],
+        3: [(2, 'answered', '')],
+        4: [(1, 'not_equals', 'no')],
+        5: [(1, 'equals', '10'), (4, 'equals', '2.50')],
+    })
+
+    def test_operators(self):
+        self.assertTrue(self.rules.is_shown(2, {1: ['10', '11']}))
+        self.assertFalse(self.rules.is_shown(2, {1: ['11']}))
+        self.assertFalse(self.rules.is_shown(3, {2: ''}))
+        self.assertTrue(self.rules.is_shown(3, {2: 'x'}))
+        # Empty answers never equal anything, so "is not" holds for them.
+        self.assertTrue(self.rules.is_shown(4, {}))
+        self.assertFalse(self.rules.is_shown(4, {1: ' NO '}))
+        self.assertTrue(self.rules.is_shown(1, {}))
+
+    def test_all_rules_of_a_question_must_hold(self):
+        self.assertTrue(self.rules.is_shown(5, {1: '10', 4: Decimal('2.5')}))
+        self.assertFalse(self.rules.is_shown(5, {1: '10', 4: Decimal('3')}))
+        self.assertFalse(self.rules.is_shown(5, {1: '10', 4: 'n/a'}))
+
+    def test_answers_to_hidden_questions_are_ignored(self):
+        # Question 2 is hidden, so its answer cannot reveal question 3.
+        self.assertEqual(self.rules.reachable({1: '9', 2: 'x'}), {1, 4})
+        self.assertEqual(self.rules.reachable({1: '10', 2: 'x'}), {1, 2, 3, 4})
+
+    def test_as_json(self):
+        data = self.rules.as_json()
+        self.assertEqual(data['order'], [1, 2, 3, 4, 5])
+        self.assertEqual(data['rules']['5'], [[1, 'equals', '10'], [4, 'equals', '2.50']])
+
+
+class DisplayRuleTests(TestCase):
+    def test_clean_leaves_missing_questions_to_the_form(self):
+        DisplayRule(operator='answered').clean()
+
+
+class SkippedCountTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(owner, 1, responses=2)[0]
+        cls.text = cls.survey.questions.get(question_type='text')
+        cls.email = cls.survey.questions.get(question_type='email')
+        cls.skipper, = write_responses(get_schema(cls.survey), [{cls.text.id: '', cls.email.id: ''}])
+
+    def test_skips_count_towards_question_totals(self):
+        questions = list(self.survey.questions.all())
+        self.assertEqual(skipped_counts(self.survey, questions), {self.text.id: 1, self.email.id: 1})
+        self.assertEqual(self.skipper.skipped_question_ids, [self.text.id, self.email.id])
+        totals = {question['id']: question['total'] for question in compute_results(self.survey)}
+        self.assertEqual(totals[self.text.id], 3)
+
+    def test_skips_follow_the_response_filters(self):
+        others = self.survey.responses.exclude(id=self.skipper.id).values('id')
+        self.assertEqual(skipped_counts(self.survey, [self.text], responses=others), {})
+        self.assertEqual(skipped_counts(self.survey, [self.text], version=self.survey.published_version),
+                         {self.text.id: 1})
+
+
+@override_settings(SURVEYS_APPROXIMATE_RESULTS_AFTER=4, SURVEYS_RESULTS_SAMPLE_SIZE=3)
+class SamplingTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(cls.owner, 1, responses=3)[0]
+
+    def reservoir(self):
+        return ResponseReservoir.objects.get(survey=self.survey)
+
+    def test_small_surveys_are_only_counted(self):
+        reservoir = self.reservoir()
+        self.assertEqual((reservoir.seen, reservoir.ready, reservoir.samples.count()), (3, False, 0))
+        response_id = self.survey.responses.values_list('id', flat=True).first()
+        with self.assertNumQueries(1):
+            self.assertFalse(ResponseReservoir.offer(self.survey.id, [response_id]))
+        self.assertIsNone(large_survey_reservoir(self.survey))
+
+    def test_crossing_the_threshold_queues_the_sample(self):
+        self.add_responses(self.survey, 2)
+        job = Job.objects.get(kind='rebuild_response_samples')
+        self.assertEqual(job.params, {'survey_ids': [self.survey.id]})
+        self.assertIsNone(large_survey_reservoir(self.survey))
+
+        ResponseReservoir.rebuild(self.survey.id)
+        self.assertEqual(large_survey_reservoir(self.survey), self.reservoir())
+        self.add_responses(self.survey, 10)
+        reservoir = self.reservoir()
+        self.assertEqual(reservoir.seen, 15)
+        self.assertEqual(reservoir.samples.filter(response__survey=self.survey).count(), 3)
+        self.assertEqual(Job.objects.filter(kind='rebuild_response_samples').count(), 1)
+
+    def test_every_response_is_equally_likely_to_be_sampled(self):
+        random.seed(20261019)
+        responses = Response.objects.bulk_create([Response(survey=self.survey) for _ in range(20)])
+        ids = [response.id for response in responses]
+        trials, picked = 300, dict.fromkeys(ids, 0)
+        for _ in range(trials):
+            ResponseReservoir.objects.filter(survey=self.survey).update(seen=0, ready=True)
+            self.reservoir().samples.all().delete()
+            for start in range(0, len(ids), 5):
+                ResponseReservoir.offer(self.survey.id, ids[start:start + 5])
+            for response_id in self.reservoir().samples.values_list('response_id', flat=True):
+                picked[response_id] += 1
+        # Each is sampled with probability 3/20: 45 times, give or take 6.
+        for response_id, count in picked.items():
+            self.assertTrue(20 < count < 70, f"response {response_id} sampled {count} times")
+
+    @override_settings(SURVEYS_APPROXIMATE_RESULTS_AFTER=2)
+    def test_a_complete_sample_is_exact(self):
+        reservoir = ResponseReservoir.rebuild(self.survey.id)
+        approximate = approximate_results(self.survey, reservoir)
+        self.assertEqual((approximate['sample_size'], approximate['population']), (3, 3))
+        exact = {question['id']: question['total'] for question in compute_results(self.survey)}
+        radio = None
+        for question in approximate['questions']:
+            self.assertEqual(question['total'], exact[question['id']])
+            if question['type'] == 'radio':
+                radio = question
+        self.assertEqual({option['margin'] for option in radio['results']['options']}, {0})
+
+    @override_settings(SURVEYS_APPROXIMATE_RESULTS_AFTER=2)
+    def test_estimates_scale_to_the_population(self):
+        reservoir = ResponseReservoir.rebuild(self.survey.id)
+        reservoir.seen = 6
+        approximate = approximate_results(self.survey, reservoir)
+        self.assertEqual((approximate['sample_size'], approximate['population']), (3, 6))
+        radio = next(question for question in approximate['questions'] if question['type'] == 'radio')
+        self.assertEqual(radio['sample_total'], 3)
+        self.assertEqual(radio['total'], 6)
+        # The fixture picks each of the three options once.
+        margin = round(1.96 * math.sqrt(1 / 3 * 2 / 3 / 3) * math.sqrt(3 / 5) * 100, 2)
+        for option in radio['results']['options']:
+            self.assertEqual((option['count'], option['margin']), (2, margin))
+
+    def test_exact_results_are_for_the_owner(self):
+        url = reverse('surveys:survey_results_exact', args=[self.survey.id])
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertFalse(ResultsSnapshot.objects.exists())
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'password')
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+def _handler(kind, func):
+    # Register the real handlers first, or the patch would undo them on exit.
+    jobs.autodiscover()
+    return mock.patch.dict(jobs._handlers, {kind: func})
+
+
+class JobQueueTests(TestCase):
+    def make_stale(self, job_id):
+        Job.objects.filter(id=job_id).update(heartbeat_at=timezone.now() - 2 * jobs.stale_after())
+
+    def test_claim_takes_the_oldest_queued_job_once(self):
+        first = jobs.enqueue('noop')
+        second = jobs.enqueue('noop')
+        claimed = jobs.claim()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (first.pk, 'running', 1))
+        self.assertEqual(jobs.claim(['other']), None)
+        self.assertEqual(jobs.claim().pk, second.pk)
+        self.assertIsNone(jobs.claim())
+
+    def test_stale_jobs_are_reclaimed(self):
+        queued = jobs.enqueue('noop')
+        lost = jobs.claim()
+        self.make_stale(queued.pk)
+        reclaimed = jobs.claim()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (queued.pk, 2))
+        self.assertNotEqual(reclaimed.started_at, lost.started_at)
+        # The first worker's claim is void: its progress is ignored.
+        lost.report(5)
+        self.assertEqual(Job.objects.get(pk=queued.pk).progress, 0)
+
+    def test_outcome_of_a_reclaimed_job_is_dropped(self):
+        def reclaimed_meanwhile(current):
+            Job.objects.filter(pk=current.pk).update(started_at=timezone.now() + timedelta(seconds=1))
+            return {'stale': True}
+
+        queued = jobs.enqueue('slow')
+        jobs.claim()
+        with _handler('slow', reclaimed_meanwhile), self.assertLogs('surveys.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_job(queued.pk), 'lost')
+        self.assertEqual(Job.objects.get(pk=queued.pk).status, 'running')
+
+    def test_failures_are_recorded(self):
+        def broken(current, survey_id):
+            raise ValueError(f"no survey {survey_id}")
+
+        queued = jobs.enqueue('broken', survey_id=7)
+        with _handler('broken', broken), self.assertLogs('surveys.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_job(jobs.claim().pk), 'failed')
+        failed = Job.objects.get(pk=queued.pk)
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('ValueError: no survey 7', failed.error)
+        self.assertIsNone(jobs.claim())
+
+    @override_settings(SURVEYS_JOBS_MAX_ATTEMPTS=2)
+    def test_gives_up_after_max_attempts(self):
+        queued = jobs.enqueue('crashy')
+        for attempt in range(2):
+            self.assertEqual(jobs.claim().pk, queued.pk)
+            self.make_stale(queued.pk)
+        self.assertIsNone(jobs.claim())
+        abandoned = Job.objects.get(pk=queued.pk)
+        self.assertEqual((abandoned.status, abandoned.attempts), ('failed', 2))
+        self.assertIn('2 attempts', abandoned.error)
+
+    def test_eagerly_run_jobs_claim_themselves(self):
+        queued = jobs.enqueue('count')
+        with _handler('count', lambda current: current.report(3, 3) or {'counted': 3}):
+            self.assertEqual(jobs.run_job(queued.pk), 'done')
+        done = Job.objects.get(pk=queued.pk)
+        self.assertEqual((done.status, done.attempts, done.progress, done.result), ('done', 1, 3, {'counted': 3}))
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(SURVEYS_JOBS_STALE_AFTER=0.3)
+    def test_long_steps_keep_the_job_alive(self):
+        queued = jobs.enqueue('slow')
+        with _handler('slow', lambda current: time.sleep(0.5)):
+            self.assertEqual(jobs.run_job(jobs.claim().pk), 'done')
+        done = Job.objects.get(pk=queued.pk)
+        self.assertGreater(done.heartbeat_at, done.started_at + timedelta(seconds=0.1))
+
+
+@override_settings(SURVEYS_DELETE_BATCH_SIZE=2)
+class ResponseAdminDeleteTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.survey, cls.other = cls.add_surveys(cls.admin, 2, responses=3)
+
+    def delete(self, responses, query=''):
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('admin:surveys_response_changelist') + query, {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [response.pk for response in responses],
+        })
+
+    def test_large_deletions_queue_the_filter(self):
+        self.delete(self.survey.responses.all(), f'?survey__id__exact={self.survey.id}')
+        job = Job.objects.get(kind='delete_responses')
+        self.assertEqual(job.params['filters'], {'survey__id__exact': str(self.survey.id)})
+        self.assertNotIn('response_ids', job.params)
+        self.assertEqual(self.survey.responses.count(), 3)
+
+        self.assertEqual(jobs.run_job(job.pk), 'done')
+        self.assertEqual(self.survey.responses.count(), 0)
+        self.assertEqual(self.other.responses.count(), 3)
+        self.assertEqual(Job.objects.get(pk=job.pk).result, {'responses': 3})
+
+    def test_small_deletions_run_at_once(self):
+        self.delete(self.survey.responses.all()[:2])
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.survey.responses.count(), 1)
+
+    def test_selections_the_filter_does_not_describe_run_at_once(self):
+        # Hand-picked rows across surveys: their id range holds others too.
+        picked = [self.survey.responses.order_by('id').first(), *self.other.responses.order_by('-id')[:2]]
+        self.delete(picked)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.survey.responses.count() + self.other.responses.count(), 3)
+
+    def test_deleting_needs_permission_for_what_goes_with_it(self):
+        staff = CustomUser.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        staff.user_permissions.set(Permission.objects.filter(codename__in=[
+            'view_survey', 'delete_survey', 'view_response', 'delete_response', 'view_answer',
+        ]))
+        self.client.force_login(staff)
+
+        confirm = self.client.get(reverse('admin:surveys_survey_delete', args=[self.survey.pk]))
+        self.assertEqual(confirm.context['perms_lacking'], {'question', 'option', 'answer'})
+        self.assertEqual(self.client.post(reverse('admin:surveys_survey_delete', args=[self.survey.pk]),
+                                          {'post': 'yes'}).status_code, 403)
+        self.assertTrue(Survey.objects.filter(pk=self.survey.pk).exists())
+
+        refused = self.client.post(reverse('admin:surveys_response_changelist'), {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': [self.survey.responses.first().pk],
+        })
+        self.assertEqual(refused.status_code, 403)
+        self.assertEqual(self.survey.responses.count(), 3)
+
+        staff.user_permissions.add(Permission.objects.get(codename='delete_answer'))
+        self.delete(self.survey.responses.all()[:1])
+        self.assertEqual(self.survey.responses.count(), 2)
+
+    def test_deleted_responses_leave_the_sample_count(self):
+        ResponseReservoir.rebuild(self.survey.id)
+        picked = list(self.survey.responses.values_list('id', flat=True)[:2])
+        delete_responses(Response.objects.filter(id__in=picked))
+        self.assertEqual(ResponseReservoir.objects.get(survey=self.survey).seen, 1)
+        self.assertEqual(ResponseReservoir.objects.get(survey=self.other).seen, 3)
+
+
+class TermFrequencyTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(owner, 1, responses=0)[0]
+        cls.question = cls.survey.questions.get(question_type='text')
+
+    def answer(self, *texts):
+        self.survey.refresh_from_db()
+        schema = get_schema(self.survey)
+        tallies = TermFrequency.objects.order_by('id').values_list('version', 'term', 'count')
+        before = list(tallies)
+        with self.captureOnCommitCallbacks() as callbacks:
+            responses = write_responses(schema, [{self.question.id: text} for text in texts])
+        # Nothing is counted inside the submission's transaction.
+        self.assertEqual(list(tallies), before)
+        for callback in callbacks:
+            callback()
+        return responses
+
+    def counts(self):
+        return dict(TermFrequency.objects.filter(question=self.question).values_list('term', 'count'))
+
+    @override_settings(SURVEYS_TEXT_PRUNE_EVERY=0)
+    def test_terms_are_counted_after_commit_and_forgotten_on_delete(self):
+        first, _ = self.answer("Slow delivery", "slow support")
+        self.assertEqual(self.counts(), {'slow': 2, 'delivery': 1, 'support': 1,
+                                         'slow delivery': 1, 'slow support': 1})
+        delete_responses(Response.objects.filter(id=first.id))
+        self.assertEqual(self.counts(), {'slow': 1, 'support': 1, 'slow support': 1})
+
+    @override_settings(SURVEYS_TEXT_MAX_TERMS=2, SURVEYS_TEXT_PRUNE_EVERY=1)
+    def test_long_tails_are_pruned_as_answers_arrive(self):
+        self.answer("great price", "great staff", "great price fast", "rude")
+        self.assertEqual(self.counts(), {'great': 3, 'price': 2, 'great price': 2})
+
+    @override_settings(SURVEYS_TEXT_PRUNE_EVERY=0)
+    def test_filtered_results_count_only_their_answers(self):
+        first, second, _ = self.answer("slow delivery", "slow support", "friendly staff")
+
+        def terms(**filters):
+            result = next(r for r in compute_results(self.survey, **filters) if r['id'] == self.question.id)
+            return {term['term']: term['count'] for term in result['results']['terms']}
+
+        self.assertEqual(terms(), {'slow': 2, 'delivery': 1, 'support': 1, 'friendly': 1, 'staff': 1})
+        picked = Response.objects.filter(id__in=[first.id, second.id]).values('id')
+        self.assertEqual(terms(responses=picked), {'slow': 2, 'delivery': 1, 'support': 1})
+
+    @override_settings(SURVEYS_TEXT_PRUNE_EVERY=0)
+    def test_each_version_has_its_own_tallies(self):
+        first = self.survey.published_version
+        self.answer("slow delivery")
+        Question.objects.filter(pk=self.question.pk).update(help_text="Be specific")
+        second = publish(self.survey)
+        self.answer("slow support", "friendly staff")
+
+        def terms(version):
+            result = next(r for r in compute_results(self.survey, version=version) if r['id'] == self.question.id)
+            return {term['term']: term['count'] for term in result['results']['terms']}
+
+        # Read from the tallies, not recounted from the answers.
+        with mock.patch('surveys.results.filtered_top_terms') as recount:
+            self.assertEqual(terms(first), {'slow': 1, 'delivery': 1})
+        recount.assert_not_called()
+        self.assertEqual(terms(second), {'slow': 1, 'support': 1, 'friendly': 1, 'staff': 1})
+        self.assertEqual(terms(None), {'slow': 2, 'delivery': 1, 'support': 1, 'friendly': 1, 'staff': 1})
+
+        delete_responses(Response.objects.filter(version=first))
+        self.assertEqual(terms(first), {})
+        self.assertEqual(terms(second)['slow'], 1)
+
+        TermFrequency.objects.all().delete()
+        rebuild_terms(self.question.id)
+        self.assertEqual(
+            set(TermFrequency.objects.filter(term='slow').values_list('version__number', 'count')), {(2, 1)}
+        )
+
+
+class TimingTests(SurveyDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user('owner', 'owner@example.com', 'password')
+        cls.survey = cls.add_surveys(owner, 1, responses=0)[0]
+        cls.question = cls.survey.questions.first()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Write what a test leaves buffered inside its own transaction.
+        self.addCleanup(get_buffer().flush)
+
+    def beacon(self, events, token=None, **headers):
+        return self.client.post(
+            reverse('surveys:survey_beacon', args=[self.survey.id]),
+            json.dumps({'token': token or make_token(self.survey.id, 'visit'), 'events': events}),
+            content_type='application/json', **headers,
+        )
+
+    def test_read_token(self):
+        visit, started_at = read_token(make_token(self.survey.id, 'abc'), self.survey.id)
+        self.assertEqual(visit, 'abc')
+        self.assertLess(timezone.now() - started_at, timedelta(minutes=1))
+
+        self.assertIsNone(read_token('', self.survey.id))
+        self.assertIsNone(read_token(make_token(self.survey.id) + 'x', self.survey.id))
+        self.assertIsNone(read_token(make_token(self.survey.id + 1), self.survey.id))
+        day_ago = time.time() - 25 * 60 * 60
+        self.assertIsNone(read_token(make_token(self.survey.id, started=day_ago), self.survey.id))
+        self.assertIsNone(read_token(make_token(self.survey.id, started=time.time() + 60), self.survey.id))
+
+    def test_parse_beacon_keeps_only_valid_events(self):
+        visit, events = parse_beacon({'token': make_token(self.survey.id, 'abc'), 'events': [
+            {'type': 'view'},
+            {'type': 'dwell', 'question': self.question.id, 'ms': 10 ** 9},
+            {'type': 'dwell', 'question': self.question.id, 'ms': '5'},
+            {'type': 'dwell', 'question': 0, 'ms': 5},
+            {'type': 'abandon', 'question': self.question.id},
+            {'type': 'submit'},
+            'junk',
+        ]}, self.survey.id, {self.question.id})
+        self.assertEqual(visit, 'abc')
+        self.assertEqual([(event.kind, event.question_id, event.dwell_ms) for event in events], [
+            ('view', None, None), ('dwell', self.question.id, 30 * 60 * 1000), ('abandon', self.question.id, None),
+        ])
+        self.assertEqual(parse_beacon({'events': []}, self.survey.id, set()), (None, []))
+        self.assertEqual(parse_beacon([], self.survey.id, set()), (None, []))
+        _, events = parse_beacon({'token': make_token(self.survey.id), 'events': [{'type': 'view'}] * 500},
+                                 self.survey.id, set())
+        self.assertEqual(len(events), 100)
+
+    def test_buffer_writes_full_batches_and_flushes_the_rest(self):
+        buffer = EventBuffer(max_size=3, max_age=60)
+        event = lambda: TimingEvent(survey=self.survey, visit='v', kind='view')  # noqa: E731
+        self.assertEqual(buffer.add([event(), event()]), 0)
+        self.assertEqual(TimingEvent.objects.count(), 0)
+        self.assertEqual(buffer.add([event()]), 3)
+        self.assertEqual(len(buffer), 0)
+        buffer.add([event()])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(TimingEvent.objects.count(), 4)
+        self.assertIsNone(buffer._timer)
+
+    def test_buffer_drops_a_batch_the_database_refuses(self):
+        buffer = EventBuffer(max_size=10, max_age=60)
+        buffer.add([TimingEvent(survey=self.survey, visit='v', kind='view')])
+        with mock.patch.object(TimingEvent.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertLogs('surveys.timing', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 0)
+
+    def test_view_beacons_start_a_new_visit(self):
+        response = self.beacon([{'type': 'view'}])
+        visit, _ = read_token(response.json()['token'], self.survey.id)
+        self.assertNotEqual(visit, 'visit')
+        get_buffer().flush()
+        self.assertEqual(list(TimingEvent.objects.values_list('visit', flat=True)), [visit])
+
+    def test_funnel_follows_the_version_served(self):
+        first = self.survey.published_version
+        self.beacon([{'type': 'view'}, {'type': 'dwell', 'question': self.question.id, 'ms': 1000}])
+        Question.objects.filter(pk=self.question.pk).update(help_text="Take your time")
+        second = publish(self.survey)
+        self.beacon([{'type': 'view'}], make_token(self.survey.id, 'later'))
+        self.beacon([{'type': 'view'}], make_token(self.survey.id, 'last'))
+        get_buffer().flush()
+
+        self.assertEqual(timing_stats(self.survey, version=first)['views'], 1)
+        self.assertEqual(timing_stats(self.survey, version=first)['questions'][0]['reached'], 1)
+        self.assertEqual(timing_stats(self.survey, version=second)['views'], 2)
+        self.assertEqual(timing_stats(self.survey, version=second)['questions'][0]['reached'], 0)
+        self.assertEqual(timing_stats(self.survey)['views'], 3)
+
+    @override_settings(SURVEYS_TIMING_MAX_EVENTS_PER_VISIT=3, SURVEYS_TIMING_MAX_EVENTS_PER_IP=5)
+    def test_beacons_beyond_the_allowances_are_refused(self):
+        abandon = {'type': 'abandon', 'question': self.question.id}
+        self.assertEqual(self.beacon([abandon] * 2).status_code, 204)
+        self.assertEqual(self.beacon([abandon] * 2).status_code, 429)
+        # A fresh visit from the same client still runs into the IP's allowance.
+        self.assertEqual(self.beacon([abandon] * 2, make_token(self.survey.id, 'other')).status_code, 204)
+        self.assertEqual(self.beacon([abandon] * 2, make_token(self.survey.id, 'third')).status_code, 429)
+        get_buffer().flush()
+        self.assertEqual(TimingEvent.objects.count(), 4)
+
+    @override_settings(SURVEYS_TIMING_MAX_EVENTS_PER_IP=2)
+    def test_forwarded_for_headers_do_not_reset_the_ip_allowance(self):
+        abandon = {'type': 'abandon', 'question': self.question.id}
+        for n, status in enumerate([204, 429]):
+            token = make_token(self.survey.id, f'visit{n}')
+            response = self.beacon([abandon] * 2, token, HTTP_X_FORWARDED_FOR=f'10.0.0.{n}')
+            self.assertEqual(response.status_code, status)
+
+    def test_client_ip_trusts_only_the_configured_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.9', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4, 10.0.0.8')
+        self.assertEqual(client_ip(request), '10.0.0.9')
+        with override_settings(SURVEYS_TRUSTED_PROXIES=2):
+            self.assertEqual(client_ip(request), '1.2.3.4')
+        with override_settings(SURVEYS_TRUSTED_PROXIES=5):
+            self.assertEqual(client_ip(request), '10.0.0.9')
+
+
+class TimingBufferThreadTests(TransactionTestCase):
+    def test_a_partial_batch_is_written_from_the_timer_thread(self):
+        survey = Survey.objects.create(title="Timed", created_by=CustomUser.objects.create_user('owner', 'owner@example.com'))
+        buffer = EventBuffer(max_size=100, max_age=0.05)
+        buffer.add([TimingEvent(survey=survey, visit='v', kind='view')])
+        deadline = time.monotonic() + 5
+        while not TimingEvent.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(TimingEvent.objects.count(), 1)
+        self.assertEqual(len(buffer), 0)
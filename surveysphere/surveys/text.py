@@ -0,0 +1,279 @@
+"""
+Term frequencies for open-text answers.
+
+Answers to ``text`` and ``textarea`` questions are tokenized once they are
+committed and their words and two-word phrases counted in
+``TermFrequency``, per question and published version, so the results page
+can show the most common terms (and word-cloud weights) with one indexed
+query instead of listing every answer. Deleting answers takes their terms
+off the counts again.
+
+The table is kept near ``SURVEYS_TEXT_MAX_TERMS`` rows per question and
+version: about once per ``SURVEYS_TEXT_PRUNE_EVERY`` answers to a question,
+``prune_terms`` drops its long tail. ``rebuild_terms`` recounts a question's
+answers by streaming them through a heavy-hitters summary, so memory stays
+bounded however many answers there are.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum, Window
+from django.db.models.functions import Greatest, RowNumber
+
+from .models import Answer, TermFrequency
+
+TEXT_TYPES = ('text', 'textarea')
+
+MAX_TERM_LENGTH = TermFrequency._meta.get_field('term').max_length
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves also really much get got im dont
+""".split())
+
+
+def max_terms():
+    return getattr(settings, 'SURVEYS_TEXT_MAX_TERMS', 500)
+
+
+def prune_every():
+    return getattr(settings, 'SURVEYS_TEXT_PRUNE_EVERY', 100)
+
+
+def tokenize(text):
+    """Lower-cased words of ``text`` without stop words"""
+    return [
+        word for word in (match.group().replace('’', "'") for match in WORD_RE.finditer(text.lower()))
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def terms_of(text):
+    """The words and adjacent word pairs in ``text``, each counted once"""
+    words = tokenize(text)
+    terms = set(words)
+    terms.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return {term for term in terms if len(term) <= MAX_TERM_LENGTH}
+
+
+def _term_counts(texts):
+    """Counter of ``(question_id, version_id, term)`` over ``(question_id, version_id, text)`` rows"""
+    counts = Counter()
+    for question_id, version_id, text in texts:
+        counts.update((question_id, version_id, term) for term in terms_of(text))
+    return counts
+
+
+def _grouped(counts):
+    # One UPDATE per question, version and amount, rather than one per term;
+    # in key order, so concurrent writers lock shared rows in the same order.
+    groups = {}
+    for (question_id, version_id, term), count in counts.items():
+        groups.setdefault((question_id, version_id, count), []).append(term)
+    return sorted((key, sorted(terms)) for key, terms in groups.items())
+
+
+def record_terms(answers, question_types, version_id):
+    """
+    Add the terms of freshly written ``answers`` to their questions' tallies
+    for the published version ``version_id`` they answered. Run it after the
+    answers' transaction commits: the UPDATEs lock popular terms' rows,
+    which submissions should not wait on.
+    """
+    texts = [
+        (answer.question_id, version_id, answer.text_answer) for answer in answers
+        if answer.text_answer and question_types.get(answer.question_id) in TEXT_TYPES
+    ]
+    counts = _term_counts(texts)
+    if not counts:
+        return
+
+    with transaction.atomic():
+        TermFrequency.objects.bulk_create([
+            TermFrequency(question_id=question_id, version_id=version_id, term=term, words=term.count(' ') + 1)
+            for question_id, version_id, term in sorted(counts)
+        ], ignore_conflicts=True)
+        for (question_id, version_id, count), terms in _grouped(counts):
+            TermFrequency.objects.filter(question_id=question_id, version_id=version_id, term__in=terms).update(
+                count=F('count') + count
+            )
+
+    # Answer ids are sequential, so this prunes each question about once per
+    # prune_every() of its answers without keeping a counter.
+    every = prune_every()
+    if every:
+        due = {answer.question_id for answer in answers if answer.id % every == 0}
+        for question_id in due & {question_id for question_id, _, _ in texts}:
+            prune_terms(question_id, version_id)
+
+
+def forget_terms(answers):
+    """
+    Take the terms of ``answers`` (an Answer queryset about to be deleted)
+    off their questions' tallies, dropping terms no answer uses any more.
+    """
+    texts = answers.filter(
+        question__question_type__in=TEXT_TYPES, response__version__isnull=False
+    ).exclude(text_answer='').values_list('question_id', 'response__version_id', 'text_answer')
+    counts = _term_counts(texts)
+    if not counts:
+        return
+    with transaction.atomic():
+        for (question_id, version_id, count), terms in _grouped(counts):
+            # Pruning and rebuilds make counts approximate; never go below zero.
+            TermFrequency.objects.filter(question_id=question_id, version_id=version_id, term__in=terms).update(
+                count=Greatest(F('count') - count, 0)
+            )
+        TermFrequency.objects.filter(question_id__in={question_id for question_id, _, _ in counts}, count=0).delete()
+
+
+def top_terms(question_ids, version=None, limit=20):
+    """
+    Return ``{question_id: {'terms': [...], 'phrases': [...]}}`` with the
+    ``limit`` most common words and phrases per question among the answers
+    to published ``version``, in one query. Without a version the tallies
+    of every version are added up.
+    """
+    if not question_ids:
+        return {}
+    tallies = TermFrequency.objects.filter(question_id__in=question_ids)
+    if version is None:
+        counts = {}
+        for question_id, term, count in tallies.values('question_id', 'term').annotate(
+            total=Sum('count')
+        ).values_list('question_id', 'term', 'total'):
+            counts.setdefault(question_id, {})[term] = count
+        return _summarise(question_ids, _ranked(question_ids, counts, limit))
+    ranked = tallies.filter(version=version).annotate(
+        rank=Window(RowNumber(), partition_by=[F('question_id'), F('words')], order_by=[F('count').desc(), F('term')])
+    ).filter(rank__lte=limit).order_by('question_id', 'words', 'rank')
+    return _summarise(question_ids, ranked.values_list('question_id', 'term', 'count'))
+
+
+def filtered_top_terms(answers, question_ids, limit=20):
+    """
+    ``top_terms`` counted from ``answers`` (an Answer queryset restricted to
+    some responses) rather than the stored tallies, which cover every
+    answer. Two streaming passes over those answers' text, so filtered
+    results cost a scan the unfiltered page avoids.
+    """
+    if not question_ids:
+        return {}
+    texts = answers.filter(question__in=question_ids).exclude(text_answer='').values_list('question_id', 'text_answer')
+    return _summarise(question_ids, _ranked(question_ids, count_terms(texts, max_terms()), limit))
+
+
+def _ranked(question_ids, counts, limit):
+    """``(question_id, term, count)`` rows of the most common terms in ``{question_id: {term: count}}``"""
+    ranked = []
+    for question_id in question_ids:
+        by_length = {1: [], 2: []}
+        for term, count in sorted(counts.get(question_id, {}).items(), key=lambda item: (-item[1], item[0])):
+            by_length[term.count(' ') + 1].append((question_id, term, count))
+        ranked.extend(by_length[1][:limit] + by_length[2][:limit])
+    return ranked
+
+
+def _summarise(question_ids, ranked):
+    """The top_terms result for ``(question_id, term, count)`` rows, most common first"""
+    top = {question_id: {'terms': [], 'phrases': []} for question_id in question_ids}
+    for question_id, term, count in ranked:
+        key = 'phrases' if ' ' in term else 'terms'
+        top[question_id][key].append({'term': term, 'count': count})
+
+    for terms in top.values():
+        # Word-cloud weight from 1 (least common shown) to 5 (most common).
+        counts = [term['count'] for term in terms['terms']]
+        low, high = (min(counts), max(counts)) if counts else (0, 0)
+        for term in terms['terms']:
+            term['weight'] = 1 + round(4 * (term['count'] - low) / (high - low)) if high > low else 3
+    return top
+
+
+def prune_terms(question_id, version_id=None):
+    """
+    Drop all but the ``SURVEYS_TEXT_MAX_TERMS`` most common terms of a
+    question's tally for ``version_id``, or of each of its tallies
+    """
+    tallies = TermFrequency.objects.filter(question_id=question_id)
+    if version_id is None:
+        version_ids = tallies.order_by().values_list('version_id', flat=True).distinct()
+        return sum(prune_terms(question_id, version_id) for version_id in list(version_ids))
+    terms = tallies.filter(version_id=version_id)
+    keep = terms.order_by('-count', 'term').values_list('count', flat=True)[max_terms() - 1:max_terms()]
+    threshold = next(iter(keep), None)
+    if threshold is None:
+        return 0
+    deleted, _ = terms.filter(count__lt=threshold).delete()
+    return deleted
+
+
+class HeavyHitters:
+    """
+    Misra-Gries frequent-items summary in fixed memory: every term occurring
+    more than n / (capacity + 1) times in a stream of n terms is guaranteed
+    to be among the candidates, at amortised constant cost per term.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, term):
+        if term in self.counts:
+            self.counts[term] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[term] = 1
+        else:
+            for candidate in list(self.counts):
+                self.counts[candidate] -= 1
+                if not self.counts[candidate]:
+                    del self.counts[candidate]
+
+    def candidates(self):
+        return set(self.counts)
+
+
+def count_terms(texts, keep, chunk_size=2000):
+    """
+    ``{key: {term: count}}`` for up to ``keep`` of the most common terms per
+    key in ``texts``, a queryset of ``(key, text)`` such as question ids and
+    their answers, in two streaming passes: find the candidate heavy
+    hitters, then count those exactly.
+    """
+    summaries = {}
+    for key, text in texts.iterator(chunk_size=chunk_size):
+        summary = summaries.setdefault(key, HeavyHitters(keep * 4))
+        for term in terms_of(text):
+            summary.add(term)
+
+    candidates = {key: summary.candidates() for key, summary in summaries.items()}
+    counts = {key: Counter() for key in summaries}
+    for key, text in texts.iterator(chunk_size=chunk_size):
+        counts[key].update(terms_of(text) & candidates[key])
+    return {key: dict(counter.most_common(keep)) for key, counter in counts.items()}
+
+
+def rebuild_terms(question_id, chunk_size=2000):
+    """Recount a question's terms per version from its answers (see ``count_terms``)"""
+    texts = Answer.objects.filter(
+        question_id=question_id, response__version__isnull=False
+    ).exclude(text_answer='').values_list('response__version_id', 'text_answer')
+    counts = count_terms(texts, max_terms(), chunk_size)
+
+    with transaction.atomic():
+        TermFrequency.objects.filter(question_id=question_id).delete()
+        TermFrequency.objects.bulk_create([
+            TermFrequency(question_id=question_id, version_id=version_id, term=term, words=term.count(' ') + 1,
+                          count=count)
+            for version_id, terms in counts.items()
+            for term, count in terms.items()
+        ])
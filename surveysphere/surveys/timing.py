@@ -0,0 +1,266 @@
+"""
+Respondent timing: how long people take and where they give up.
+
+The survey page carries a signed timing token naming the survey, a visit id
+and the time the page was served. Submitting the form with it records
+``Response.started_at``; the page's optional beacon reports a ``view`` (and
+gets a fresh token, since cached pages share theirs), time spent on each
+question, and abandonment when the page is left unsubmitted.
+
+Beacon events go through ``EventBuffer``, an in-process append-only buffer
+written with one bulk insert per ``SURVEYS_TIMING_FLUSH_SIZE`` events or
+``SURVEYS_TIMING_FLUSH_INTERVAL`` seconds, whichever comes first, so a busy
+survey costs one INSERT per batch rather than one per event. Events still
+buffered when a process dies are lost; the stats are estimates anyway.
+
+A token can be replayed and a ``view`` mints new visits, so each visit may
+report ``SURVEYS_TIMING_MAX_EVENTS_PER_VISIT`` events and each client IP
+``SURVEYS_TIMING_MAX_EVENTS_PER_IP`` an hour. The counts live in Django's
+cache: per process unless a shared cache is configured.
+"""
+import atexit
+import logging
+import secrets
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from threading import Lock, Timer
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F
+from django.utils import timezone
+
+from .models import Response, TimingEvent
+from .versions import published_questions
+
+logger = logging.getLogger(__name__)
+
+_signer = signing.Signer(salt='surveys.timing')
+
+# Longest dwell a single beacon event may report; anything longer is a tab
+# left open, not time spent on the question.
+MAX_DWELL_MS = 30 * 60 * 1000
+MAX_EVENTS_PER_BEACON = 100
+
+
+def max_duration():
+    """Completion times longer than this are not recorded"""
+    return timedelta(seconds=getattr(settings, 'SURVEYS_TIMING_MAX_SECONDS', 24 * 60 * 60))
+
+
+def new_visit():
+    return secrets.token_hex(8)
+
+
+def make_token(survey_id, visit=None, started=None):
+    started = int(started if started is not None else time.time())
+    return _signer.sign(f"{survey_id}:{visit or new_visit()}:{started}")
+
+
+def read_token(token, survey_id):
+    """
+    Return ``(visit, started_at)`` from a timing token for ``survey_id``, or
+    None if it is missing, forged, for another survey or too old.
+    """
+    if not token:
+        return None
+    try:
+        token_survey, visit, started = _signer.unsign(token).split(':')
+        started_at = datetime.fromtimestamp(int(started), tz=dt_timezone.utc)
+    except (signing.BadSignature, ValueError, OverflowError, OSError):
+        return None
+    if token_survey != str(survey_id):
+        return None
+    now = timezone.now()
+    if not now - max_duration() <= started_at <= now:
+        return None
+    return visit, started_at
+
+
+class EventBuffer:
+    """Append-only buffer of unsaved TimingEvent rows, written in bulk"""
+
+    def __init__(self, max_size=500, max_age=5.0):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._events = []
+        self._timer = None
+        self._lock = Lock()
+
+    def add(self, events):
+        with self._lock:
+            self._events.extend(events)
+            if len(self._events) < self.max_size:
+                if self._events and self._timer is None:
+                    # Low traffic: make sure a partial batch is still written.
+                    self._timer = Timer(self.max_age, self._flush_from_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return 0
+            batch = self._take()
+        return self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        return self._write(batch)
+
+    def __len__(self):
+        return len(self._events)
+
+    def _take(self):
+        # Call with the lock held.
+        batch, self._events = self._events, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection; don't leak it.
+            connections.close_all()
+
+    def _write(self, batch):
+        if not batch:
+            return 0
+        try:
+            TimingEvent.objects.bulk_create(batch, batch_size=1000)
+        except DatabaseError:
+            logger.exception("Dropped %d timing events", len(batch))
+            return 0
+        return len(batch)
+
+
+@lru_cache(maxsize=None)
+def get_buffer():
+    buffer = EventBuffer(
+        max_size=getattr(settings, 'SURVEYS_TIMING_FLUSH_SIZE', 500),
+        max_age=getattr(settings, 'SURVEYS_TIMING_FLUSH_INTERVAL', 5.0),
+    )
+    atexit.register(buffer.flush)
+    return buffer
+
+
+def parse_beacon(payload, survey_id, question_ids, version_id=None):
+    """
+    Validate a beacon body and return ``(visit, events)``: the visit named by
+    its token and the unsaved TimingEvent rows it reports, for published
+    version ``version_id``. Returns ``(None, [])`` for an unusable beacon;
+    bad events are skipped.
+    """
+    if not isinstance(payload, dict):
+        return None, []
+    token = read_token(payload.get('token'), survey_id)
+    raw_events = payload.get('events')
+    if token is None or not isinstance(raw_events, list):
+        return None, []
+    visit, _ = token
+
+    events = []
+    for raw in raw_events[:MAX_EVENTS_PER_BEACON]:
+        if not isinstance(raw, dict):
+            continue
+        kind = raw.get('type')
+        question_id = raw.get('question')
+        if question_id is not None and question_id not in question_ids:
+            continue
+        if kind == 'dwell':
+            ms = raw.get('ms')
+            if question_id is None or not isinstance(ms, int) or ms <= 0:
+                continue
+            events.append(TimingEvent(survey_id=survey_id, version_id=version_id, visit=visit, kind='dwell',
+                                      question_id=question_id, dwell_ms=min(ms, MAX_DWELL_MS)))
+        elif kind in ('view', 'abandon'):
+            events.append(TimingEvent(survey_id=survey_id, version_id=version_id, visit=visit, kind=kind,
+                                      question_id=question_id))
+    return visit, events
+
+
+def _within(key, count, limit, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key, count) <= limit
+    except ValueError:
+        # Evicted between add and incr: start counting again.
+        cache.set(key, count, timeout)
+        return count <= limit
+
+
+def allow(visit, ip_address, count):
+    """Whether ``count`` more events fit in the allowances of ``visit`` and ``ip_address``"""
+    per_visit = getattr(settings, 'SURVEYS_TIMING_MAX_EVENTS_PER_VISIT', 1000)
+    per_ip = getattr(settings, 'SURVEYS_TIMING_MAX_EVENTS_PER_IP', 10000)
+    return (
+        _within(f'surveys.timing.visit:{visit}', count, per_visit, int(max_duration().total_seconds()))
+        and _within(f'surveys.timing.ip:{ip_address}', count, per_ip, 60 * 60)
+    )
+
+
+def record(events):
+    get_buffer().add(events)
+
+
+def timing_stats(survey, questions=None, version=None):
+    """
+    Completion times and the drop-off funnel of ``survey``: three queries,
+    whatever the number of questions or events. The funnel follows
+    ``questions``, by default those of the published version. Given a
+    ``version``, both cover only the responses to it and the visits that
+    were served it; otherwise every version's.
+    """
+    if questions is None:
+        questions = published_questions(survey)
+
+    responses = Response.objects.filter(survey=survey, started_at__isnull=False)
+    if version is not None:
+        responses = responses.filter(version=version)
+    timed = responses.annotate(
+        duration=ExpressionWrapper(F('submitted_at') - F('started_at'), output_field=DurationField())
+    )
+    completion = timed.aggregate(count=Count('id'), average=Avg('duration'))
+    median = None
+    if completion['count']:
+        median = timed.order_by('duration').values_list('duration', flat=True)[completion['count'] // 2]
+
+    events = TimingEvent.objects.filter(survey=survey)
+    if version is not None:
+        events = events.filter(version=version)
+    rows = (
+        events.order_by()
+        .values('kind', 'question')
+        .annotate(visits=Count('visit', distinct=True), dwell=Avg('dwell_ms'))
+    )
+    visits, dwell = {}, {}
+    for row in rows:
+        visits[row['kind'], row['question']] = row['visits']
+        if row['kind'] == 'dwell':
+            dwell[row['question']] = row['dwell']
+
+    started = visits.get(('view', None), 0)
+    funnel = []
+    for question in questions:
+        reached = visits.get(('dwell', question.id), 0)
+        funnel.append({
+            'id': question.id,
+            'question': question.text,
+            'reached': reached,
+            'reached_percentage': round(reached / started * 100, 1) if started else None,
+            'abandoned': visits.get(('abandon', question.id), 0),
+            'average_dwell': round(dwell[question.id] / 1000, 1) if dwell.get(question.id) is not None else None,
+        })
+
+    return {
+        'completions': completion['count'],
+        'average_seconds': round(completion['average'].total_seconds()) if completion['average'] else None,
+        'median_seconds': round(median.total_seconds()) if median is not None else None,
+        'views': started,
+        'submitted': visits.get(('submit', None), 0),
+        'abandoned': sum(count for (kind, _), count in visits.items() if kind == 'abandon'),
+        'questions': funnel,
+    }
@@ -8,11 +8,19 @@ urlpatterns = [
     path("", views.survey_list, name="survey_list"),
     path("my-surveys/", views.my_surveys, name="my_surveys"),
     path("survey/<int:survey_id>/", views.survey_detail, name="survey_detail"),
+    path("survey/<int:survey_id>/beacon/", views.survey_beacon, name="survey_beacon"),
     path("survey/<int:survey_id>/results/", views.survey_results, name="survey_results"),
+    path("survey/<int:survey_id>/results/live/", views.survey_results_stream, name="survey_results_stream"),
+    path("survey/<int:survey_id>/results/exact/", views.survey_results_exact, name="survey_results_exact"),
     path("create/", views.survey_create, name="survey_create"),
     path("survey/<int:survey_id>/add-questions/", views.add_questions, name="add_questions"),
+    path("survey/<int:survey_id>/reorder/", views.survey_reorder, name="survey_reorder"),
+    path("survey/<int:survey_id>/publish/", views.survey_publish, name="survey_publish"),
     path("success/", views.survey_success, name="survey_success"),
-    path("create/sucess/",views.survey_create_success,name="create_success")
+    path("create/sucess/",views.survey_create_success,name="create_success"),
+    path("import/", views.survey_import, name="survey_import"),
+    path("survey/<int:survey_id>/export/", views.survey_export, name="survey_export"),
+    path("jobs/<int:job_id>/", views.job_status, name="job_status"),
 ]
 
 
@@ -0,0 +1,153 @@
+"""
+Published, immutable survey versions.
+
+A survey's Question, Option and DisplayRule rows are its draft: the owner
+can edit them at any time without respondents noticing. Publishing freezes
+the draft into a ``SurveyVersion`` whose ``document`` records every
+question, option and rule exactly as respondents will see them::
+
+    {"questions": [{"id": 12, "text": "...", "question_type": "radio",
+                    "is_required": true, "help_text": "", "order": 1024,
+                    "options": [{"id": 40, "text": "Yes", "order": 1024}],
+                    "show_if": [[11, "equals", "38"]]}]}
+
+and makes it the survey's ``published_version``. Every Response is pinned to
+the version it answered, so anything derived from a version (the compiled
+form schema, results, exports, page validators) can be keyed by it and kept
+indefinitely: nothing that happens to the draft changes a published version.
+
+Ids in the document are those of the draft rows, so answers keep pointing
+at real questions and options. A version holds on to those rows
+(``on_delete=RESTRICT``); they can still be edited in the draft, but not
+deleted while the survey lives.
+"""
+from django.db import transaction
+from django.db.models import Max, Prefetch
+
+from .models import Survey, SurveyVersion, VersionQuestion, VersionOption, Question, Option, DisplayRule
+from .branching import RuleSet
+
+
+def build_document(questions, rules):
+    """
+    The version document for ``questions`` (in display order, options
+    prefetched) and their DisplayRule rows.
+    """
+    show_if = {}
+    for rule in rules:
+        # Same encoding as DisplayRule.expected; migration 0011 has a copy.
+        expected = str(rule.option_id) if rule.option_id else rule.value
+        show_if.setdefault(rule.question_id, []).append([rule.source_id, rule.operator, expected])
+
+    return {
+        'questions': [
+            {
+                'id': question.id,
+                'text': question.text,
+                'question_type': question.question_type,
+                'is_required': question.is_required,
+                'help_text': question.help_text,
+                'order': question.order,
+                'options': [
+                    {'id': option.id, 'text': option.text, 'order': option.order}
+                    for option in question.options.all()
+                ],
+                'show_if': show_if.get(question.id, []),
+            }
+            for question in questions
+        ],
+    }
+
+
+def draft_document(survey):
+    """The document publishing ``survey`` now would produce; two queries"""
+    return build_document(
+        survey.questions.prefetch_related('options'),
+        DisplayRule.objects.filter(question__survey=survey).order_by('id'),
+    )
+
+
+def publish(survey, published_by=None):
+    """
+    Freeze the survey's draft into a new version and serve it to respondents.
+    Returns the published version; an unchanged draft keeps the current one.
+    """
+    with transaction.atomic():
+        # Serialises publishers of the same survey so version numbers stay unique.
+        # of=('self',): PostgreSQL cannot lock the nullable side of the version join.
+        locked = Survey.all_objects.select_for_update(of=('self',)).select_related('published_version').get(pk=survey.pk)
+        document = draft_document(survey)
+        current = locked.published_version
+        if current is not None and current.document == document:
+            return current
+
+        number = (locked.versions.aggregate(last=Max('number'))['last'] or 0) + 1
+        version = SurveyVersion.objects.create(
+            survey=locked, number=number, published_by=published_by, document=document,
+        )
+        VersionQuestion.objects.bulk_create([
+            VersionQuestion(version=version, question_id=question['id'])
+            for question in document['questions']
+        ])
+        VersionOption.objects.bulk_create([
+            VersionOption(version=version, option_id=option['id'])
+            for question in document['questions']
+            for option in question['options']
+        ])
+        # An update, so updated_at keeps tracking edits to the survey itself.
+        Survey.all_objects.filter(pk=survey.pk).update(published_version=version)
+
+    survey.published_version = version
+    return version
+
+
+def draft_questions(survey):
+    """The survey's draft questions, with their options in ``option_list``; two queries"""
+    return list(survey.questions.prefetch_related(Prefetch('options', to_attr='option_list')))
+
+
+def version_questions(version):
+    """
+    The questions of ``version`` as unsaved Question objects with their
+    options in ``option_list``, as ``draft_questions`` returns the draft,
+    so code written for either (form fields, results, exports) reads them
+    the same way; a version's take no queries.
+    """
+    questions = []
+    for data in version.document['questions']:
+        question = Question(
+            id=data['id'], survey_id=version.survey_id, text=data['text'],
+            question_type=data['question_type'], is_required=data['is_required'],
+            help_text=data['help_text'], order=data['order'],
+        )
+        question.option_list = [
+            Option(id=option['id'], question_id=question.id, text=option['text'], order=option['order'])
+            for option in data['options']
+        ]
+        questions.append(question)
+    return questions
+
+
+def version_rules(version):
+    """The compiled RuleSet of ``version``"""
+    questions = version.document['questions']
+    return RuleSet(
+        [question['id'] for question in questions],
+        {
+            question['id']: [tuple(rule) for rule in question['show_if']]
+            for question in questions
+            if question['show_if']
+        },
+    )
+
+
+def published_questions(survey):
+    """The questions respondents currently get; empty if ``survey`` was never published"""
+    return version_questions(survey.published_version) if survey.published_version_id else []
+
+
+def get_version(survey, number=None):
+    """Version ``number`` of ``survey``, or the published one; None if there is no such version"""
+    if number is None:
+        return survey.published_version if survey.published_version_id else None
+    return SurveyVersion.objects.filter(survey=survey, number=number).first()
@@ -1,27 +1,47 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.db import transaction
+from django.db.models import Max, Q
 from django.core.exceptions import ValidationError
 from django.conf import settings
-import logging 
-from .models import Survey, Question, Response, Answer, Option
+from asgiref.sync import sync_to_async
+import asyncio
+import json
+from .models import Survey, Question, Response, Answer, Option, DisplayRule, ResultsSnapshot, Job
+from .ingest import client_ip, get_schema
 from .forms import (
     SurveyResponseForm,
     SurveyCreationForm,
     QuestionCreationForm,
-    OptionCreationForm
+    OptionCreationForm,
+    SurveyImportForm,
+    SegmentForm
 )
+from .caching import conditional_survey_page, survey_list_state, survey_results_state, survey_state
+from .live import catch_up_delta, get_broker, sse_event
+from .ordering import ORDER_GAP, insert_at, move
+from .results import compute_results
+from .sampling import approximate_results, large_survey_reservoir, request_exact_results
+from .timing import allow, make_token, new_visit, parse_beacon, read_token, record, timing_stats
+from .transfer import load_document, dump_document, import_survey, export_survey
+from .versions import draft_questions, get_version, publish, version_questions
 
 
-logging.warning(f"🚀 ALLOWED_HOSTS = {settings.ALLOWED_HOSTS}")
-
+def _version_number(request):
+    """The ``?version=`` asked for, or None for the published version"""
+    value = request.GET.get('version', '')
+    return int(value) if value.isdecimal() else None
 
 
+@conditional_survey_page(survey_list_state, public=True)
 def survey_list(request):
     """Display list of active surveys"""
-    surveys = Survey.objects.all()
+    surveys = Survey.objects.filter(published_version__isnull=False).with_counts()
     return render(request, 'surveys/survey_list.html', {'surveys': surveys})
 
 
@@ -31,8 +51,10 @@ def my_surveys(request):
     return render(request, "surveys/my_surveys.html", {"surveys": surveys})
 
 
+@conditional_survey_page(survey_state)
 def survey_detail(request, survey_id):
-    survey = get_object_or_404(Survey, id=survey_id, is_active=True)
+    survey = get_object_or_404(Survey, id=survey_id, is_active=True, published_version__isnull=False)
+    timing_token = None
     
     if request.method == 'POST':
         form = SurveyResponseForm(survey, request.POST)
@@ -42,15 +64,53 @@ def survey_detail(request, survey_id):
             return redirect('surveys:survey_success')
         else:
             messages.error(request, 'Please correct the errors below.')
+            # Keep timing from when the form was first opened.
+            if read_token(request.POST.get('timing'), survey.id):
+                timing_token = request.POST['timing']
     else:
         form = SurveyResponseForm(survey)
     
     return render(request, 'surveys/survey_details.html', {
         'survey': survey,
-        'form': form
+        'form': form,
+        'timing_token': timing_token or make_token(survey.id),
     })
 
 
+@csrf_exempt  # sent with navigator.sendBeacon; the signed timing token stands in for the CSRF token
+@require_POST
+def survey_beacon(request, survey_id):
+    """
+    Timing events from the survey page (see timing.py). A ``view`` event is
+    answered with a fresh timing token for the rest of the visit, since the
+    page itself may have been served from a cache; anything else gets 204,
+    or 429 once the visit or client has sent too many events.
+    """
+    survey = get_object_or_404(Survey, id=survey_id, is_active=True, published_version__isnull=False)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+
+    # Events are checked against, and counted for, the published version.
+    schema = get_schema(survey)
+    visit, events = parse_beacon(payload, survey.id, {spec.id for spec in schema.questions}, schema.version_id)
+    if visit is None:
+        return JsonResponse({'error': 'Missing or expired timing token.'}, status=400)
+    if not allow(visit, client_ip(request), len(events)):
+        return JsonResponse({'error': 'Too many timing events.'}, status=429)
+
+    if any(event.kind == 'view' for event in events):
+        visit = new_visit()
+        for event in events:
+            event.visit = visit
+        record(events)
+        return JsonResponse({'token': make_token(survey.id, visit)})
+
+    record(events)
+    return HttpResponse(status=204)
+
+
 def survey_success(request):
     return render(request, 'surveys/survey_success.html')
 
@@ -59,51 +119,135 @@ def survey_create_success(request):
     return render(request,'surveys/create_success.html')
 
 
+@conditional_survey_page(survey_results_state)
 def survey_results(request, survey_id):
-    survey = get_object_or_404(Survey, id=survey_id)
-
-    questions_with_results = []
-    for question in survey.questions.all():
-        answers_qs = Answer.objects.filter(question=question)
-        total_responses = answers_qs.count()
-
-        result_data = {}
-
-        # Handle based on question type
-        if question.question_type in ["radio", "checkbox"]:
-            options_data = []
-            for option in question.options.all():
-                count = answers_qs.filter(selected_options=option).count()
-                percentage = (count / total_responses * 100) if total_responses > 0 else 0
-                options_data.append({
-                    "option": option.text,
-                    "count": count,
-                    "percentage": round(percentage, 2),
-                })
-            result_data = {"options": options_data}
-
-        elif question.question_type in ["number", "rating"]:
-            numeric_answers = [a.numeric_answer for a in answers_qs if a.numeric_answer is not None]
-            avg = sum(numeric_answers) / len(numeric_answers) if numeric_answers else None
-            result_data = {"average": avg, "answers": numeric_answers}
-
-        else:  # text, textarea, email
-            text_answers = [a.text_answer for a in answers_qs if a.text_answer]
-            result_data = {"answers": text_answers}
-
-        questions_with_results.append({
-            "question": question.text,
-            "type": question.question_type,
-            "total": total_responses,
-            "results": result_data,
-        })
-
+    survey = get_object_or_404(Survey.objects.select_related('published_version'), id=survey_id)
+    # Results are per published version: each version's questions as its
+    # respondents saw them. Surveys never published report on their draft.
+    number = _version_number(request)
+    version = get_version(survey, number)
+    if version is None and number is not None:
+        raise Http404("No such version.")
+    segment_form = SegmentForm(survey, request.GET or None, version=version)
+    segment = segment_form.segment()
     context = {
         "survey": survey,
-        "questions_with_results": questions_with_results,
+        "version": version,
+        "versions": survey.versions.values('number', 'published_at'),
+        "segment_form": segment_form,
+        "segment": segment,
+        "live_results": getattr(settings, 'SURVEYS_LIVE_RESULTS', False),
     }
+    if context["live_results"] and version is not None and version.id == survey.published_version_id:
+        # Read before the figures: the stream catches up from here, so a
+        # batch committed while they are computed is counted twice rather
+        # than missed.
+        context["live_since"] = survey.responses.aggregate(last=Max('id'))['last'] or 0
+
+    reservoir = large_survey_reservoir(survey)
+    if reservoir is None:
+        pinned = survey.responses.filter(version=version) if version else survey.responses.all()
+        responses = segment.responses(survey) if segment else None
+        context["questions_with_results"] = compute_results(survey, responses=responses, version=version)
+        context["response_total"] = pinned.filter(id__in=responses).count() if segment else pinned.count()
+        context["timing"] = timing_stats(survey, version_questions(version) if version else [], version)
+    else:
+        # Too many responses to aggregate per page view: estimate from the
+        # sample unless exact results were asked for and are ready.
+        snapshot = ResultsSnapshot.objects.filter(survey=survey).first()
+        context["snapshot"] = snapshot
+        if (request.GET.get("exact") and not segment and snapshot and snapshot.status == "ready"
+                and snapshot.version_id == getattr(version, 'id', None)):
+            context["questions_with_results"] = snapshot.results
+            context["response_total"] = snapshot.response_count
+            context["exact"] = True
+        else:
+            approximate = approximate_results(survey, reservoir, segment, version)
+            context["questions_with_results"] = approximate["questions"]
+            context["response_total"] = approximate["population"]
+            context["approximate"] = approximate
+
     return render(request, "surveys/survey_results.html", context)
 
+
+@login_required
+def survey_results_exact(request, survey_id):
+    """
+    POST queues an exact computation of a large survey's results; GET reports
+    its status so the results page can swap the exact figures in. Only the
+    survey's owner may do either: the computation is expensive.
+    """
+    survey = get_object_or_404(Survey, id=survey_id, created_by=request.user)
+    if request.method == 'POST':
+        request_exact_results(survey, request.user)
+        return redirect(f"{reverse('surveys:survey_results', args=[survey.id])}?exact=1")
+
+    snapshot = ResultsSnapshot.objects.filter(survey=survey).first()
+    if snapshot is None:
+        return JsonResponse({'status': 'missing'}, status=404)
+    return JsonResponse({
+        'status': snapshot.status,
+        'computed_at': snapshot.computed_at,
+        'response_count': snapshot.response_count,
+    })
+
+
+async def survey_results_stream(request, survey_id):
+    """
+    Server-sent events stream of a survey's results: a ``delta`` event per
+    committed batch of responses, to be added to the figures the results
+    page was rendered with, and ``resync`` when the watcher fell too far
+    behind and should reload them. ``since`` is the newest response the page
+    counted; responses committed after it are sent first, as one delta. Only
+    served when ``SURVEYS_LIVE_RESULTS`` says the site runs under ASGI.
+    """
+    if not getattr(settings, 'SURVEYS_LIVE_RESULTS', False):
+        raise Http404("Live results are not enabled.")
+    survey = await Survey.objects.filter(id=survey_id).only('published_version_id').afirst()
+    if survey is None:
+        raise Http404("No Survey matches the given query.")
+    since = request.GET.get('since', '')
+    # Subscribe before catching up, so nothing committed in between is lost.
+    subscription = get_broker().subscribe(survey_id)
+    backlog, covered = None, set()
+    if since.isdecimal():
+        try:
+            caught_up = await sync_to_async(catch_up_delta)(survey_id, survey.published_version_id, int(since))
+        except BaseException:
+            subscription.close()
+            raise
+        backlog, covered = caught_up or ({'resync': True}, set())
+    keepalive = getattr(settings, 'SURVEYS_LIVE_KEEPALIVE', 15)
+
+    async def events():
+        try:
+            if backlog is not None:
+                if backlog.get('resync'):
+                    yield sse_event('resync', {})
+                    return
+                if backlog['responses']:
+                    yield sse_event('delta', backlog)
+            while True:
+                try:
+                    delta = await subscription.get(timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if delta.get('resync'):
+                    yield sse_event('resync', {})
+                    return
+                if delta.get('first_id') in covered:
+                    continue  # already part of the catch-up
+                yield sse_event('delta', delta)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+
 def survey_create(request):
     if request.method == 'POST':
         form = SurveyCreationForm(request.POST)
@@ -120,7 +264,7 @@ def survey_create(request):
 
 
 def add_questions(request, survey_id):
-    survey = get_object_or_404(Survey, id=survey_id)
+    survey = get_object_or_404(Survey.objects.select_related('published_version'), id=survey_id)
 
     if request.method == 'POST':
         question_form = QuestionCreationForm(request.POST)
@@ -130,6 +274,7 @@ def add_questions(request, survey_id):
                 with transaction.atomic():
                     question = question_form.save(commit=False)
                     question.survey = survey
+                    insert_at(question, question_form.cleaned_data.get('order'))
                     question.save()
 
                     if question.question_type in ['radio', 'checkbox']:
@@ -137,13 +282,11 @@ def add_questions(request, survey_id):
                         if not options_text or all(not text.strip() for text in options_text):
                             raise ValidationError("Choice questions must have at least one option.")
                         
-                        for order, text in enumerate(options_text, 1):
-                            if text.strip():  # avoid empty option fields
-                                Option.objects.create(
-                                    question=question,
-                                    text=text.strip(),
-                                    order=order
-                                )
+                        Option.objects.bulk_create([
+                            Option(question=question, text=text.strip(), order=position * ORDER_GAP)
+                            for position, text in enumerate(options_text, 1)
+                            if text.strip()  # avoid empty option fields
+                        ])
 
                 messages.success(request, "Question added successfully!")
                 return redirect('surveys:add_questions', survey_id=survey.id)
@@ -157,10 +300,136 @@ def add_questions(request, survey_id):
     else:
         question_form = QuestionCreationForm()
 
-    questions = survey.questions.prefetch_related('options').all()
+    questions = draft_questions(survey)
 
     return render(request, 'surveys/add_questions.html', {
         'survey': survey,
         'form': question_form,
         'questions': questions,
     })
+
+
+@login_required
+@require_POST
+def survey_publish(request, survey_id):
+    """Publish the survey's draft questions as the version respondents get from now on"""
+    survey = get_object_or_404(Survey, id=survey_id, created_by=request.user)
+    previous = survey.published_version_id
+    version = publish(survey, request.user)
+    if version.id == previous:
+        messages.info(request, f"Nothing has changed since version {version.number} was published.")
+    else:
+        messages.success(request, f"Published version {version.number}.")
+    return redirect('surveys:create_success')
+
+
+@login_required
+def survey_import(request):
+    if request.method == 'POST':
+        form = SurveyImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                data = load_document(form.cleaned_data['document'], form.cleaned_data['format'])
+                survey = import_survey(data, request.user)
+            except ValidationError as e:
+                for message in e.messages:
+                    messages.error(request, message)
+            else:
+                messages.success(request, f"Imported {survey.questions.count()} questions.")
+                return redirect('surveys:add_questions', survey_id=survey.id)
+    else:
+        form = SurveyImportForm()
+
+    return render(request, 'surveys/import_survey.html', {'form': form})
+
+
+@login_required
+def survey_export(request, survey_id):
+    survey = get_object_or_404(Survey, id=survey_id, created_by=request.user)
+    fmt = request.GET.get('format', 'json')
+    # The draft by default; ``?version=`` exports a published version.
+    number = _version_number(request)
+    version = get_object_or_404(survey.versions, number=number) if number is not None else None
+    try:
+        document = dump_document(export_survey(survey, version), fmt)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages}, status=400)
+
+    content_type = 'application/yaml' if fmt == 'yaml' else 'application/json'
+    response = HttpResponse(document, content_type=f'{content_type}; charset=utf-8')
+    name = f"survey-{survey.id}-v{version.number}" if version else f"survey-{survey.id}"
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _breaks_display_rules(question, after):
+    """
+    Whether placing ``question`` directly after ``after`` (or first) would
+    put it at or above a question one of its rules depends on, or put a
+    question depending on it at or above it.
+    """
+    limit = after.order if after is not None else None
+    rules = DisplayRule.objects.filter(Q(question=question) | Q(source=question)).select_related('question', 'source')
+    for rule in rules:
+        if rule.question_id == question.id:
+            if limit is None or rule.source.order > limit:
+                return True
+        elif limit is not None and rule.question.order <= limit:
+            return True
+    return False
+
+
+@login_required
+@require_POST
+def survey_reorder(request, survey_id):
+    """
+    Move a question or option: ``{"question": id, "after": id | null}`` or
+    ``{"option": id, "after": id | null}``. ``after`` is the sibling the item
+    should follow; null moves it to the top.
+    """
+    survey = get_object_or_404(Survey, id=survey_id, created_by=request.user)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Give a question or option id.'}, status=400)
+
+    if 'question' in payload:
+        siblings = Question.objects.filter(survey=survey)
+        item_id = payload['question']
+    elif 'option' in payload:
+        siblings = Option.objects.filter(question__survey=survey)
+        item_id = payload['option']
+    else:
+        return JsonResponse({'error': 'Give a question or option id.'}, status=400)
+    after_id = payload.get('after')
+    if not _is_id(item_id) or not (after_id is None or _is_id(after_id)):
+        return JsonResponse({'error': 'Ids must be integers.'}, status=400)
+
+    item = get_object_or_404(siblings, id=item_id)
+    after = None
+    if after_id is not None:
+        if isinstance(item, Option):
+            siblings = siblings.filter(question_id=item.question_id)
+        after = get_object_or_404(siblings.exclude(id=item.id), id=after_id)
+
+    if isinstance(item, Question) and _breaks_display_rules(item, after):
+        return JsonResponse(
+            {'error': 'A question must stay below the questions its display rules depend on.'}, status=400
+        )
+
+    rebalanced = move(item, after)
+    return JsonResponse({'id': item.id, 'order': item.order, 'rebalanced': rebalanced})
+
+
+@login_required
+def job_status(request, job_id):
+    """Status and progress of a background job started by the current user"""
+    jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(created_by=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    return JsonResponse(job.as_dict())
@@ -0,0 +1,24 @@
+"""
+Entry points for jobs run in a process pool by ``run_jobs --processes``.
+
+Pool children are spawned and unpickle these functions before Django is
+set up, so this module must not import models at import time.
+"""
+
+
+def init_process():
+    import django
+    django.setup()
+
+    from .jobs import autodiscover
+    autodiscover()
+
+
+def run_in_process(job_id):
+    from django.db import connections
+    from .jobs import run_job
+
+    try:
+        return run_job(job_id)
+    finally:
+        connections.close_all()
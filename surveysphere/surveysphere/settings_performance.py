@@ -0,0 +1,27 @@
+"""
+Settings profile for high-concurrency public traffic.
+
+Select it with ``DJANGO_SETTINGS_MODULE=surveysphere.settings_performance``.
+Everything not overridden here comes from ``settings.py``.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# Sessions and flash messages live in signed cookies, so anonymous
+# respondents never cause a django_session INSERT/UPDATE. Session data is
+# signed, not encrypted: keep it to ids and flags.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+SESSION_COOKIE_HTTPONLY = True
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Reuse database connections across requests instead of reconnecting for
+# each one, and check them before reuse so a dropped connection is
+# replaced rather than failing the request. A connection pool
+# (DB_POOL_MAX_SIZE) already does both and cannot be combined with this.
+if 'pool' not in DATABASES['default'].get('OPTIONS', {}):
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Resolve the URLconf and compile the main templates in AppConfig.ready
+# rather than on each worker's first request.
+SURVEYS_WARMUP = True
@@ -0,0 +1,14 @@
+"""
+Settings for ``manage.py test``: the project settings, with static files
+served under their plain names since test runs have no collectstatic
+manifest.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import STORAGES
+
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
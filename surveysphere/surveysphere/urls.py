@@ -27,6 +27,7 @@ from django.contrib.auth import views as auth_views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('surveys/', include('surveys.urls')), 
+    path('api/v1/', include('surveys.api_urls')),
      path("accounts/", include("django.contrib.auth.urls")),
      path("", include("users.urls")),
     path('', lambda request: redirect('login')), 
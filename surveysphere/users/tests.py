@@ -1,3 +1,30 @@
 from django.test import TestCase
 
-# Create your tests here.
+from surveys.testing import Budget, Case, QueryBudgetMixin
+
+from . import urls as user_urls
+from .models import CustomUser
+
+
+class UserViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    cases = [
+        Case('signup', Budget(queries=0, ms=100)),
+        Case('dashboard', Budget(queries=6, ms=150), user='owner'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(
+            'owner', 'owner@example.com', 'password', first_name='Ada', last_name='Owner'
+        )
+        cls.add_surveys(cls.owner, 2)
+
+    def grow(self):
+        # More surveys than fit on one dashboard page.
+        self.add_surveys(self.owner, 30, responses=5)
+
+    def test_every_url_has_a_budget(self):
+        budgeted = {case.url_name for case in self.cases}
+        for pattern in user_urls.urlpatterns:
+            with self.subTest(pattern.name):
+                self.assertIn(pattern.name, budgeted, f"Declare a query budget for {pattern.name}")
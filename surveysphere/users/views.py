@@ -4,7 +4,9 @@ from django.contrib.auth import login
 from django.contrib import messages
 from django.shortcuts import redirect
 from .forms import CustomUserCreationForm
-from surveys.models import Survey
+from django.core.paginator import Paginator
+from django.utils import timezone
+from surveys.models import Survey, OwnerStats, OwnerHourlyResponses
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
 
@@ -59,8 +61,21 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = "surveys/dashboard.html"
     login_url = "login"
 
+    paginate_by = 24
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        user = self.request.user
         context["title"] = "Dashboard"
-        context["surveys"] = Survey.objects.all()  # pass all surveys to dashboard
+
+        # Totals come from the precomputed stats row; only the first visit of
+        # an owner without one pays for building it.
+        stats = OwnerStats.objects.filter(owner=user).first() or OwnerStats.rebuild(user.pk)
+        context["stats"] = stats
+        context["responses_last_24h"] = OwnerHourlyResponses.recent_total(user.pk, timezone.now())
+
+        surveys = Survey.objects.filter(created_by=user).with_counts()
+        page = Paginator(surveys, self.paginate_by).get_page(self.request.GET.get("page"))
+        context["page_obj"] = page
+        context["surveys"] = page.object_list
         return context